@@ -0,0 +1,197 @@
+"""
+Offline Gemini Batch API mode for large thumbnail campaigns
+Packs many thumbnail jobs into one batch job, polls it and writes each result to its
+job's output path. Batch jobs trade latency (up to 24h) for higher rate limits and cost
+"""
+
+import base64
+import json
+import os
+import time
+
+from gemini_rest import download_file, request_json, to_rest_request, upload_file
+from image_io import save_image_bytes
+from job_runner import iter_jobs, job_id
+from metrics import current_run_id
+import output_archive
+import postprocess
+
+# Inline batch requests are capped at 20 MB; larger campaigns go through an uploaded JSONL file
+INLINE_LIMIT_BYTES = 20 * 1024 * 1024
+
+TERMINAL_STATES = {'BATCH_STATE_SUCCEEDED', 'BATCH_STATE_FAILED', 'BATCH_STATE_CANCELLED', 'BATCH_STATE_EXPIRED'}
+
+
+def submit_batch(keyed_requests, model, display_name):
+    """
+    Create a batch job from [(key, request_body), ...].
+
+    Returns:
+        The batch resource name (e.g. "batches/abc123")
+    """
+    lines = [json.dumps({'key': key, 'request': body}) for key, body in keyed_requests]
+    total_bytes = sum(len(line) for line in lines)
+
+    if total_bytes <= INLINE_LIMIT_BYTES:
+        input_config = {'requests': {'requests': [
+            {'request': body, 'metadata': {'key': key}} for key, body in keyed_requests
+        ]}}
+    else:
+        uploaded = upload_file(('\n'.join(lines) + '\n').encode('utf-8'), 'application/jsonl',
+                               display_name=f"{display_name}-input")
+        input_config = {'file_name': uploaded['name']}
+
+    operation = request_json('POST', f"models/{model}:batchGenerateContent", {
+        'batch': {'display_name': display_name, 'input_config': input_config},
+    })
+    return operation['name']
+
+
+def batch_state(batch):
+    return (batch.get('metadata') or {}).get('state') or batch.get('state') or 'BATCH_STATE_UNSPECIFIED'
+
+
+def wait_for_batch(name, poll_interval=30, timeout=None):
+    """
+    Poll a batch job until it reaches a terminal state and return the batch resource.
+    """
+    start = time.monotonic()
+    while True:
+        batch = request_json('GET', name)
+        state = batch_state(batch)
+        if state in TERMINAL_STATES:
+            return batch
+        if timeout is not None and time.monotonic() - start > timeout:
+            raise TimeoutError(f"Batch {name} still {state} after {timeout}s")
+        print(f"   ⏳ {name}: {state} ({time.monotonic() - start:.0f}s elapsed)")
+        time.sleep(poll_interval)
+
+
+def iter_batch_responses(batch):
+    """
+    Yield (key, response, error) for every request in a finished batch, whether the
+    results were returned inline or as a responses file.
+    """
+    result = batch.get('response') or batch.get('dest') or {}
+    inlined = result.get('inlinedResponses')
+    if isinstance(inlined, dict):
+        inlined = inlined.get('inlinedResponses')
+
+    if inlined is not None:
+        for item in inlined:
+            key = (item.get('metadata') or {}).get('key')
+            yield key, item.get('response'), item.get('error')
+    elif result.get('responsesFile'):
+        for line in download_file(result['responsesFile']).decode('utf-8').splitlines():
+            if line.strip():
+                item = json.loads(line)
+                yield item.get('key'), item.get('response'), item.get('error')
+
+
+def response_image(response):
+    """
+    Return (mime_type, bytes) of the last non-thought image in a REST response, or None.
+    """
+    found = None
+    for candidate in (response or {}).get('candidates', []):
+        for part in (candidate.get('content') or {}).get('parts', []):
+            blob = part.get('inlineData') or part.get('inline_data')
+            if blob and not part.get('thought'):
+                found = (blob.get('mimeType') or blob.get('mime_type'), base64.b64decode(blob['data']))
+    return found
+
+
+def submit_jobs(jobs_path, build_parts, model, state_path=None):
+    """
+    Build a request for every job in a JSONL job file and submit them as one batch.
+
+    Args:
+        jobs_path: JSONL job file (same format as --jobs)
+        build_parts: Callable(job) returning the job's content parts
+        model: Model name
+        state_path: Where to record the batch name, output paths and job settings
+                    (default: <jobs_path>.batch.json), read later by collect_jobs
+
+    Returns:
+        state_path
+    """
+    state_path = state_path or f"{os.path.splitext(jobs_path)[0]}.batch.json"
+    keyed_requests = []
+    outputs = {}
+    settings = {}
+
+    for _, job in iter_jobs(jobs_path):
+        key = job_id(job)
+        if key in outputs:
+            continue
+        outputs[key] = job.get('output') or f"thumbnail_{key}.png"
+        parts = build_parts(job)
+        aspect_ratio, resolution = job.get('aspect_ratio', '16:9'), job.get('resolution', '4K')
+        keyed_requests.append((key, to_rest_request(parts, aspect_ratio, resolution)))
+        # Kept for the output archive, which collect_jobs fills in once the images arrive
+        references = job.get('references')
+        settings[key] = {
+            'prompt': job['prompt'], 'final_prompt': parts[0] if parts and isinstance(parts[0], str) else None,
+            'references': references if isinstance(references, list) else None,
+            'style': job.get('style'), 'logos': job.get('logos'),
+            'aspect_ratio': aspect_ratio, 'resolution': resolution,
+        }
+
+    print(f"\n📦 Submitting {len(keyed_requests)} job(s) as one batch ({model})...")
+    name = submit_batch(keyed_requests, model, display_name=os.path.basename(jobs_path))
+
+    with open(state_path, 'w') as f:
+        json.dump({'batch': name, 'model': model, 'jobs_path': jobs_path,
+                   'submitted_at': time.time(), 'outputs': outputs, 'settings': settings}, f, indent=2)
+
+    print(f"✅ Submitted {name}")
+    print(f"   Collect results later with: --collect-batch {state_path}")
+    return state_path
+
+
+def collect_jobs(state_path, poll_interval=30, timeout=None):
+    """
+    Wait for the batch recorded in state_path, write every returned image to the output
+    path of its job and record it in the output archive.
+
+    Returns:
+        (saved, failed) counts
+    """
+    with open(state_path) as f:
+        state = json.load(f)
+    outputs = state['outputs']
+
+    print(f"\n📦 Collecting {state['batch']} ({len(outputs)} job(s))...")
+    batch = wait_for_batch(state['batch'], poll_interval=poll_interval, timeout=timeout)
+    if batch_state(batch) != 'BATCH_STATE_SUCCEEDED':
+        print(f"❌ Batch finished as {batch_state(batch)}")
+        return 0, len(outputs)
+
+    saved = failed = 0
+    seen = set()
+    ordered_keys = list(outputs)
+    for index, (key, response, error) in enumerate(iter_batch_responses(batch)):
+        key = key or (ordered_keys[index] if index < len(ordered_keys) else None)
+        seen.add(key)
+        output_path = outputs.get(key)
+        image = response_image(response) if not error else None
+        if output_path is None or image is None:
+            print(f"   ✗ [{key}] {error or 'no image returned'}")
+            failed += 1
+            continue
+
+        save_image_bytes(image[1], output_path, image[0])
+        # State files written before settings were recorded still archive the image and its job id
+        output_archive.record(
+            image[1], image[0], output_path, script='thumbnail-generator', run_id=current_run_id(),
+            model=state['model'], variant=f"batch:{key}", **state.get('settings', {}).get(key, {}))
+        postprocess.submit(output_path)
+        print(f"   ✓ [{key}] {output_path}")
+        saved += 1
+
+    for key in outputs.keys() - seen:
+        print(f"   ✗ [{key}] missing from batch results")
+        failed += 1
+
+    print(f"\n📦 Batch collected: {saved} saved, {failed} failed")
+    return saved, failed
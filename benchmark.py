@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark against the local fake Gemini server
+Drives generate_thumbnail/generate_batch, image-to-image generate_image and text-to-image
+main across batch sizes, concurrency levels and reference counts, each scenario in a
+fresh process with cold caches. Reports requests/sec, p50/p95/p99 latency, peak RSS and
+bytes uploaded, and appends the results to a JSONL file so versions can be compared:
+
+  python benchmark.py --batch 1,4,8 --concurrency 1,4 --references 5,9,14 --latency lognormal:2:0.4
+  python benchmark.py --compare
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
+
+import fake_gemini_server
+from image_io import CACHE_DIR
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RESULTS = os.path.join(REPO_DIR, 'benchmark_results.jsonl')
+REFERENCE_DIR = os.path.join(CACHE_DIR, 'benchmark')
+SCRIPTS = ('thumbnail', 'image', 'text')
+PROMPT = 'shocked expression pointing at a glowing laptop, bold red background'
+
+# Relative change that counts as a regression in --compare
+DEFAULT_THRESHOLD = 0.10
+
+
+def parse_list(spec, cast=int):
+    return [cast(item) for item in str(spec).split(',') if item.strip()]
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile (None for an empty list).
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def make_references(count, size):
+    """
+    Create (once) count synthetic phone-sized JPEG reference photos and return their paths.
+    Noise barely compresses, so these cost as much to preprocess and upload as real photos.
+    """
+    from PIL import Image
+
+    width, height = size
+    directory = os.path.join(REFERENCE_DIR, f"references_{width}x{height}")
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for index in range(count):
+        path = os.path.join(directory, f"ref_{index + 1:02d}.jpg")
+        if not os.path.exists(path):
+            channels = [Image.effect_noise((width, height), 48 + 8 * c + index) for c in range(3)]
+            Image.merge('RGB', channels).save(path, format='JPEG', quality=92)
+        paths.append(path)
+    return paths
+
+
+def load_script(name):
+    """
+    Import one of the hyphenated CLI scripts as a module.
+    """
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), os.path.join(REPO_DIR, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_calls(count, concurrency, call):
+    """
+    Run call(index) count times with at most concurrency in flight; errors (including the
+    scripts' sys.exit) are counted rather than raised.
+    """
+    def guarded(index):
+        try:
+            call(index)
+            return True
+        except BaseException:
+            return False
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, count))) as executor:
+        return sum(not ok for ok in executor.map(guarded, range(count)))
+
+
+def run_scenario(scenario):
+    """
+    Worker-process side: run one scenario against the server in $GEMINI_API_ENDPOINT and
+    return its measurements.
+    """
+    import metrics
+    import output_archive
+    import result_cache
+    from gemini_client import configure_executor
+
+    output_dir = scenario['output_dir']
+    metrics_path = os.path.join(output_dir, 'metrics.jsonl')
+    metrics.configure(metrics_path, run_id=scenario['run_id'])
+    result_cache.configure('off')
+    output_archive.configure(enabled=False)
+    configure_executor(max_attempts=scenario['retries'] + 1)
+    references = scenario['reference_paths']
+    batch, concurrency, resolution = scenario['batch'], scenario['concurrency'], scenario['resolution']
+
+    start = time.perf_counter()
+    failures = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        if scenario['script'] == 'thumbnail':
+            generator = load_script('thumbnail-generator')
+            output = os.path.join(output_dir, 'thumb.png')
+            if batch == 1:
+                failures = int(not generator.generate_thumbnail(PROMPT, references, output_path=output,
+                                                                resolution=resolution))
+            else:
+                args = Namespace(prompt=PROMPT, references=references, style=None, logos=None, output=output,
+                                 aspect_ratio='16:9', resolution=resolution, batch=batch,
+                                 concurrency=concurrency, upload_references=False,
+                                 composite_logos=False, dedup=False, dedup_threshold=10, max_duplicates=None,
+                                 rank=None)
+                failures = sum(path is None for path in generator.generate_batch(args))
+
+        elif scenario['script'] == 'image':
+            image_to_image = load_script('image-to-image')
+            specs, sources = image_to_image.validate_images([(path, None) for path in references])
+            failures = run_calls(batch, concurrency, lambda index: image_to_image.generate_image(
+                specs, f"{PROMPT} #{index}", 'gemini-3-pro-image-preview',
+                os.path.join(output_dir, f"image_{index}.png"), '16:9', resolution, sources=sources))
+
+        else:
+            text_to_image = load_script('text-to-image')
+            # main() parses sys.argv; every call shares the same arguments
+            sys.argv = ['text-to-image.py', PROMPT, '-o', os.path.join(output_dir, 'text.png'),
+                        '--no-cache', '--no-archive', '--metrics', metrics_path, '--run-id', scenario['run_id']]
+            failures = run_calls(batch, concurrency, lambda index: text_to_image.main())
+    elapsed = time.perf_counter() - start
+
+    records = []
+    if os.path.exists(metrics_path):
+        with open(metrics_path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    latencies = [r['total_seconds'] for r in records]
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss *= 1 if sys.platform == 'darwin' else 1024
+
+    return {
+        'seconds': round(elapsed, 4),
+        'requests': len(records),
+        'failures': failures,
+        'requests_per_second': round(len(records) / elapsed, 4) if elapsed else None,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'retries': sum(r['retries'] for r in records),
+        'request_bytes': sum(r['request_bytes'] for r in records),
+        'peak_rss_bytes': peak_rss,
+    }
+
+
+def scenarios(args):
+    for script in args.scripts:
+        for batch in args.batch:
+            for concurrency in args.concurrency:
+                if batch == 1 and concurrency > min(args.concurrency):
+                    continue
+                # text-to-image sends no images; image-to-image takes at most 14
+                for references in ([0] if script == 'text' else args.references):
+                    yield {'script': script, 'batch': batch, 'concurrency': concurrency, 'references': references}
+
+
+def scenario_key(record):
+    return tuple(record['scenario'][k] for k in ('script', 'batch', 'concurrency', 'references')) + (
+        record['server']['latency'], record['server']['error_rate'], record['server']['image_bytes'],
+        record['resolution'])
+
+
+def run_benchmark(args):
+    server, state = fake_gemini_server.serve(port=0, latency=args.latency, error_rate=args.error_rate,
+                                             image_bytes=args.image_bytes)
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    reference_paths = make_references(max(args.references), args.reference_size)
+    run_id = uuid.uuid4().hex[:12]
+    version = git_version()
+    server_config = {'latency': args.latency, 'error_rate': args.error_rate, 'image_bytes': args.image_bytes}
+
+    print(f"⏱️  Benchmark run {run_id} ({version}) against {endpoint}")
+    print(f"   latency={args.latency} error_rate={args.error_rate} image_bytes={args.image_bytes} "
+          f"resolution={args.resolution}\n")
+    results = []
+    try:
+        for scenario in scenarios(args):
+            with tempfile.TemporaryDirectory(prefix='thumbnail-bench-') as work_dir:
+                env = dict(os.environ, GEMINI_API_ENDPOINT=endpoint, GEMINI_API_KEY='fake',
+                           THUMBNAIL_CACHE_DIR=os.path.join(work_dir, 'cache'))
+                payload = dict(scenario, run_id=run_id, output_dir=work_dir, resolution=args.resolution,
+                               retries=args.retries, reference_paths=reference_paths[:scenario['references']])
+                bytes_before = state.stats['bytes_received']
+                completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', json.dumps(payload)],
+                                           cwd=REPO_DIR, env=env, capture_output=True, text=True)
+                upload_bytes = state.stats['bytes_received'] - bytes_before
+
+            if completed.returncode != 0:
+                print(f"   ✗ {scenario}: worker failed\n{completed.stderr.strip()}")
+                continue
+            measured = json.loads(completed.stdout.strip().splitlines()[-1])
+            measured['upload_bytes'] = upload_bytes
+            record = {'run_id': run_id, 'version': version, 'timestamp': time.time(), 'resolution': args.resolution,
+                      'server': server_config, 'scenario': scenario, 'results': measured}
+            results.append(record)
+            print(format_result(record))
+    finally:
+        server.shutdown()
+
+    if results:
+        with open(args.results, 'a') as f:
+            for record in results:
+                f.write(json.dumps(record) + '\n')
+        print(f"\n💾 {len(results)} result(s) appended to {args.results}")
+    return results
+
+
+def format_result(record):
+    s, r = record['scenario'], record['results']
+
+    def seconds(value):
+        return f"{value:.2f}s" if value is not None else '-'
+
+    return (f"   {s['script']:<9} batch={s['batch']:<3} conc={s['concurrency']:<3} refs={s['references']:<3}"
+            f"{r['requests_per_second'] or 0:7.2f} req/s | p50 {seconds(r['p50'])} p95 {seconds(r['p95'])} "
+            f"p99 {seconds(r['p99'])} | RSS {r['peak_rss_bytes'] / 2**20:.0f} MB | "
+            f"upload {r['upload_bytes'] / 2**20:.1f} MB | retries {r['retries']} | failed {r['failures']}")
+
+
+def compare(results_path, baseline=None, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare the latest run with the latest run of the baseline version (default: the run
+    before it), flagging scenarios whose throughput, p95 latency, peak RSS or upload bytes
+    got worse by more than threshold.
+
+    Returns:
+        Number of regressions found
+    """
+    with open(results_path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    runs = []
+    for record in records:
+        if not runs or runs[-1][0] != record['run_id']:
+            runs.append((record['run_id'], record['version'], []))
+        runs[-1][2].append(record)
+    if len(runs) < 2 and baseline is None:
+        print("Need at least two benchmark runs to compare")
+        return 0
+
+    current = runs[-1]
+    previous = [run for run in runs[:-1] if baseline is None or run[1] == baseline or run[0] == baseline]
+    if not previous:
+        print(f"No run found for baseline {baseline}")
+        return 0
+    base = previous[-1]
+    base_results = {scenario_key(r): r['results'] for r in base[2]}
+
+    print(f"📊 {current[1]} (run {current[0]}) vs {base[1]} (run {base[0]})\n")
+    # metric, higher is better
+    checks = (('requests_per_second', True), ('p95', False), ('peak_rss_bytes', False), ('upload_bytes', False))
+    regressions = 0
+    for record in current[2]:
+        before = base_results.get(scenario_key(record))
+        s = record['scenario']
+        label = f"{s['script']} batch={s['batch']} conc={s['concurrency']} refs={s['references']}"
+        if before is None:
+            print(f"   {label}: no baseline")
+            continue
+        changes = []
+        for metric, higher_is_better in checks:
+            old, new = before.get(metric), record['results'].get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = ' ⚠️' if worse > threshold else ''
+            regressions += bool(flag)
+            changes.append(f"{metric} {change:+.0%}{flag}")
+        print(f"   {label}: {', '.join(changes)}")
+    print(f"\n{'⚠️' if regressions else '✅'} {regressions} regression(s) above {threshold:.0%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the generation scripts against a local fake Gemini server',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Default matrix with instant responses
+  python benchmark.py
+
+  # Realistic latency and 503s, 8 MB images, 4 requests in flight
+  python benchmark.py --latency lognormal:20:0.3 --error-rate 0.05 --image-bytes 8000000 --concurrency 4
+
+  # Did this branch regress against the last run on main?
+  python benchmark.py --compare
+        """
+    )
+    parser.add_argument('--scripts', default=','.join(SCRIPTS),
+                        help=f'Comma-separated paths to benchmark (default: {",".join(SCRIPTS)})')
+    parser.add_argument('--batch', default='1,4,8',
+                        help='Batch sizes / requests per scenario (default: 1,4,8)')
+    parser.add_argument('--concurrency', default='1,4',
+                        help='Concurrency levels (default: 1,4)')
+    parser.add_argument('--references', default='5,9,14',
+                        help='Reference image counts, 1-14 (default: 5,9,14)')
+    parser.add_argument('--reference-size', default='3024x4032',
+                        help='Pixel size of the synthetic reference photos (default: 3024x4032)')
+    parser.add_argument('--resolution', default='1K', choices=['1K', '2K', '4K'],
+                        help='Requested output resolution (default: 1K)')
+    parser.add_argument('--latency', default='0',
+                        help='Server latency: SECONDS, uniform:LOW:HIGH, normal:MEAN:STDDEV or '
+                             'lognormal:MEDIAN:SIGMA (default: 0)')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of calls the server fails with 503 (default: 0)')
+    parser.add_argument('--image-bytes', type=int, default=None,
+                        help='Size of returned images in bytes (default: small unpadded PNGs)')
+    parser.add_argument('--retries', type=int, default=3,
+                        help='Client retries per request (default: 3)')
+    parser.add_argument('--results', default=DEFAULT_RESULTS,
+                        help='JSONL file the results are appended to (default: benchmark_results.jsonl)')
+    parser.add_argument('--compare', nargs='?', const='', default=None, metavar='BASELINE',
+                        help='Compare the latest run with BASELINE (a version or run id; default: the previous run)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Relative change reported as a regression (default: 0.10)')
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_scenario(json.loads(args.worker))))
+        return
+
+    if args.compare is not None:
+        sys.exit(1 if compare(args.results, args.compare or None, args.threshold) else 0)
+
+    args.scripts = [s.strip() for s in args.scripts.split(',') if s.strip()]
+    unknown = set(args.scripts) - set(SCRIPTS)
+    if unknown:
+        parser.error(f"unknown script(s): {', '.join(sorted(unknown))} (choose from {', '.join(SCRIPTS)})")
+    args.batch = parse_list(args.batch)
+    args.concurrency = parse_list(args.concurrency)
+    args.references = parse_list(args.references)
+    if not all(1 <= n <= 14 for n in args.references):
+        parser.error("--references counts must be between 1 and 14")
+    args.reference_size = tuple(int(x) for x in args.reference_size.lower().split('x'))
+    try:
+        fake_gemini_server.parse_latency(args.latency)
+    except ValueError as e:
+        parser.error(str(e))
+
+    run_benchmark(args)
+
+
+if __name__ == '__main__':
+    main()
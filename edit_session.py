@@ -0,0 +1,193 @@
+"""
+Multi-turn edit sessions
+Keeps one thumbnail's conversation on disk: the opening prompt with its references, then
+every edit and every image the model returned (with its thought signature). A refinement
+adds only the edit text as a new turn. References and returned images are uploaded once
+and sent as Files API handles, so earlier turns cost a few hundred bytes per image
+instead of the images themselves
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+
+from gemini_client import generate_conversation, response_images, wrap_rest_response
+from gemini_rest import to_rest_request
+from image_io import CACHE_DIR, atomic_write
+from reference_cache import load_reference
+from upload_cache import load_uploaded_reference, send_with_fresh_uploads, upload_blob
+
+DEFAULT_SESSION_DIR = os.path.join(CACHE_DIR, 'sessions')
+
+_EXTENSIONS = {'image/png': '.png', 'image/jpeg': '.jpg', 'image/webp': '.webp'}
+
+
+def session_path(name):
+    """
+    Bare names ("launch-video") live in DEFAULT_SESSION_DIR; anything that looks like a path is used as-is.
+    """
+    if name.endswith('.json') or os.sep in name:
+        return name
+    return os.path.join(DEFAULT_SESSION_DIR, f"{name}.json")
+
+
+class EditSession:
+    """
+    A persisted conversation with the image model.
+
+    The first turn is stored as prompt text plus reference paths. Images the model returned
+    are kept as files next to the session, each stored with its thought signature. Both are
+    resolved to uploaded handles when sent, because handles expire and files do not. All
+    other parts are stored in REST form exactly as sent or received.
+    """
+
+    def __init__(self, path, state):
+        self.path = path
+        self.state = state
+        self.lock = threading.Lock()
+        self.pending = None
+
+    @classmethod
+    def create(cls, path, opening_text, image_paths, model, aspect_ratio=None, resolution=None,
+               upload_references=True, **settings):
+        """
+        Start a new session from the final prompt text and the images sent with it. settings
+        (prompt as typed, references, style, logos, output, ...) are kept for the archive.
+        """
+        state = {
+            'created': time.time(),
+            'model': model,
+            'aspect_ratio': aspect_ratio,
+            'resolution': resolution,
+            'upload_references': upload_references,
+            'opening': {'text': opening_text, 'images': list(image_paths)},
+            'turns': [],
+            'outputs': [],
+            'settings': settings,
+        }
+        return cls(path, state)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(path, json.load(f))
+
+    def save(self):
+        atomic_write(self.path, json.dumps(self.state).encode('utf-8'))
+
+    @property
+    def edits(self):
+        """
+        Number of completed edits (the opening generation is not an edit).
+        """
+        return max(0, len(self.state['outputs']) - 1)
+
+    def last_output(self):
+        return self.state['outputs'][-1] if self.state['outputs'] else None
+
+    def opening_content(self):
+        """
+        The first user turn in REST form, with references loaded through the caches.
+        """
+        load_image = load_uploaded_reference if self.state['upload_references'] else load_reference
+        parts = [self.state['opening']['text']]
+        parts.extend(load_image(path) for path in self.state['opening']['images'] if os.path.exists(path))
+        return to_rest_request(parts)['contents'][0]
+
+    def store_image(self, part):
+        """
+        Move a returned inline image out of the conversation: its bytes go to a file beside
+        the session and the part keeps only that path, the MIME type and the thought signature.
+        """
+        blob = part.get('inlineData') or part.get('inline_data')
+        data = base64.b64decode(blob['data'])
+        mime_type = blob.get('mimeType') or blob.get('mime_type')
+        image_path = os.path.join(f"{os.path.splitext(self.path)[0]}_images",
+                                  hashlib.sha256(data).hexdigest()[:16] + _EXTENSIONS.get(mime_type, '.bin'))
+        if not os.path.exists(image_path):
+            atomic_write(image_path, data)
+        stored = {'image': image_path, 'mime_type': mime_type}
+        signature = part.get('thoughtSignature') or part.get('thought_signature')
+        if signature:
+            stored['thoughtSignature'] = signature
+        return stored
+
+    def rest_turn(self, turn):
+        """
+        A stored turn in REST form, with returned images sent as (cached) uploaded handles.
+        """
+        parts = []
+        for part in turn['parts']:
+            if 'image' not in part:
+                parts.append(part)
+                continue
+            with open(part['image'], 'rb') as f:
+                blob = {'mime_type': part['mime_type'], 'data': f.read()}
+            rest_part = dict(upload_blob(blob, display_name=os.path.basename(part['image'])))
+            if 'thoughtSignature' in part:
+                rest_part['thoughtSignature'] = part['thoughtSignature']
+            parts.append(rest_part)
+        return {'role': turn['role'], 'parts': parts}
+
+    def request_body(self, turns):
+        body = to_rest_request([], self.state['aspect_ratio'], self.state['resolution'])
+        body['contents'] = [self.opening_content()] + [self.rest_turn(turn) for turn in turns]
+        return body
+
+    def send(self, text=None, stats=None):
+        """
+        Run the next turn: the opening generation when text is None, otherwise an edit of the
+        latest image. The turn joins the session only once add_output() records its image.
+
+        Returns:
+            (images, request_bytes): [(mime_type, bytes)] of final images and the request size
+        """
+        with self.lock:
+            turns = list(self.state['turns'])
+            if text is not None:
+                turns.append({'role': 'user', 'parts': [{'text': text}]})
+            body = self.request_body(turns)
+        request_bytes = len(json.dumps(body))
+
+        def rebuild():
+            with self.lock:
+                return self.request_body(turns)
+
+        payload = send_with_fresh_uploads(
+            lambda request: generate_conversation(self.state['model'], request, stats=stats), body, rebuild)
+        images = response_images(wrap_rest_response(payload))
+        if images:
+            content = (payload.get('candidates') or [{}])[0].get('content') or {}
+            # Thought summaries carry no signatures and are not needed for the next turn.
+            # Images keep their signature but are sent back as handles; other parts are kept as received
+            parts = [self.store_image(part) if part.get('inlineData') or part.get('inline_data') else part
+                     for part in content.get('parts', []) if not part.get('thought')]
+            self.pending = turns + [{'role': content.get('role', 'model'), 'parts': parts}]
+        return images, request_bytes
+
+    def add_output(self, path, text=None):
+        """
+        Commit the turn from the last send() together with the path its image was saved to.
+        """
+        with self.lock:
+            self.state['turns'] = self.pending
+            self.state['outputs'].append({'path': path, 'edit': text, 'time': time.time()})
+            self.save()
+
+    def undo(self):
+        """
+        Drop the latest edit and its image so the next edit starts from the one before.
+
+        Returns:
+            The output that is current again, or None if there was no edit to undo
+        """
+        with self.lock:
+            if not self.edits:
+                return None
+            self.state['turns'] = self.state['turns'][:-2]
+            self.state['outputs'].pop()
+            self.save()
+            return self.state['outputs'][-1]
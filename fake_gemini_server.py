@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Gemini REST API
+Answers generateContent, batchGenerateContent, batch polling and Files API calls with
+synthetic images so the scripts can be exercised offline:
+
+  python fake_gemini_server.py --port 8765
+  GEMINI_API_ENDPOINT=http://127.0.0.1:8765 GEMINI_API_KEY=fake python thumbnail-generator.py ...
+
+generateContent can be given a latency distribution, an error rate and a response image
+size, so it doubles as the backend for benchmark.py
+"""
+
+import argparse
+import base64
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Long side in pixels for each imageSize
+RESOLUTION_PIXELS = {'1K': 1024, '2K': 2048, '4K': 4096}
+
+
+def solid_png(width, height, rgb, pad_to=None):
+    """
+    Encode a solid-colour RGB PNG without Pillow. With pad_to, an ancillary chunk of
+    random bytes brings the file up to that many bytes (real renders barely compress).
+    """
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    row = b'\x00' + bytes(rgb) * width
+    png = (b'\x89PNG\r\n\x1a\n'
+           + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+           + chunk(b'IDAT', zlib.compress(row * height, 6)))
+    padding = (pad_to or 0) - len(png) - 24
+    if padding > 0:
+        png += chunk(b'paDd', os.urandom(padding))
+    return png + chunk(b'IEND', b'')
+
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution into a sampler returning seconds:
+    "0.5" or "fixed:0.5", "uniform:LOW:HIGH", "normal:MEAN:STDDEV" or "lognormal:MEDIAN:SIGMA".
+    """
+    kind, _, params = str(spec).partition(':')
+    if not params:
+        kind, params = 'fixed', kind
+    values = [float(v) for v in params.split(':')]
+    if kind == 'fixed' and len(values) == 1:
+        return lambda: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda: random.uniform(*values)
+    if kind == 'normal' and len(values) == 2:
+        return lambda: max(0.0, random.gauss(*values))
+    if kind == 'lognormal' and len(values) == 2:
+        median, sigma = values
+        return lambda: median * random.lognormvariate(0, sigma)
+    raise ValueError(f"invalid latency distribution '{spec}'")
+
+
+def image_size(image_config):
+    """
+    Return (width, height) for an imageConfig dict.
+    """
+    image_config = image_config or {}
+    long_side = RESOLUTION_PIXELS.get(image_config.get('imageSize') or image_config.get('image_size'), 1024)
+    ratio = image_config.get('aspectRatio') or image_config.get('aspect_ratio') or '1:1'
+    w, h = (int(x) for x in ratio.split(':'))
+    if w >= h:
+        return long_side, max(1, long_side * h // w)
+    return max(1, long_side * w // h), long_side
+
+
+class FakeGemini:
+    """
+    In-memory state shared by all request handlers.
+    """
+
+    def __init__(self, batch_delay=2.0, file_ttl=48 * 3600, latency=0, error_rate=0.0, image_bytes=None):
+        self.batch_delay = batch_delay
+        self.file_ttl = file_ttl
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.image_bytes = image_bytes
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.batches = {}
+        self.files = {}
+        self.uploads = {}
+        self.stats = {'requests': 0, 'bytes_received': 0, 'uploads': 0, 'generate_calls': 0, 'injected_errors': 0}
+
+    def generate(self, request):
+        """
+        Build a GenerateContentResponse whose image colour is derived from the request.
+        """
+        digest = hashlib.sha256(json.dumps(request, sort_keys=True).encode('utf-8')).digest()
+        config = request.get('generationConfig') or request.get('generation_config') or {}
+        width, height = image_size(config.get('imageConfig') or config.get('image_config'))
+        candidates = []
+        for index in range(int(config.get('candidateCount') or config.get('candidate_count') or 1)):
+            png = solid_png(width, height, digest[index * 3:index * 3 + 3], pad_to=self.image_bytes)
+            candidates.append({
+                'index': index,
+                'content': {'role': 'model', 'parts': [
+                    {'text': 'Here is your thumbnail.'},
+                    {'inlineData': {'mimeType': 'image/png', 'data': base64.b64encode(png).decode('ascii')},
+                     'thoughtSignature': base64.b64encode(digest).decode('ascii')},
+                ]},
+                'finishReason': 'STOP',
+            })
+        return {'candidates': candidates}
+
+    def missing_file(self, request):
+        """
+        Name of the first uploaded file the request refers to that does not exist (or has expired).
+        """
+        for content in request.get('contents', []):
+            for part in content.get('parts', []):
+                handle = part.get('file_data') or part.get('fileData')
+                if handle:
+                    name = 'files/' + (handle.get('file_uri') or handle.get('fileUri') or '').rsplit('/', 1)[-1]
+                    if self.get_file(name) is None:
+                        return name
+        return None
+
+    def create_batch(self, model, batch):
+        name = f"batches/fake-{next(self.ids)}"
+        with self.lock:
+            self.batches[name] = {'model': model, 'config': batch, 'created': time.monotonic()}
+        return {'name': name, 'metadata': {'name': name, 'state': 'BATCH_STATE_PENDING'}}
+
+    def get_batch(self, name):
+        with self.lock:
+            entry = self.batches.get(name)
+        if entry is None:
+            return None
+        if time.monotonic() - entry['created'] < self.batch_delay:
+            return {'name': name, 'metadata': {'name': name, 'state': 'BATCH_STATE_RUNNING'}, 'done': False}
+
+        if 'result' not in entry:
+            input_config = entry['config'].get('input_config') or entry['config'].get('inputConfig') or {}
+            if 'file_name' in input_config or 'fileName' in input_config:
+                file_name = input_config.get('file_name') or input_config.get('fileName')
+                lines = [json.loads(line) for line in self.files[file_name]['data'].decode('utf-8').splitlines() if line]
+                output = '\n'.join(json.dumps({'key': item['key'], 'response': self.generate(item['request'])})
+                                   for item in lines).encode('utf-8')
+                out_file = self.store_file(output, 'application/jsonl', 'batch-output')
+                entry['result'] = {'responsesFile': out_file['name']}
+            else:
+                requests = input_config['requests']['requests']
+                entry['result'] = {'inlinedResponses': {'inlinedResponses': [
+                    {'response': self.generate(item['request']), 'metadata': item.get('metadata', {})}
+                    for item in requests
+                ]}}
+        return {'name': name, 'metadata': {'name': name, 'state': 'BATCH_STATE_SUCCEEDED'},
+                'done': True, 'response': entry['result']}
+
+    def store_file(self, data, mime_type, display_name):
+        file_id = f"fake-{next(self.ids)}"
+        expires = time.time() + self.file_ttl
+        resource = {
+            'name': f"files/{file_id}",
+            'displayName': display_name,
+            'mimeType': mime_type,
+            'sizeBytes': str(len(data)),
+            'uri': f"https://generativelanguage.googleapis.com/v1beta/files/{file_id}",
+            'state': 'ACTIVE',
+            'expirationTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(expires)),
+        }
+        with self.lock:
+            self.files[resource['name']] = {'resource': resource, 'data': data, 'expires': expires}
+            self.stats['uploads'] += 1
+        return resource
+
+    def get_file(self, name):
+        with self.lock:
+            entry = self.files.get(name)
+        if entry is None or entry['expires'] < time.time():
+            return None
+        return entry
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            data = self.rfile.read(length) if length else b''
+            with state.lock:
+                state.stats['requests'] += 1
+                state.stats['bytes_received'] += len(data)
+            return data
+
+        def _send(self, status, payload=None, raw=None, headers=None):
+            body = raw if raw is not None else json.dumps(payload or {}).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/octet-stream' if raw is not None else 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _error(self, status, message):
+            self._send(status, {'error': {'code': status, 'message': message}})
+
+        def do_POST(self):
+            path = self.path.split('?', 1)[0]
+            data = self._body()
+
+            match = re.fullmatch(r'/v1beta/models/([^/:]+):(generateContent|batchGenerateContent)', path)
+            if match:
+                body = json.loads(data or b'{}')
+                if match.group(2) == 'generateContent':
+                    time.sleep(state.latency())
+                    with state.lock:
+                        state.stats['generate_calls'] += 1
+                        fail = random.random() < state.error_rate
+                        if fail:
+                            state.stats['injected_errors'] += 1
+                    if fail:
+                        return self._error(503, 'The model is overloaded. Please try again later.')
+                    missing = state.missing_file(body)
+                    if missing:
+                        return self._error(403, f"You do not have permission to access the File {missing} "
+                                                f"or it may not exist.")
+                    return self._send(200, state.generate(body))
+                return self._send(200, state.create_batch(match.group(1), body.get('batch', {})))
+
+            if path == '/upload/v1beta/files':
+                if self.headers.get('X-Goog-Upload-Command') == 'start':
+                    upload_id = str(next(state.ids))
+                    meta = json.loads(data or b'{}').get('file', {})
+                    state.uploads[upload_id] = {
+                        'mime_type': self.headers.get('X-Goog-Upload-Header-Content-Type', 'application/octet-stream'),
+                        'display_name': meta.get('display_name') or meta.get('displayName') or 'upload',
+                    }
+                    host = self.headers.get('Host')
+                    return self._send(200, {}, headers={
+                        'X-Goog-Upload-URL': f"http://{host}/upload/v1beta/files?upload_id={upload_id}",
+                    })
+                upload_id = self.path.split('upload_id=', 1)[-1]
+                pending = state.uploads.pop(upload_id, None)
+                if pending is None:
+                    return self._error(404, 'unknown upload session')
+                return self._send(200, {'file': state.store_file(data, pending['mime_type'], pending['display_name'])})
+
+            self._error(404, f"unknown endpoint {path}")
+
+        def do_GET(self):
+            path = self.path.split('?', 1)[0]
+
+            match = re.fullmatch(r'/v1beta/(batches/[^/]+)', path)
+            if match:
+                batch = state.get_batch(match.group(1))
+                return self._send(200, batch) if batch else self._error(404, 'batch not found')
+
+            match = re.fullmatch(r'/v1beta/(files/[^/:]+)', path)
+            if match:
+                entry = state.get_file(match.group(1))
+                return self._send(200, entry['resource']) if entry else self._error(404, 'file not found')
+
+            match = re.fullmatch(r'/download/v1beta/(files/[^/:]+):download', path)
+            if match:
+                entry = state.get_file(match.group(1))
+                return self._send(200, raw=entry['data']) if entry else self._error(404, 'file not found')
+
+            if path == '/stats':
+                return self._send(200, state.stats)
+
+            self._error(404, f"unknown endpoint {path}")
+
+    return Handler
+
+
+def serve(host='127.0.0.1', port=8765, **options):
+    """
+    Start the fake server in a background thread and return (server, state).
+    """
+    state = FakeGemini(**options)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local stand-in for the Gemini REST API')
+    parser.add_argument('--host', default='127.0.0.1', help='Bind address (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='Port (default: 8765)')
+    parser.add_argument('--batch-delay', type=float, default=2.0,
+                        help='Seconds before a batch job reports success (default: 2)')
+    parser.add_argument('--file-ttl', type=float, default=48 * 3600,
+                        help='Seconds before uploaded files expire (default: 48h)')
+    parser.add_argument('--latency', default='0',
+                        help='generateContent latency: SECONDS, uniform:LOW:HIGH, normal:MEAN:STDDEV '
+                             'or lognormal:MEDIAN:SIGMA (default: 0)')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of generateContent calls answered with 503 (default: 0)')
+    parser.add_argument('--image-bytes', type=int, default=None,
+                        help='Pad returned PNGs to this many bytes (default: unpadded)')
+    args = parser.parse_args()
+
+    server, _ = serve(args.host, args.port, batch_delay=args.batch_delay, file_ttl=args.file_ttl,
+                      latency=args.latency, error_rate=args.error_rate, image_bytes=args.image_bytes)
+    print(f"Fake Gemini API listening on http://{args.host}:{args.port}")
+    print(f"  export GEMINI_API_ENDPOINT=http://{args.host}:{args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,434 @@
+"""
+Shared image generation call for the thumbnail scripts
+Applies aspect ratio and resolution through the generation config. The deprecated
+google-generativeai SDK predates image_config, so when its protos cannot carry it the
+request is sent through the REST API instead and wrapped to look like an SDK response.
+Every call goes through a RequestExecutor that retries transient errors with backoff,
+enforces deadlines and can hedge slow requests, and each attempt first takes a slot from
+the shared cross-process RateLimiter
+"""
+
+import base64
+import json
+import os
+import queue
+import random
+import socket
+import threading
+import time
+import urllib.error
+from collections import deque
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from gemini_rest import GeminiAPIError, request_json, to_rest_request
+from image_io import CACHE_DIR, atomic_write
+from rate_limiter import RateLimiter
+
+# Upper bound the API accepts for candidateCount
+MAX_CANDIDATES = 8
+
+# What each model has been seen to reject, kept across runs
+CAPABILITIES_PATH = os.path.join(CACHE_DIR, 'model_capabilities.json')
+_capabilities_lock = threading.Lock()
+
+
+# HTTP statuses worth retrying: timeouts, rate limits and transient server errors
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error):
+    """
+    Classify an exception from the SDK or the REST helpers as transient (retry) or not.
+    """
+    if isinstance(error, GeminiAPIError):
+        return error.status in RETRYABLE_STATUS
+    if isinstance(error, (TimeoutError, ConnectionError, socket.timeout, urllib.error.URLError)):
+        return True
+    # google.api_core exceptions carry the HTTP status as an int .code
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    return type(error).__name__ in ('ResourceExhausted', 'ServiceUnavailable', 'InternalServerError',
+                                    'DeadlineExceeded', 'TooManyRequests', 'GatewayTimeout')
+
+
+class LatencyTracker:
+    """
+    Rolling window of successful request latencies, per key (model, resolution).
+    """
+
+    def __init__(self, window=200):
+        self.window = window
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self.lock:
+            self.samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, key, pct, min_samples=5):
+        """
+        Return the pct-th percentile latency for key, or None with too few samples.
+        """
+        with self.lock:
+            samples = sorted(self.samples.get(key, ()))
+        if len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+
+class RequestExecutor:
+    """
+    Runs a request callable with retries, exponential backoff with full jitter, an overall
+    deadline and optional hedging: when an attempt is still running after the
+    hedge_percentile latency seen so far, a duplicate is fired and the first to finish wins.
+
+    Attempts run on daemon threads, so a stuck call past its deadline is abandoned rather
+    than blocking the process. While an attempt runs, current_attempt() on its thread
+    returns its deadline and an event that is set once the executor stops waiting for it.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=30.0, deadline=None,
+                 hedge_percentile=None, min_samples=5, latencies=None):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.latencies = latencies or LatencyTracker()
+
+    def backoff(self, attempt):
+        """
+        Full-jitter delay before retry number attempt (1-based).
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _attempt(self, fn, key, timeout, stats):
+        """
+        Run one (possibly hedged) attempt and return its result or raise its error.
+        """
+        results = queue.Queue()
+        attempt = SimpleNamespace(
+            deadline=None if timeout is None else time.monotonic() + timeout,
+            abandoned=threading.Event(),
+        )
+
+        def launch():
+            def target():
+                _attempt_local.attempt = attempt
+                started = time.monotonic()
+                try:
+                    value = fn()
+                except BaseException as e:
+                    results.put((False, e))
+                else:
+                    self.latencies.record(key, time.monotonic() - started)
+                    results.put((True, value))
+            threading.Thread(target=target, daemon=True).start()
+
+        start = time.monotonic()
+        launch()
+        in_flight = 1
+
+        hedge_after = None
+        if self.hedge_percentile:
+            hedge_after = self.latencies.percentile(key, self.hedge_percentile, self.min_samples)
+
+        error = None
+        try:
+            while in_flight:
+                remaining = None if timeout is None else timeout - (time.monotonic() - start)
+                wait = remaining
+                if hedge_after is not None:
+                    until_hedge = hedge_after - (time.monotonic() - start)
+                    wait = until_hedge if wait is None else min(wait, until_hedge)
+                if wait is not None and wait <= 0:
+                    if hedge_after is not None and (remaining is None or remaining > 0):
+                        print(f"   ⏱️  Request slower than p{self.hedge_percentile:g} ({hedge_after:.1f}s), hedging")
+                        stats['hedges'] = stats.get('hedges', 0) + 1
+                        launch()
+                        in_flight += 1
+                        hedge_after = None
+                        continue
+                    raise TimeoutError(f"no response within the deadline ({time.monotonic() - start:.1f}s)")
+                try:
+                    ok, value = results.get(timeout=wait)
+                except queue.Empty:
+                    continue
+                in_flight -= 1
+                if ok:
+                    return value
+                error = value
+            raise error
+        finally:
+            # Timed out, failed or won by another copy: copies still queued for quota must not send
+            attempt.abandoned.set()
+
+    def run(self, fn, key=None, stats=None):
+        """
+        Call fn() until it succeeds, a non-retryable error occurs, attempts run out or
+        the deadline passes.
+
+        Args:
+            fn: Zero-argument callable performing the request
+            key: Latency bucket used for hedging decisions
+            stats: Optional dict updated with 'attempts', 'retries' and 'hedges'
+
+        Returns:
+            fn's return value
+        """
+        stats = stats if stats is not None else {}
+        stats.setdefault('attempts', 0)
+        stats.setdefault('retries', 0)
+        stats.setdefault('hedges', 0)
+        start = time.monotonic()
+
+        for attempt in range(1, self.max_attempts + 1):
+            stats['attempts'] = attempt
+            remaining = None if self.deadline is None else self.deadline - (time.monotonic() - start)
+            try:
+                return self._attempt(fn, key, remaining, stats)
+            except Exception as e:
+                deadline_hit = self.deadline is not None and time.monotonic() - start >= self.deadline
+                if attempt == self.max_attempts or deadline_hit or not is_retryable(e):
+                    raise
+                delay = self.backoff(attempt)
+                if self.deadline is not None:
+                    delay = min(delay, max(0.0, self.deadline - (time.monotonic() - start)))
+                print(f"   🔁 Attempt {attempt} failed ({e}); retrying in {delay:.1f}s")
+                stats['retries'] += 1
+                time.sleep(delay)
+
+
+# Per-thread state of the executor attempt running on that thread
+_attempt_local = threading.local()
+
+
+def current_attempt():
+    """
+    The executor attempt running on this thread (.deadline as a time.monotonic() value or
+    None, .abandoned as a threading.Event), or None outside an executor.
+    """
+    return getattr(_attempt_local, 'attempt', None)
+
+
+# Used by generate_images unless an executor is passed explicitly
+DEFAULT_EXECUTOR = RequestExecutor()
+
+
+def configure_executor(max_attempts=4, deadline=None, hedge_percentile=None):
+    """
+    Replace the process-wide executor (called from the CLIs' --retries/--deadline/--hedge-percentile).
+    """
+    global DEFAULT_EXECUTOR
+    DEFAULT_EXECUTOR = RequestExecutor(max_attempts=max_attempts, deadline=deadline,
+                                       hedge_percentile=hedge_percentile,
+                                       latencies=DEFAULT_EXECUTOR.latencies)
+    return DEFAULT_EXECUTOR
+
+
+# Quota shared with every other process using the same cache directory
+DEFAULT_LIMITER = RateLimiter()
+
+
+def model_key(model_name):
+    """
+    Normalise "models/<name>" and "<name>" to the bare model name used for quotas.
+    """
+    return model_name[len('models/'):] if model_name.startswith('models/') else model_name
+
+
+def configure_rate_limits(model_name, rpm=None, max_in_flight=None):
+    """
+    Persist per-model limits (from the CLIs' --rpm/--max-in-flight) for all processes.
+    """
+    if rpm is not None or max_in_flight is not None:
+        DEFAULT_LIMITER.set_limits(model_key(model_name), rpm=rpm, max_in_flight=max_in_flight)
+
+
+@contextmanager
+def quota_slot(model_name):
+    """
+    Hold a rate-limiter slot for one request. Inside an executor attempt the wait is bounded
+    by the attempt's deadline, and an attempt the executor has given up on (timed out, or
+    beaten by its hedge) returns its slot without sending.
+    """
+    attempt = current_attempt()
+    if attempt is None:
+        with DEFAULT_LIMITER.slot(model_key(model_name)):
+            yield
+        return
+    timeout = None if attempt.deadline is None else max(0.0, attempt.deadline - time.monotonic())
+    with DEFAULT_LIMITER.slot(model_key(model_name), timeout=timeout, cancel=attempt.abandoned):
+        if attempt.abandoned.is_set():
+            raise TimeoutError("request abandoned while waiting for quota")
+        yield
+
+
+def is_candidate_count_rejection(error):
+    """
+    True for the 400 INVALID_ARGUMENT a model answers when it does not accept candidateCount,
+    as opposed to transient failures or a response that simply has fewer candidates.
+    """
+    status = error.status if isinstance(error, GeminiAPIError) else getattr(error, 'code', None)
+    return status == 400 and 'candidatecount' in str(error).lower().replace('_', '')
+
+
+def _load_capabilities():
+    try:
+        with open(CAPABILITIES_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def supports_multiple_candidates(model_name):
+    """
+    Whether model_name may be asked for several candidates per request (assumed until it rejects one).
+    """
+    return _load_capabilities().get(model_key(model_name), {}).get('multiple_candidates', True)
+
+
+def record_multiple_candidates(model_name, supported):
+    """
+    Persist whether model_name accepts candidateCount > 1, for this and later runs.
+    """
+    with _capabilities_lock:
+        capabilities = _load_capabilities()
+        capabilities.setdefault(model_key(model_name), {})['multiple_candidates'] = supported
+        atomic_write(CAPABILITIES_PATH, json.dumps(capabilities, indent=2).encode('utf-8'))
+
+
+def sdk_supports_image_config():
+    """
+    Return True if the installed SDK's GenerationConfig has an image_config field.
+    """
+    from google.generativeai import protos
+
+    return 'image_config' in protos.GenerationConfig.meta.fields
+
+
+def _wrap_part(part):
+    blob = part.get('inlineData') or part.get('inline_data')
+    return SimpleNamespace(
+        text=part.get('text'),
+        inline_data=SimpleNamespace(
+            mime_type=blob.get('mimeType') or blob.get('mime_type'),
+            data=base64.b64decode(blob['data']),
+        ) if blob else None,
+        thought=part.get('thought', False),
+        thought_signature=part.get('thoughtSignature') or part.get('thought_signature'),
+    )
+
+
+def wrap_rest_response(payload):
+    """
+    Give a REST GenerateContentResponse the .candidates/.parts shape of an SDK response.
+    """
+    candidates = [
+        SimpleNamespace(
+            index=candidate.get('index', i),
+            finish_reason=candidate.get('finishReason'),
+            content=SimpleNamespace(
+                role=(candidate.get('content') or {}).get('role', 'model'),
+                parts=[_wrap_part(p) for p in (candidate.get('content') or {}).get('parts', [])],
+            ),
+        )
+        for i, candidate in enumerate(payload.get('candidates', []))
+    ]
+    return SimpleNamespace(
+        candidates=candidates,
+        parts=candidates[0].content.parts if candidates else [],
+        usage_metadata=payload.get('usageMetadata'),
+    )
+
+
+def response_images(response):
+    """
+    Return [(mime_type, bytes)] for every final image in every candidate of a response.
+    Interim "thought" images are skipped.
+    """
+    images = []
+    for candidate in getattr(response, 'candidates', None) or []:
+        for part in candidate.content.parts:
+            if getattr(part, 'thought', False):
+                continue
+            blob = getattr(part, 'inline_data', None)
+            if blob and blob.data:
+                images.append((blob.mime_type, blob.data))
+    return images
+
+
+def generate_images(model, contents, aspect_ratio=None, resolution=None, candidate_count=1,
+                    executor=None, stats=None):
+    """
+    Call generateContent with the requested aspect ratio and image size applied.
+
+    Args:
+        model: GenerativeModel instance
+        contents: Prompt text, or a list of text / image blob / file_data parts
+        aspect_ratio: e.g. "16:9" (None for the model default)
+        resolution: "1K", "2K" or "4K" (None for the model default)
+        candidate_count: Number of candidates to request in this single call
+        executor: RequestExecutor to run the call through (default: DEFAULT_EXECUTOR)
+        stats: Optional dict receiving the executor's attempt/retry/hedge counts
+
+    Returns:
+        The SDK response, or an equivalent wrapped REST response
+    """
+    generation_config = {}
+    if candidate_count > 1:
+        generation_config['candidate_count'] = candidate_count
+    image_config = {}
+    if aspect_ratio:
+        image_config['aspect_ratio'] = aspect_ratio
+    if resolution:
+        image_config['image_size'] = resolution
+
+    def send():
+        with quota_slot(model.model_name):
+            return send_now()
+
+    def send_now():
+        if not generation_config and not image_config:
+            return model.generate_content(contents)
+
+        if not image_config or sdk_supports_image_config():
+            config = dict(generation_config)
+            if image_config:
+                config['response_modalities'] = ['TEXT', 'IMAGE']
+                config['image_config'] = image_config
+            return model.generate_content(contents, generation_config=config)
+
+        parts = [contents] if isinstance(contents, str) else contents
+        model_name = model.model_name if model.model_name.startswith('models/') else f"models/{model.model_name}"
+        body = to_rest_request(parts, aspect_ratio, resolution)
+        if candidate_count > 1:
+            body['generationConfig']['candidateCount'] = candidate_count
+        payload = request_json('POST', f"{model_name}:generateContent", body)
+        return wrap_rest_response(payload)
+
+    executor = executor or DEFAULT_EXECUTOR
+    return executor.run(send, key=(model.model_name, resolution, candidate_count), stats=stats)
+
+
+def generate_conversation(model_name, body, executor=None, stats=None):
+    """
+    Send a prepared REST GenerateContentRequest (e.g. a multi-turn edit conversation) through
+    the executor and rate limiter. REST is used directly so every part, including thought
+    signatures, round-trips exactly as the API returned it.
+
+    Returns:
+        The decoded GenerateContentResponse JSON
+    """
+    model_name = model_name if model_name.startswith('models/') else f"models/{model_name}"
+
+    def send():
+        with quota_slot(model_name):
+            return request_json('POST', f"{model_name}:generateContent", body)
+
+    executor = executor or DEFAULT_EXECUTOR
+    return executor.run(send, key=(model_name, 'conversation'), stats=stats)
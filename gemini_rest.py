@@ -0,0 +1,153 @@
+"""
+Minimal REST helpers for Gemini API features the google-generativeai SDK does not cover
+(Batch API, resumable file uploads). Set GEMINI_API_ENDPOINT to point every call, SDK
+calls included, at a local stand-in such as fake_gemini_server.py
+"""
+
+import base64
+import json
+import os
+import urllib.error
+import urllib.request
+
+DEFAULT_API_BASE = "https://generativelanguage.googleapis.com"
+API_VERSION = "v1beta"
+
+
+class GeminiAPIError(Exception):
+    """
+    Raised when the API answers with a non-2xx status.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+def api_base():
+    return os.getenv('GEMINI_API_ENDPOINT', DEFAULT_API_BASE).rstrip('/')
+
+
+def configure_sdk(api_key):
+    """
+    Configure google.generativeai, routing it to GEMINI_API_ENDPOINT when that is set
+    so SDK calls reach the same local stand-in as the REST helpers.
+    """
+    import google.generativeai as genai
+
+    endpoint = os.getenv('GEMINI_API_ENDPOINT')
+    if endpoint:
+        genai.configure(api_key=api_key, transport='rest', client_options={'api_endpoint': endpoint})
+    else:
+        genai.configure(api_key=api_key)
+
+
+def _api_key():
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        raise GeminiAPIError(401, "GEMINI_API_KEY not found in environment variables")
+    return api_key
+
+
+def _open(req, timeout):
+    try:
+        return urllib.request.urlopen(req, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        body = e.read().decode('utf-8', 'replace')
+        try:
+            message = json.loads(body)['error']['message']
+        except (ValueError, KeyError, TypeError):
+            message = body or e.reason
+        raise GeminiAPIError(e.code, message) from None
+
+
+def request_json(method, path, body=None, timeout=120):
+    """
+    Send a JSON request to {api_base}/{API_VERSION}/{path} and return the decoded response.
+    """
+    url = path if path.startswith('http') else f"{api_base()}/{API_VERSION}/{path.lstrip('/')}"
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={
+        'x-goog-api-key': _api_key(),
+        'Content-Type': 'application/json',
+    })
+    with _open(req, timeout) as resp:
+        payload = resp.read()
+    return json.loads(payload) if payload else {}
+
+
+def upload_file(data, mime_type, display_name=None, timeout=300):
+    """
+    Upload bytes through the Files API resumable protocol.
+
+    Returns:
+        The file resource dict (name, uri, mimeType, expirationTime, ...)
+    """
+    start = urllib.request.Request(
+        f"{api_base()}/upload/{API_VERSION}/files",
+        data=json.dumps({'file': {'display_name': display_name or 'upload'}}).encode('utf-8'),
+        method='POST',
+        headers={
+            'x-goog-api-key': _api_key(),
+            'X-Goog-Upload-Protocol': 'resumable',
+            'X-Goog-Upload-Command': 'start',
+            'X-Goog-Upload-Header-Content-Length': str(len(data)),
+            'X-Goog-Upload-Header-Content-Type': mime_type,
+            'Content-Type': 'application/json',
+        },
+    )
+    with _open(start, timeout) as resp:
+        upload_url = resp.headers.get('X-Goog-Upload-URL')
+    if not upload_url:
+        raise GeminiAPIError(500, "upload session did not return X-Goog-Upload-URL")
+
+    finish = urllib.request.Request(upload_url, data=data, method='POST', headers={
+        'x-goog-api-key': _api_key(),
+        'Content-Length': str(len(data)),
+        'X-Goog-Upload-Offset': '0',
+        'X-Goog-Upload-Command': 'upload, finalize',
+    })
+    with _open(finish, timeout) as resp:
+        return json.loads(resp.read())['file']
+
+
+def download_file(name, timeout=300):
+    """
+    Download the contents of a file resource (e.g. a batch job's responses file).
+    """
+    req = urllib.request.Request(
+        f"{api_base()}/download/{API_VERSION}/{name}:download?alt=media",
+        headers={'x-goog-api-key': _api_key()},
+    )
+    with _open(req, timeout) as resp:
+        return resp.read()
+
+
+def to_rest_request(content_parts, aspect_ratio=None, resolution=None):
+    """
+    Convert SDK-style content parts (text, {'mime_type', 'data'} blobs and
+    {'file_data': ...} upload handles) into a GenerateContentRequest JSON body.
+    """
+    parts = []
+    for part in content_parts:
+        if isinstance(part, str):
+            parts.append({'text': part})
+        elif 'file_data' in part:
+            parts.append({'file_data': dict(part['file_data'])})
+        else:
+            parts.append({'inline_data': {
+                'mime_type': part['mime_type'],
+                'data': base64.b64encode(part['data']).decode('ascii'),
+            }})
+
+    generation_config = {'responseModalities': ['TEXT', 'IMAGE']}
+    image_config = {}
+    if aspect_ratio:
+        image_config['aspectRatio'] = aspect_ratio
+    if resolution:
+        image_config['imageSize'] = resolution
+    if image_config:
+        generation_config['imageConfig'] = image_config
+
+    return {'contents': [{'role': 'user', 'parts': parts}], 'generationConfig': generation_config}
@@ -7,12 +7,20 @@ Supports 1-14 reference images with role descriptions
 import os
 import sys
 import argparse
-import io
 import base64
 from pathlib import Path
 from dotenv import load_dotenv
 import google.generativeai as genai
-from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+import logo_overlay
+from reference_cache import load_reference, probe_image
+from upload_cache import load_uploaded_reference, send_with_fresh_uploads
+from gemini_rest import configure_sdk
+from gemini_client import configure_executor, configure_rate_limits, generate_images, response_images
+from image_io import save_image_bytes
+from result_cache import DEFAULT_CACHE as RESULT_CACHE, configure as configure_result_cache, request_key
+from metrics import RequestMetrics, configure as configure_metrics, current_run_id, emit as emit_metrics, payload_bytes
+import output_archive
 
 # Load environment variables
 load_dotenv()
@@ -28,27 +36,35 @@ def parse_image_arg(image_arg):
     else:
         return image_arg.strip(), None
 
-def validate_images(image_specs):
+def validate_images(image_specs, max_workers=8):
     """
-    Validate that image files exist and are readable
-    Returns list of validated (path, description) tuples
+    Validate that image files exist and are readable images
+    Files are probed in parallel from their headers only (cached by path, mtime and size),
+    and every bad image is reported before exiting
+    Returns (list of validated (path, description) tuples, {path: file bytes already read})
     """
-    validated = []
-    for path, description in image_specs:
+    def probe(spec):
+        path, _ = spec
         if not os.path.exists(path):
-            print(f"Error: Image file not found: {path}")
-            sys.exit(1)
-
+            return None, "file not found"
         try:
-            # Test if we can open the image
-            with Image.open(path) as img:
-                img.verify()
-            validated.append((path, description))
+            _, data = probe_image(path)
+            return data, None
         except Exception as e:
-            print(f"Error: Cannot open image {path}: {e}")
-            sys.exit(1)
+            return None, f"cannot open image: {e}"
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(image_specs)))) as executor:
+        results = list(executor.map(probe, image_specs))
 
-    return validated
+    errors = [(path, error) for (path, _), (_, error) in zip(image_specs, results) if error]
+    if errors:
+        for path, error in errors:
+            print(f"Error: {path}: {error}")
+        print(f"{len(errors)} of {len(image_specs)} image(s) failed validation.")
+        sys.exit(1)
+
+    sources = {path: data for (path, _), (data, _) in zip(image_specs, results) if data is not None}
+    return list(image_specs), sources
 
 def build_prompt_with_descriptions(base_prompt, image_specs):
     """
@@ -71,10 +87,13 @@ def build_prompt_with_descriptions(base_prompt, image_specs):
     else:
         return base_prompt
 
-def generate_image(image_specs, prompt, model, output_path, aspect_ratio, resolution):
+def generate_image(image_specs, prompt, model, output_path, aspect_ratio, resolution, upload_references=False,
+                   sources=None, logo_placements=None):
     """
     Generate image using Gemini API with reference images
-    Note: aspect_ratio and resolution are currently not supported in the older API
+    With upload_references, images are uploaded once via the Files API and sent as cached handles
+    sources holds file contents already read by validate_images, so they are not read again
+    logo_placements are composited locally onto the result instead of being sent as brand elements
     """
     api_key = os.getenv('GEMINI_API_KEY')
     if not api_key:
@@ -93,52 +112,98 @@ def generate_image(image_specs, prompt, model, output_path, aspect_ratio, resolu
 
     print(f"\n🎨 Generating image with {len(image_specs)} reference image(s)...")
     print(f"Model: {model}")
+    print(f"Resolution: {resolution} | Aspect Ratio: {aspect_ratio}")
     print(f"\nReference Images:")
     for i, (path, description) in enumerate(image_specs, 1):
         desc_text = f" - {description}" if description else ""
         print(f"  {i}. {Path(path).name}{desc_text}")
 
+    if logo_placements:
+        print("\nLogos placed locally after generation:")
+        for placement in logo_placements:
+            print(f"  • {Path(placement.path).name} ({placement.anchor})")
+
     # Build the enhanced prompt
     enhanced_prompt = build_prompt_with_descriptions(prompt, image_specs)
+    if logo_placements:
+        enhanced_prompt = f"{enhanced_prompt} {logo_overlay.layout_hint(logo_placements)}"
     print(f"\nPrompt: {enhanced_prompt}\n")
 
+    request_metrics = RequestMetrics('image-to-image', job=output_path)
     try:
         # Configure API
-        genai.configure(api_key=api_key)
+        configure_sdk(api_key)
 
         # Create model
         model_instance = genai.GenerativeModel(model)
 
-        # Build contents array with prompt and images
-        contents = [enhanced_prompt]
-        for path, _ in image_specs:
-            contents.append(Image.open(path))
-
-        # Generate content
-        print("Generating... (this may take 10-30 seconds)")
-        response = model_instance.generate_content(contents)
+        # Identical requests are served from the result cache without calling the API
+        with request_metrics.stage('build'):
+            cache_key = request_key(enhanced_prompt, [path for path, _ in image_specs], model=model,
+                                    aspect_ratio=aspect_ratio, resolution=resolution)
+            images = RESULT_CACHE.get(cache_key)
+
+        if images:
+            print("♻️  Identical request found in result cache (use --force to regenerate)")
+            request_metrics.cache_hit = True
+        else:
+            # Build contents array with prompt and images (cached, downscaled copies)
+            load_image = load_uploaded_reference if upload_references else load_reference
+            sources = sources or {}
+
+            def build():
+                return [enhanced_prompt] + [load_image(path, data=sources.get(path)) for path, _ in image_specs]
+
+            with request_metrics.stage('references'):
+                contents = build()
+            request_metrics.add('request_bytes', payload_bytes(contents))
+
+            # Generate content
+            print("Generating... (this may take 10-30 seconds)")
+            stats = {}
+            try:
+                with request_metrics.stage('network'):
+                    response = send_with_fresh_uploads(
+                        lambda parts: generate_images(model_instance, parts, aspect_ratio=aspect_ratio,
+                                                      resolution=resolution, stats=stats),
+                        contents, build)
+            finally:
+                request_metrics.add_stats(stats)
+
+            for part in response.parts:
+                if hasattr(part, 'text') and part.text:
+                    print(f"\nModel response: {part.text}")
+            with request_metrics.stage('decode'):
+                images = response_images(response)
+            RESULT_CACHE.put(cache_key, images)
+            request_metrics.add('response_bytes', sum(len(data) for _, data in images))
 
         # Save the generated image
-        image_saved = False
-        for part in response.parts:
-            if hasattr(part, 'inline_data') and part.inline_data:
-                # Extract image data and convert to PIL Image
-                image_data = part.inline_data.data
-                image = Image.open(io.BytesIO(image_data))
-                image.save(output_path)
-                print(f"\n✅ Image saved to: {output_path}")
-                image_saved = True
-                break
-            elif hasattr(part, 'text') and part.text:
-                print(f"\nModel response: {part.text}")
-
-        if not image_saved:
+        if not images:
             print("\n⚠️  No image was generated in the response.")
             sys.exit(1)
 
+        # Write the returned bytes directly (transcoded only if the extension differs)
+        mime_type, image_data = images[0]
+        with request_metrics.stage('save'):
+            if logo_placements:
+                image_data = logo_overlay.composite(image_data, logo_placements)
+            save_image_bytes(image_data, output_path, mime_type)
+        print(f"\n✅ Image saved to: {output_path}")
+        output_archive.record(
+            image_data, mime_type, output_path, script='image-to-image', run_id=current_run_id(),
+            prompt=prompt, final_prompt=enhanced_prompt, references=[path for path, _ in image_specs],
+            logos=[p.path for p in logo_placements or []], model=model, aspect_ratio=aspect_ratio,
+            resolution=resolution, cache_hit=request_metrics.cache_hit, seconds=request_metrics.elapsed(),
+            stages=dict(request_metrics.stages))
+        request_metrics.add('images', 1)
+        request_metrics.ok = True
+
     except Exception as e:
         print(f"\n❌ Error during generation: {e}")
         sys.exit(1)
+    finally:
+        emit_metrics(request_metrics)
 
 def main():
     parser = argparse.ArgumentParser(
@@ -156,6 +221,9 @@ Examples:
     -i "logo.png:brand element in corner" \\
     "Create a professional product photo"
 
+  # Brand logo placed locally (pixel-exact) instead of sent to the model
+  python image-to-image.py -i "product.jpg:the product" -L "logos/n8nlogo.png@top-right" "Studio product shot"
+
   # Custom output and resolution
   python image-to-image.py -i "reference.jpg:art style" "fantasy landscape" -o output.png --resolution 4K
         """
@@ -200,13 +268,130 @@ Examples:
         help='Resolution (default: 2K)'
     )
 
+    parser.add_argument(
+        '--retries',
+        type=int,
+        default=3,
+        help='Retries for rate-limit/transient errors, with exponential backoff (default: 3)'
+    )
+
+    parser.add_argument(
+        '--deadline',
+        type=float,
+        default=None,
+        help='Give up on the request (including retries) after this many seconds'
+    )
+
+    parser.add_argument(
+        '--hedge-percentile',
+        type=float,
+        default=None,
+        help='Fire a duplicate request when one runs slower than this latency percentile'
+    )
+
+    parser.add_argument(
+        '--rpm',
+        type=float,
+        default=None,
+        help='Requests per minute allowed for this model across all processes (saved for later runs)'
+    )
+
+    parser.add_argument(
+        '--max-in-flight',
+        type=int,
+        default=None,
+        help='Maximum concurrent requests for this model across all processes (saved for later runs)'
+    )
+
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Regenerate even if an identical request is in the result cache (and refresh it)'
+    )
+
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Neither read nor write the result cache'
+    )
+
+    parser.add_argument(
+        '--upload-references',
+        action='store_true',
+        help='Upload images once via the Files API and reuse the cached handles'
+    )
+
+    parser.add_argument(
+        '-L', '--overlay-logo',
+        action='append',
+        dest='overlay_logos',
+        help='Logo composited locally onto the result instead of sent as a brand element: '
+             '"path[@anchor[,size[,margin]]]" or a name from logos/ (can be used multiple times)'
+    )
+
+    parser.add_argument(
+        '--logo-anchor',
+        default=None,
+        choices=list(logo_overlay.ANCHORS),
+        help=f"Default position for --overlay-logo (default: {logo_overlay.DEFAULT_PLACEMENT['anchor']})"
+    )
+
+    parser.add_argument(
+        '--logo-size',
+        type=float,
+        default=None,
+        help=f"Logo size as a fraction of image height (default: {logo_overlay.DEFAULT_PLACEMENT['size']})"
+    )
+
+    parser.add_argument(
+        '--logo-margin',
+        type=float,
+        default=None,
+        help=f"Margin from the edge as a fraction of image height (default: {logo_overlay.DEFAULT_PLACEMENT['margin']})"
+    )
+
+    parser.add_argument(
+        '--no-archive',
+        action='store_true',
+        help='Do not store the output in the content-addressed archive'
+    )
+
+    parser.add_argument(
+        '--metrics',
+        default=os.getenv('THUMBNAIL_METRICS'),
+        help='Record per-stage timings, payload bytes and retries: JSON lines, or a Prometheus '
+             'text file if the path ends in .prom (default: $THUMBNAIL_METRICS)'
+    )
+
+    parser.add_argument(
+        '--run-id',
+        default=None,
+        help='Run id attached to the metrics record (default: $THUMBNAIL_RUN_ID or random)'
+    )
+
     args = parser.parse_args()
+    configure_executor(max_attempts=args.retries + 1, deadline=args.deadline,
+                       hedge_percentile=args.hedge_percentile)
+    configure_rate_limits(args.model, rpm=args.rpm, max_in_flight=args.max_in_flight)
+    configure_result_cache('off' if args.no_cache else 'refresh' if args.force else 'use')
+    configure_metrics(args.metrics, run_id=args.run_id)
+    try:
+        logo_overlay.configure(args.logo_anchor, args.logo_size, args.logo_margin)
+    except ValueError as e:
+        parser.error(str(e))
+    output_archive.configure(enabled=not args.no_archive)
+
+    try:
+        logo_placements = logo_overlay.placements(args.overlay_logos)
+    except ValueError as e:
+        print(f"Error: --overlay-logo: {e}")
+        sys.exit(1)
 
     # Parse image arguments
     image_specs = [parse_image_arg(img) for img in args.images]
 
     # Validate images
-    validated_images = validate_images(image_specs)
+    validated_images, sources = validate_images(image_specs)
 
     # Generate image
     generate_image(
@@ -215,7 +400,10 @@ Examples:
         args.model,
         args.output,
         args.aspect_ratio,
-        args.resolution
+        args.resolution,
+        upload_references=args.upload_references,
+        sources=sources,
+        logo_placements=logo_placements
     )
 
 if __name__ == '__main__':
@@ -0,0 +1,100 @@
+"""
+Output writing for generated images
+Writes the bytes returned by the API straight to disk (atomically) when the output
+extension matches the returned format, and only decodes/re-encodes when a different
+format was asked for
+"""
+
+import io
+import os
+import tempfile
+
+# Root of the on-disk caches (override with THUMBNAIL_CACHE_DIR)
+CACHE_DIR = os.getenv('THUMBNAIL_CACHE_DIR', './.cache')
+
+# MIME type -> (Pillow format name, matching file extensions)
+IMAGE_FORMATS = {
+    'image/png': ('PNG', ('.png',)),
+    'image/jpeg': ('JPEG', ('.jpg', '.jpeg')),
+    'image/webp': ('WEBP', ('.webp',)),
+    'image/gif': ('GIF', ('.gif',)),
+}
+
+# mkstemp creates files as 0600; outputs get the usual umask-based mode instead.
+# Read once at import because os.umask can only be read by setting it.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def sniff_mime_type(data):
+    """
+    Identify the image format from its magic bytes (for responses without a MIME type).
+    """
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    return None
+
+
+def mime_type_for_path(path):
+    ext = os.path.splitext(path)[1].lower()
+    for mime_type, (_, extensions) in IMAGE_FORMATS.items():
+        if ext in extensions:
+            return mime_type
+    return None
+
+
+def atomic_write(path, data):
+    """
+    Write data to path via a temp file in the same directory and an atomic rename, so
+    readers never see a partially written image.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def save_image_bytes(data, output_path, mime_type=None):
+    """
+    Save image bytes returned by the API to output_path.
+
+    The bytes are written unchanged when the output extension matches their format (or
+    the extension is unknown). Otherwise they are transcoded to the format the extension
+    asks for.
+
+    Returns:
+        output_path
+    """
+    source_type = sniff_mime_type(data) or mime_type
+    target_type = mime_type_for_path(output_path)
+
+    if target_type is None or target_type == source_type:
+        atomic_write(output_path, data)
+        return output_path
+
+    from PIL import Image
+
+    target_format = IMAGE_FORMATS[target_type][0]
+    with Image.open(io.BytesIO(data)) as image:
+        if target_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, format=target_format, **({'quality': 95} if target_format in ('JPEG', 'WEBP') else {}))
+    atomic_write(output_path, buffer.getvalue())
+    return output_path
@@ -0,0 +1,155 @@
+"""
+Resumable bulk job runner
+Streams thumbnail jobs from a JSONL file and records finished/failed jobs in a manifest
+so an interrupted run can resume without regenerating completed thumbnails
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Keys a job line may contain, mirroring the thumbnail-generator.py CLI arguments
+JOB_FIELDS = ('prompt', 'references', 'style', 'logos', 'output', 'aspect_ratio', 'resolution')
+
+
+def job_id(job):
+    """
+    Return the job's explicit "id", or a stable hash of its fields.
+    """
+    if job.get('id'):
+        return str(job['id'])
+    canonical = json.dumps({k: job.get(k) for k in JOB_FIELDS}, sort_keys=True)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+
+def iter_jobs(jobs_path, on_error=None):
+    """
+    Yield (line_number, job) for each non-empty line of a JSONL job file.
+    Lines are read lazily so job files of any size can be streamed.
+
+    A malformed line raises ValueError, or is passed to on_error(line_number, message)
+    and skipped when on_error is given.
+    """
+    with open(jobs_path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                error = f"{jobs_path}:{line_number}: invalid JSON: {e}"
+            else:
+                if isinstance(job, dict) and job.get('prompt'):
+                    yield line_number, job
+                    continue
+                error = f"{jobs_path}:{line_number}: job must be an object with a 'prompt'"
+            if on_error is None:
+                raise ValueError(error)
+            on_error(line_number, error)
+
+
+def load_manifest(manifest_path):
+    """
+    Return {job_id: record} holding the latest manifest record for every job.
+    A truncated final line (from a crash mid-write) is ignored.
+    """
+    records = {}
+    if not os.path.exists(manifest_path):
+        return records
+    with open(manifest_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            records[record['id']] = record
+    return records
+
+
+def run_jobs(jobs_path, generate, manifest_path=None, concurrency=1):
+    """
+    Run every job in jobs_path through generate(**job_kwargs), skipping jobs the
+    manifest already records as done (and whose output still exists).
+
+    Args:
+        jobs_path: JSONL file, one job object per line
+        generate: Callable taking the JOB_FIELDS as keyword arguments and returning the
+                  saved output path, or None on failure
+        manifest_path: Where to append job results (default: <jobs_path>.manifest.jsonl)
+        concurrency: Number of jobs to run at once
+
+    Returns:
+        (done, failed, skipped) counts
+    """
+    manifest_path = manifest_path or f"{os.path.splitext(jobs_path)[0]}.manifest.jsonl"
+    completed = {
+        jid for jid, record in load_manifest(manifest_path).items()
+        if record.get('status') == 'done' and record.get('output') and os.path.exists(record['output'])
+    }
+    write_lock = threading.Lock()
+    counts = {'done': 0, 'failed': 0, 'skipped': 0}
+
+    print(f"\n📋 Running jobs from {jobs_path}")
+    print(f"   Manifest: {manifest_path} ({len(completed)} already done)")
+
+    def record(jid, line_number, status, output=None, error=None, duration=None):
+        entry = {'id': jid, 'line': line_number, 'status': status, 'output': output,
+                 'error': error, 'duration_s': duration, 'finished_at': time.time()}
+        with write_lock:
+            with open(manifest_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            counts[status] += 1
+
+    def run_one(jid, line_number, job):
+        kwargs = {k: job[k] for k in JOB_FIELDS if job.get(k) is not None}
+        kwargs.setdefault('output', f"thumbnail_{jid}.png")
+        kwargs['output_path'] = kwargs.pop('output')
+        kwargs['reference_images'] = kwargs.pop('references', None)
+        kwargs['style_reference'] = kwargs.pop('style', None)
+        kwargs['logo_references'] = kwargs.pop('logos', None)
+
+        start = time.monotonic()
+        try:
+            output = generate(**kwargs)
+            error = None if output else "no image returned"
+        except Exception as e:
+            output, error = None, str(e)
+        duration = round(time.monotonic() - start, 3)
+
+        if output:
+            record(jid, line_number, 'done', output=output, duration=duration)
+            print(f"   ✓ [{jid}] {output} ({duration:.1f}s)")
+        else:
+            record(jid, line_number, 'failed', error=error, duration=duration)
+            print(f"   ✗ [{jid}] line {line_number}: {error}")
+
+    def invalid_line(line_number, error):
+        # Malformed lines have no fields to hash, so they are keyed by position
+        record(f"line-{line_number}", line_number, 'failed', error=error)
+        print(f"   ✗ {error}")
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        pending = set()
+        for line_number, job in iter_jobs(jobs_path, on_error=invalid_line):
+            jid = job_id(job)
+            if jid in completed:
+                counts['skipped'] += 1
+                continue
+            completed.add(jid)  # also de-duplicates repeated lines within this run
+            pending.add(executor.submit(run_one, jid, line_number, job))
+            # Bound the number of queued jobs so huge job files are not loaded all at once
+            if len(pending) >= max(1, concurrency) * 2:
+                finished = next(as_completed(pending))
+                pending.discard(finished)
+        for _ in as_completed(pending):
+            pass
+
+    print(f"\n📋 Jobs complete: {counts['done']} done, {counts['failed']} failed, "
+          f"{counts['skipped']} skipped (already done)")
+    return counts['done'], counts['failed'], counts['skipped']
@@ -0,0 +1,198 @@
+"""
+Local logo compositing
+Places logos on the generated image with Pillow instead of sending them to the model, so
+they cost no upload bytes or input tokens and always come out pixel-exact. Logos are
+scaled once per target size and the sprites are cached on disk
+"""
+
+import io
+import os
+import threading
+from collections import namedtuple
+
+from image_io import CACHE_DIR, atomic_write
+from reference_cache import content_hash
+
+# Bare logo names (e.g. "mcp") are looked up here
+LOGO_FOLDER = './logos'
+
+# Shared by thumbnail-generator.py and image-to-image.py
+DEFAULT_CACHE_DIR = os.path.join(CACHE_DIR, 'logos')
+
+# anchor name -> (x, y) position as a fraction of the free space
+ANCHORS = {
+    'top-left': (0.0, 0.0), 'top': (0.5, 0.0), 'top-right': (1.0, 0.0),
+    'left': (0.0, 0.5), 'center': (0.5, 0.5), 'right': (1.0, 0.5),
+    'bottom-left': (0.0, 1.0), 'bottom': (0.5, 1.0), 'bottom-right': (1.0, 1.0),
+}
+
+# path, anchor, size (logo box side as a fraction of image height), margin (fraction of image height)
+Placement = namedtuple('Placement', 'path anchor size margin')
+
+DEFAULT_PLACEMENT = {'anchor': 'bottom-right', 'size': 0.16, 'margin': 0.04}
+
+_sprites = {}
+_lock = threading.Lock()
+
+
+def _check_size(size, margin, where=''):
+    if not 0 < size <= 1:
+        raise ValueError(f"logo size {size:g}{where} must be a fraction of the image height in (0, 1]")
+    if margin < 0:
+        raise ValueError(f"logo margin {margin:g}{where} cannot be negative")
+
+
+def configure(anchor=None, size=None, margin=None):
+    """
+    Set the default anchor, size and margin used for logos without their own rules.
+    """
+    if anchor is not None and anchor not in ANCHORS:
+        raise ValueError(f"unknown anchor '{anchor}' (choose from {', '.join(ANCHORS)})")
+    _check_size(DEFAULT_PLACEMENT['size'] if size is None else size,
+                DEFAULT_PLACEMENT['margin'] if margin is None else margin)
+    if anchor is not None:
+        DEFAULT_PLACEMENT['anchor'] = anchor
+    if size is not None:
+        DEFAULT_PLACEMENT['size'] = size
+    if margin is not None:
+        DEFAULT_PLACEMENT['margin'] = margin
+
+
+def parse_placement(spec):
+    """
+    Parse "path[@anchor[,size[,margin]]]", e.g. "logos/mcp.png@top-left,0.2".
+    Missing fields take the configured defaults.
+    """
+    path, _, rules = spec.rpartition('@')
+    if not path or os.sep in rules:
+        path, rules = spec, ''
+    fields = [f.strip() for f in rules.split(',')] if rules else []
+    anchor = fields[0] if fields and fields[0] else DEFAULT_PLACEMENT['anchor']
+    if anchor not in ANCHORS:
+        raise ValueError(f"unknown anchor '{anchor}' in '{spec}' (choose from {', '.join(ANCHORS)})")
+    try:
+        size = float(fields[1]) if len(fields) > 1 and fields[1] else DEFAULT_PLACEMENT['size']
+        margin = float(fields[2]) if len(fields) > 2 and fields[2] else DEFAULT_PLACEMENT['margin']
+    except ValueError:
+        raise ValueError(f"size and margin in '{spec}' must be numbers") from None
+    _check_size(size, margin, f" in '{spec}'")
+    return Placement(path, anchor, size, margin)
+
+
+def resolve_logo(path):
+    """
+    Return path if it exists, else the matching file in LOGO_FOLDER ("mcp" -> logos/mcp.png), else None.
+    """
+    if os.path.exists(path):
+        return path
+    name = os.path.basename(path)
+    for candidate in (name, name + '.png', name + '.webp', name + '.jpg'):
+        candidate = os.path.join(LOGO_FOLDER, candidate)
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def placements(logo_specs):
+    """
+    Parse a list of logo specs (or a single one).
+
+    Raises:
+        ValueError: for a malformed spec or a logo that cannot be found
+    """
+    if not logo_specs:
+        return []
+    specs = logo_specs if isinstance(logo_specs, list) else [logo_specs]
+    parsed, missing = [], []
+    for placement in (parse_placement(spec) for spec in specs):
+        path = resolve_logo(placement.path)
+        if path:
+            parsed.append(placement._replace(path=path))
+        else:
+            missing.append(placement.path)
+    if missing:
+        raise ValueError(f"logo(s) not found: {', '.join(missing)} (looked in {LOGO_FOLDER} too)")
+    return parsed
+
+
+def layout_hint(placements_list):
+    """
+    Prompt sentence asking the model to keep the logo areas free.
+    """
+    anchors = sorted({p.anchor for p in placements_list}, key=list(ANCHORS).index)
+    if not anchors:
+        return ''
+    names = [anchor.replace('-', ' ') for anchor in anchors]
+    areas = ' and '.join(filter(None, [', '.join(names[:-1]), names[-1]]))
+    return (f"Leave the {areas} area{'s' if len(anchors) > 1 else ''} free of text and important "
+            f"detail; a logo will be placed there afterwards.")
+
+
+def get_sprite(path, box, cache_dir=None):
+    """
+    Return the logo at path scaled to fit a box x box square, as an RGBA image.
+    Sprites are keyed by the logo's content hash and box size, in memory and on disk.
+    """
+    from PIL import Image
+
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    key = f"{content_hash(path)}_{box}"
+    with _lock:
+        if key in _sprites:
+            return _sprites[key]
+
+    sprite_path = os.path.join(cache_dir, f"{key}.png")
+    if os.path.exists(sprite_path):
+        with Image.open(sprite_path) as cached:
+            sprite = cached.convert('RGBA')
+    else:
+        with Image.open(path) as logo:
+            sprite = logo.convert('RGBA')
+        sprite.thumbnail((box, box), Image.LANCZOS)
+        buffer = io.BytesIO()
+        sprite.save(buffer, format='PNG', optimize=True)
+        atomic_write(sprite_path, buffer.getvalue())
+
+    with _lock:
+        _sprites[key] = sprite
+    return sprite
+
+
+def composite(data, placements_list):
+    """
+    Paste logos onto an encoded image. Logos sharing an anchor are laid out side by side
+    with the margin between them.
+
+    Returns:
+        The composited image encoded in the same format as data
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as source:
+        image_format = source.format or 'PNG'
+        has_alpha = 'A' in source.getbands() or 'transparency' in source.info
+        image = source.convert('RGBA')
+    width, height = image.size
+
+    groups = {}
+    for placement in placements_list:
+        groups.setdefault(placement.anchor, []).append(placement)
+
+    for anchor, group in groups.items():
+        margin = round(group[0].margin * height)
+        sprites = [get_sprite(p.path, max(1, round(p.size * height))) for p in group]
+        row_width = sum(s.width for s in sprites) + margin * (len(sprites) - 1)
+        row_height = max(s.height for s in sprites)
+        fx, fy = ANCHORS[anchor]
+        x = max(0, margin + round(fx * (width - 2 * margin - row_width)))
+        y = max(0, margin + round(fy * (height - 2 * margin - row_height)))
+        for sprite in sprites:
+            # Align each logo with the anchored edge of the row
+            image.alpha_composite(sprite, (x, y + round(fy * (row_height - sprite.height))))
+            x += sprite.width + margin
+
+    if not has_alpha or image_format == 'JPEG':
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **({'quality': 95} if image_format in ('JPEG', 'WEBP') else {}))
+    return buffer.getvalue()
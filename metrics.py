@@ -0,0 +1,192 @@
+"""
+Per-stage timing metrics
+Opt-in instrumentation for the generation scripts: how long each request spent loading
+references, building the request, waiting on the network/model, decoding and saving,
+plus payload sizes and retry counts. Written as JSON lines (one record per request) or
+as a Prometheus text file for the node_exporter textfile collector
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from image_io import atomic_write
+
+STAGES = ('references', 'build', 'network', 'decode', 'save')
+
+# Upper bounds (seconds) of the Prometheus histogram buckets
+HISTOGRAM_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+_COUNTERS = ('request_bytes', 'response_bytes', 'attempts', 'retries', 'hedges', 'images')
+
+
+def payload_bytes(contents):
+    """
+    Bytes of prompt text and inline image data in a request's contents (uploaded
+    file handles cost nothing per request).
+    """
+    parts = [contents] if isinstance(contents, str) else contents
+    total = 0
+    for part in parts:
+        if isinstance(part, str):
+            total += len(part.encode('utf-8'))
+        elif isinstance(part, dict) and 'data' in part:
+            total += len(part['data'])
+    return total
+
+
+class RequestMetrics:
+    """
+    Measurements for one generation request; cheap enough to collect unconditionally.
+    """
+
+    def __init__(self, script, job=None):
+        self.script = script
+        self.job = job
+        self.stages = {}
+        self.counters = dict.fromkeys(_COUNTERS, 0)
+        self.cache_hit = False
+        self.ok = False
+        self.started = time.time()
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def add(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_stats(self, stats):
+        """
+        Fold in the attempt/retry/hedge counts filled in by RequestExecutor.run.
+        """
+        for name in ('attempts', 'retries', 'hedges'):
+            self.add(name, stats.get(name, 0))
+
+    def record(self, run_id):
+        return {
+            'run_id': run_id,
+            'script': self.script,
+            'job': self.job,
+            'timestamp': self.started,
+            'ok': self.ok,
+            'cache_hit': self.cache_hit,
+            'total_seconds': round(self.elapsed(), 6),
+            'stages': {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            **self.counters,
+        }
+
+
+class MetricsSink:
+    """
+    Destination for finished RequestMetrics. Paths ending in .prom are written as a
+    Prometheus text file (rewritten after every request), anything else gets one JSON
+    line appended per request.
+
+    The text file holds only this process's totals, so each process writes its own
+    <name>.<pid>.prom next to the given path, with a matching process label; concurrent
+    runs pointed at the same path would otherwise overwrite each other's counters.
+    """
+
+    def __init__(self, path, run_id=None):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.prometheus = path.endswith('.prom')
+        if self.prometheus:
+            path = f"{path[:-len('.prom')]}.{os.getpid()}.prom"
+        self.path = path
+        self.lock = threading.Lock()
+        # (script, stage) -> [bucket counts..., sum, count]
+        self.histograms = {}
+        # (script, counter) -> total
+        self.totals = {}
+        self.requests = {}
+
+    def emit(self, metrics):
+        record = metrics.record(self.run_id)
+        with self.lock:
+            if not self.prometheus:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                os.makedirs(directory, exist_ok=True)
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+                return
+            self._aggregate(record)
+            atomic_write(self.path, self._render().encode('utf-8'))
+
+    def _aggregate(self, record):
+        script = record['script']
+        outcome = 'cache_hit' if record['cache_hit'] else 'ok' if record['ok'] else 'error'
+        self.requests[(script, outcome)] = self.requests.get((script, outcome), 0) + 1
+        stages = dict(record['stages'], total=record['total_seconds'])
+        for stage, seconds in stages.items():
+            histogram = self.histograms.setdefault((script, stage), [0] * (len(HISTOGRAM_BUCKETS) + 2))
+            for index, bound in enumerate(HISTOGRAM_BUCKETS):
+                if seconds <= bound:
+                    histogram[index] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+        for name in _COUNTERS:
+            self.totals[(script, name)] = self.totals.get((script, name), 0) + record[name]
+
+    def _render(self):
+        run = f'run_id="{self.run_id}",process="{os.getpid()}"'
+        lines = [
+            '# HELP thumbnail_requests_total Generation requests by outcome',
+            '# TYPE thumbnail_requests_total counter',
+        ]
+        for (script, outcome), count in sorted(self.requests.items()):
+            lines.append(f'thumbnail_requests_total{{{run},script="{script}",outcome="{outcome}"}} {count}')
+
+        lines += [
+            '# HELP thumbnail_stage_seconds Time spent per request in each stage',
+            '# TYPE thumbnail_stage_seconds histogram',
+        ]
+        for (script, stage), histogram in sorted(self.histograms.items()):
+            labels = f'{run},script="{script}",stage="{stage}"'
+            for bound, count in zip(HISTOGRAM_BUCKETS, histogram):
+                lines.append(f'thumbnail_stage_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'thumbnail_stage_seconds_bucket{{{labels},le="+Inf"}} {histogram[-1]}')
+            lines.append(f'thumbnail_stage_seconds_sum{{{labels}}} {histogram[-2]:.6f}')
+            lines.append(f'thumbnail_stage_seconds_count{{{labels}}} {histogram[-1]}')
+
+        for name in _COUNTERS:
+            metric = f'thumbnail_{name}_total'
+            lines += [f'# TYPE {metric} counter']
+            for (script, counter), total in sorted(self.totals.items()):
+                if counter == name:
+                    lines.append(f'{metric}{{{run},script="{script}"}} {total}')
+        return '\n'.join(lines) + '\n'
+
+
+# Set by the CLIs' --metrics option; nothing is written while it is None
+DEFAULT_SINK = None
+
+
+def configure(path, run_id=None):
+    """
+    Start writing metrics to path (None turns metrics off). The run id defaults to
+    $THUMBNAIL_RUN_ID, or a random id shared by every record of this process.
+    """
+    global DEFAULT_SINK
+    DEFAULT_SINK = MetricsSink(path, run_id or os.getenv('THUMBNAIL_RUN_ID')) if path else None
+    return DEFAULT_SINK
+
+
+def current_run_id():
+    return DEFAULT_SINK.run_id if DEFAULT_SINK is not None else None
+
+
+def emit(metrics):
+    if DEFAULT_SINK is not None:
+        DEFAULT_SINK.emit(metrics)
@@ -0,0 +1,252 @@
+"""
+Content-addressed archive of generated images
+Every saved output is also stored under its SHA-256 and indexed in SQLite with the prompt,
+reference set, style, logos, model, settings and timings that produced it, so past
+thumbnails can be searched and regenerated. Index writes are queued and committed in
+batches on a background thread, off the generation path
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from image_io import atomic_write
+from reference_cache import content_hash
+
+DEFAULT_ARCHIVE_DIR = os.getenv('THUMBNAIL_ARCHIVE_DIR', './archive')
+
+# Queued records are committed together once this many are waiting, or after FLUSH_SECONDS
+BATCH_SIZE = 50
+FLUSH_SECONDS = 2.0
+
+_EXTENSIONS = {'image/png': '.png', 'image/jpeg': '.jpg', 'image/webp': '.webp'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sha256 TEXT NOT NULL,
+    object_path TEXT NOT NULL,
+    output_path TEXT,
+    created REAL NOT NULL,
+    script TEXT,
+    run_id TEXT,
+    prompt TEXT,
+    final_prompt TEXT,
+    references_hash TEXT,
+    reference_paths TEXT,
+    style TEXT,
+    logos TEXT,
+    draft TEXT,
+    model TEXT,
+    aspect_ratio TEXT,
+    resolution TEXT,
+    variant TEXT,
+    cache_hit INTEGER,
+    seconds REAL,
+    stages TEXT,
+    composite_logos INTEGER
+);
+CREATE INDEX IF NOT EXISTS outputs_created ON outputs (created);
+CREATE INDEX IF NOT EXISTS outputs_sha256 ON outputs (sha256);
+"""
+
+# Columns added after the first release: name -> type, added to older indexes on open
+_ADDED_COLUMNS = {'composite_logos': 'INTEGER'}
+
+# Columns searched by query() terms
+_SEARCH_COLUMNS = ('prompt', 'logos', 'style', 'output_path')
+
+
+def references_hash(paths):
+    """
+    Order-independent hash of a reference set's contents.
+    """
+    hashes = sorted(content_hash(path) for path in paths if path and os.path.exists(path))
+    return hashlib.sha256('\n'.join(hashes).encode('utf-8')).hexdigest() if hashes else None
+
+
+class OutputArchive:
+    """
+    Object store plus SQLite index, written by a single background thread.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or DEFAULT_ARCHIVE_DIR
+        self.db_path = os.path.join(self.root, 'index.sqlite')
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        os.makedirs(self.root, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.executescript(_SCHEMA)
+        existing = {row['name'] for row in conn.execute("PRAGMA table_info(outputs)")}
+        for column, column_type in _ADDED_COLUMNS.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE outputs ADD COLUMN {column} {column_type}")
+        return conn
+
+    def record(self, image_data, mime_type=None, output_path=None, **fields):
+        """
+        Queue one generated image and its metadata. Returns immediately; the object file
+        and index row are written by the background writer.
+
+        Fields: script, run_id, prompt, final_prompt, references, style, logos, composite_logos,
+        draft, model, aspect_ratio, resolution, variant, cache_hit, seconds, stages
+        """
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._writer, daemon=True)
+                self.thread.start()
+                atexit.register(self.close)
+        self.queue.put((image_data, mime_type, output_path, fields, time.time()))
+
+    def _store(self, image_data, mime_type, output_path, fields, created):
+        sha256 = hashlib.sha256(image_data).hexdigest()
+        ext = _EXTENSIONS.get(mime_type) or os.path.splitext(output_path or '')[1] or '.bin'
+        object_path = os.path.join(self.root, 'objects', sha256[:2], sha256 + ext)
+        if not os.path.exists(object_path):
+            atomic_write(object_path, image_data)
+
+        references = [os.path.abspath(p) for p in fields.get('references') or []]
+        logos = fields.get('logos') or []
+        logos = [logos] if isinstance(logos, str) else logos
+        style = fields.get('style')
+        return (
+            sha256, object_path, os.path.abspath(output_path) if output_path else None, created,
+            fields.get('script'), fields.get('run_id'), fields.get('prompt'), fields.get('final_prompt'),
+            references_hash(references), json.dumps(references), os.path.abspath(style) if style else None,
+            json.dumps([os.path.abspath(p) for p in logos]), fields.get('draft'), fields.get('model'),
+            fields.get('aspect_ratio'), fields.get('resolution'), fields.get('variant'),
+            int(bool(fields.get('cache_hit'))), fields.get('seconds'), json.dumps(fields.get('stages') or {}),
+            int(bool(fields.get('composite_logos'))),
+        )
+
+    def _writer(self):
+        conn = self._connect()
+        stop = False
+        while not stop:
+            items = []
+            deadline = time.monotonic() + FLUSH_SECONDS
+            while len(items) < BATCH_SIZE:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                items.append(item)
+            if not items:
+                continue
+
+            rows = []
+            for item in items:
+                try:
+                    rows.append(self._store(*item))
+                except Exception as e:
+                    print(f"   ⚠️  Could not archive {item[2] or 'output'}: {e}")
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO outputs (sha256, object_path, output_path, created, script, run_id, prompt, "
+                        "final_prompt, references_hash, reference_paths, style, logos, draft, model, aspect_ratio, "
+                        "resolution, variant, cache_hit, seconds, stages, composite_logos) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            except sqlite3.Error as e:
+                print(f"   ⚠️  Could not update the archive index: {e}")
+            for _ in items:
+                self.queue.task_done()
+        conn.close()
+
+    def flush(self):
+        """
+        Block until every queued record has been written.
+        """
+        if self.thread is not None:
+            self.queue.join()
+
+    def close(self):
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.queue.put(None)
+            thread.join()
+
+    def query(self, terms=(), since_days=None, limit=20):
+        """
+        Search the index. Every term must appear (case-insensitively) in the prompt, logos,
+        style or output path. Newest first.
+
+        Returns:
+            List of sqlite3.Row
+        """
+        self.flush()
+        clauses, params = [], []
+        for term in terms:
+            clauses.append('(' + ' OR '.join(f"{column} LIKE ?" for column in _SEARCH_COLUMNS) + ')')
+            params.extend([f"%{term}%"] * len(_SEARCH_COLUMNS))
+        if since_days is not None:
+            clauses.append("created >= ?")
+            params.append(time.time() - since_days * 86400)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        conn = self._connect()
+        try:
+            return conn.execute(f"SELECT * FROM outputs {where} ORDER BY created DESC, id DESC LIMIT ?",
+                                params + [limit]).fetchall()
+        finally:
+            conn.close()
+
+    def get(self, ref):
+        """
+        Look up one record by id or by (a prefix of) its image hash.
+        """
+        self.flush()
+        conn = self._connect()
+        try:
+            if str(ref).isdigit():
+                row = conn.execute("SELECT * FROM outputs WHERE id = ?", (int(ref),)).fetchone()
+                if row:
+                    return row
+            return conn.execute("SELECT * FROM outputs WHERE sha256 LIKE ? ORDER BY created DESC LIMIT 1",
+                                (f"{ref}%",)).fetchone()
+        finally:
+            conn.close()
+
+
+def describe(row):
+    """
+    One-line summary of an index row for CLI listings.
+    """
+    created = time.strftime('%Y-%m-%d %H:%M', time.localtime(row['created']))
+    logos = ', '.join(os.path.basename(p) for p in json.loads(row['logos'] or '[]'))
+    extras = [row['resolution'] or '', row['aspect_ratio'] or '']
+    if logos:
+        extras.append(f"logos: {logos}")
+    return (f"#{row['id']:<5} {created}  {row['sha256'][:10]}  {' | '.join(e for e in extras if e)}\n"
+            f"       {row['prompt']}\n"
+            f"       {row['output_path'] or row['object_path']}")
+
+
+# Shared instance; the CLIs turn it off with --no-archive
+DEFAULT_ARCHIVE = OutputArchive()
+_enabled = True
+
+
+def configure(enabled=True, root=None):
+    global DEFAULT_ARCHIVE, _enabled
+    _enabled = enabled
+    if root:
+        DEFAULT_ARCHIVE = OutputArchive(root)
+
+
+def record(image_data, mime_type=None, output_path=None, **fields):
+    if _enabled:
+        DEFAULT_ARCHIVE.record(image_data, mime_type, output_path, **fields)
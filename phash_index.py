@@ -0,0 +1,203 @@
+"""
+Perceptual-hash index for generated thumbnails
+64-bit DCT hashes compared with vectorized Hamming distances, so a new image can be
+checked against tens of thousands of archived thumbnails in milliseconds. Archive hashes
+are cached on disk and only recomputed for files whose mtime or size changed
+"""
+
+import glob
+import io
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+from image_io import CACHE_DIR, atomic_write
+
+# Archive of previously published thumbnails
+DEFAULT_ARCHIVE = "./past thumbnails"
+
+DEFAULT_INDEX_PATH = os.path.join(CACHE_DIR, 'phash_index.npz')
+
+# Hashes within this many differing bits (of 64) are treated as near-duplicates
+DEFAULT_THRESHOLD = 10
+
+_HASH_SIZE = 8
+_SAMPLE_SIZE = 32
+_IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png', '*.webp')
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix(_SAMPLE_SIZE)
+_BIT_WEIGHTS = (np.uint64(1) << np.arange(_HASH_SIZE * _HASH_SIZE, dtype=np.uint64))
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _sample(path):
+    """
+    Decode an image to a 32x32 greyscale float array (JPEG decoding is downscaled early).
+    """
+    with Image.open(path) as img:
+        img.draft('L', (_SAMPLE_SIZE * 4, _SAMPLE_SIZE * 4))
+        return np.asarray(img.convert('L').resize((_SAMPLE_SIZE, _SAMPLE_SIZE), Image.BILINEAR), dtype=np.float32)
+
+
+def phash_many(paths):
+    """
+    Perceptual hashes of many images: one batched 2-D DCT over all samples, keeping the
+    8x8 low-frequency block and thresholding at its median.
+
+    Returns:
+        uint64 array aligned with paths
+    """
+    if not paths:
+        return np.zeros(0, dtype=np.uint64)
+    samples = np.stack([_sample(path) for path in paths])
+    coefficients = np.einsum('ij,njk,lk->nil', _DCT, samples, _DCT)[:, :_HASH_SIZE, :_HASH_SIZE]
+    flat = coefficients.reshape(len(paths), -1)
+    # The DC term only reflects overall brightness; leave it out of the median
+    bits = flat > np.median(flat[:, 1:], axis=1, keepdims=True)
+    return (bits.astype(np.uint64) * _BIT_WEIGHTS).sum(axis=1, dtype=np.uint64)
+
+
+def phash(path):
+    return int(phash_many([path])[0])
+
+
+def hamming(hash_value, hashes):
+    """
+    Bit distances between one hash and an array of hashes.
+    """
+    xor = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.uint64(hash_value))
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(xor).astype(np.int64)
+    return _POPCOUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.int64)
+
+
+class PHashIndex:
+    """
+    Hashes of every image in a folder, persisted as .npz and refreshed incrementally.
+    """
+
+    def __init__(self, folder=DEFAULT_ARCHIVE, index_path=None):
+        self.folder = folder
+        self.index_path = index_path or DEFAULT_INDEX_PATH
+        self.paths = []
+        self.hashes = np.zeros(0, dtype=np.uint64)
+
+    def _image_files(self):
+        files = set()
+        for pattern in _IMAGE_PATTERNS:
+            files.update(glob.glob(os.path.join(self.folder, '**', pattern), recursive=True))
+            files.update(glob.glob(os.path.join(self.folder, '**', pattern.upper()), recursive=True))
+        return sorted(os.path.abspath(f) for f in files)
+
+    def refresh(self):
+        """
+        Load the cached hashes and rehash only new or changed files.
+
+        Returns:
+            self
+        """
+        cached = {}
+        try:
+            with np.load(self.index_path) as data:
+                for path, mtime, size, value in zip(data['paths'], data['mtimes'], data['sizes'], data['hashes']):
+                    cached[str(path)] = (float(mtime), int(size), value)
+        except (OSError, ValueError, KeyError):
+            pass
+
+        paths, mtimes, sizes, hashes, stale = [], [], [], [], []
+        for path in self._image_files():
+            stat = os.stat(path)
+            entry = cached.get(path)
+            paths.append(path)
+            mtimes.append(stat.st_mtime)
+            sizes.append(stat.st_size)
+            if entry and entry[0] == stat.st_mtime and entry[1] == stat.st_size:
+                hashes.append(entry[2])
+            else:
+                hashes.append(np.uint64(0))
+                stale.append(len(paths) - 1)
+
+        hashes = np.array(hashes, dtype=np.uint64)
+        if stale:
+            print(f"   🔎 Hashing {len(stale)} new archive image(s)...")
+            hashes[stale] = phash_many([paths[i] for i in stale])
+
+        if stale or len(paths) != len(cached):
+            buffer = io.BytesIO()
+            np.savez(buffer, paths=np.array(paths, dtype=str), mtimes=np.array(mtimes),
+                     sizes=np.array(sizes, dtype=np.int64), hashes=hashes)
+            atomic_write(self.index_path, buffer.getvalue())
+
+        self.paths, self.hashes = paths, hashes
+        return self
+
+    def nearest(self, hash_value):
+        """
+        Return (path, distance) of the closest archived image, or (None, None) if empty.
+        """
+        if not len(self.hashes):
+            return None, None
+        distances = hamming(hash_value, self.hashes)
+        index = int(distances.argmin())
+        return self.paths[index], int(distances[index])
+
+    def rank(self, paths):
+        """
+        Rank new images by distance to their nearest archived thumbnail, most novel first.
+
+        Returns:
+            [(path, distance, nearest archived path)]
+        """
+        ranked = []
+        for path, value in zip(paths, phash_many(list(paths))):
+            nearest, distance = self.nearest(value)
+            ranked.append((path, distance, nearest))
+        return sorted(ranked, key=lambda item: -1 if item[1] is None else item[1], reverse=True)
+
+
+class DuplicateTracker:
+    """
+    Flags near-duplicates among the outputs of one batch as they arrive.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, max_duplicates=None):
+        self.threshold = threshold
+        self.max_duplicates = max_duplicates
+        self.paths = []
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.duplicates = []
+        self.lock = threading.Lock()
+
+    def add(self, path):
+        """
+        Hash a new output and compare it with the earlier ones.
+
+        Returns:
+            (path of the near-identical earlier output, distance), or (None, None)
+        """
+        value = phash(path)
+        with self.lock:
+            match, distance = None, None
+            if len(self.hashes):
+                distances = hamming(value, self.hashes)
+                index = int(distances.argmin())
+                if distances[index] <= self.threshold:
+                    match, distance = self.paths[index], int(distances[index])
+                    self.duplicates.append((path, match, distance))
+            self.paths.append(path)
+            self.hashes = np.append(self.hashes, np.uint64(value))
+            return match, distance
+
+    def should_stop(self):
+        with self.lock:
+            return self.max_duplicates is not None and len(self.duplicates) >= self.max_duplicates
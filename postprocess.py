@@ -0,0 +1,235 @@
+"""
+YouTube-ready post-processing
+Derives upload-ready variants (1280x720 JPEG under YouTube's 2 MB limit, a 9:16 Shorts
+crop, WebP and grid previews) from each generated thumbnail. Work runs in a process pool
+so resizing and encoding overlap with generation requests still in flight
+"""
+
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# name -> (width, height, format, max_bytes or None)
+PRESETS = {
+    'youtube': (1280, 720, 'JPEG', 2 * 1024 * 1024),
+    'shorts': (1080, 1920, 'JPEG', 2 * 1024 * 1024),
+    'webp': (1280, 720, 'WEBP', None),
+    'grid': (320, 180, 'JPEG', 50 * 1024),
+}
+
+DEFAULT_VARIANTS = ('youtube', 'webp', 'grid')
+
+_EXTENSIONS = {'JPEG': '.jpg', 'WEBP': '.webp', 'PNG': '.png'}
+
+# Quality search bounds for lossy formats
+MAX_QUALITY = 95
+MIN_QUALITY = 40
+
+
+def parse_variants(spec):
+    """
+    Parse a comma-separated variant list. Each item is a preset name or a custom
+    "name=WIDTHxHEIGHT:FORMAT[:MAX_KB]" definition, e.g. "youtube,banner=2560x1440:jpeg:4000".
+
+    Returns:
+        [(name, width, height, format, max_bytes)]
+    """
+    variants = []
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        if '=' not in item:
+            if item not in PRESETS:
+                raise ValueError(f"unknown variant '{item}' (presets: {', '.join(PRESETS)})")
+            variants.append((item, *PRESETS[item]))
+            continue
+        name, definition = item.split('=', 1)
+        fields = definition.split(':')
+        width, height = (int(x) for x in fields[0].lower().split('x'))
+        fmt = fields[1].upper() if len(fields) > 1 else 'JPEG'
+        fmt = 'JPEG' if fmt == 'JPG' else fmt
+        if fmt not in _EXTENSIONS:
+            raise ValueError(f"unsupported format '{fmt}' for variant '{name}'")
+        max_bytes = int(float(fields[2]) * 1024) if len(fields) > 2 else None
+        variants.append((name, width, height, fmt, max_bytes))
+    return variants
+
+
+def encode_within_budget(image, fmt, max_bytes=None):
+    """
+    Encode image, binary-searching the highest quality whose output fits max_bytes.
+
+    Returns:
+        (encoded bytes, quality used or None for lossless formats)
+    """
+    def encode(quality=None):
+        buffer = io.BytesIO()
+        options = {'optimize': True}
+        if quality is not None:
+            options['quality'] = quality
+        if fmt == 'JPEG':
+            options['progressive'] = True
+        image.save(buffer, format=fmt, **options)
+        return buffer.getvalue()
+
+    if fmt == 'PNG':
+        return encode(), None
+
+    best = encode(MAX_QUALITY)
+    if max_bytes is None or len(best) <= max_bytes:
+        return best, MAX_QUALITY
+
+    low, high, quality = MIN_QUALITY, MAX_QUALITY - 1, MIN_QUALITY
+    best = None
+    while low <= high:
+        mid = (low + high) // 2
+        data = encode(mid)
+        if len(data) <= max_bytes:
+            best, quality = data, mid
+            low = mid + 1
+        else:
+            high = mid - 1
+    if best is None:
+        # Even the lowest quality is over budget; return it and let the caller report it
+        return encode(MIN_QUALITY), MIN_QUALITY
+    return best, quality
+
+
+def derive_variants(source_path, variants):
+    """
+    Produce every variant of one image. Runs inside a worker process.
+
+    Returns:
+        [(variant name, output path, size in bytes, quality, within budget)]
+    """
+    from PIL import Image, ImageOps
+
+    from image_io import atomic_write
+
+    base_name = os.path.splitext(source_path)[0]
+    results = []
+    with Image.open(source_path) as source:
+        source.load()
+        for name, width, height, fmt, max_bytes in variants:
+            # Cover-crop to the target aspect ratio around the centre, then resize
+            image = ImageOps.fit(source, (width, height), Image.LANCZOS, centering=(0.5, 0.5))
+            if fmt == 'JPEG' and image.mode != 'RGB':
+                image = image.convert('RGB')
+            data, quality = encode_within_budget(image, fmt, max_bytes)
+            output_path = f"{base_name}_{name}{_EXTENSIONS[fmt]}"
+            atomic_write(output_path, data)
+            results.append((name, output_path, len(data), quality, max_bytes is None or len(data) <= max_bytes))
+    return results
+
+
+class PostProcessor:
+    """
+    Process pool that derives variants for each submitted image in the background.
+    variants is the default for submit() (None when every caller brings its own).
+    """
+
+    def __init__(self, variants=None, workers=None):
+        self.variants = variants
+        # Workers start on the first submit, from generation threads while HTTP requests are in
+        # flight; forking a threaded process can deadlock, so they come from a fork server
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        self.futures = []
+
+    def submit(self, source_path, variants=None, track=True):
+        """
+        Queue source_path. Tracked work is reported by finish(); untracked work belongs to a
+        caller that waits for it with wait().
+
+        Returns:
+            (source_path, future) for wait()
+        """
+        submitted = (source_path, self.executor.submit(derive_variants, source_path, variants or self.variants))
+        if track:
+            self.futures.append(submitted)
+        return submitted
+
+    def wait(self, submitted):
+        """
+        Wait for [(source_path, future)] from submit() and print what each produced.
+
+        Returns:
+            {source path: [derived output paths]}
+        """
+        outputs = {}
+        if submitted:
+            print(f"\n🖼️  Post-processing {len(submitted)} image(s)...")
+        for source_path, future in submitted:
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"   ✗ {os.path.basename(source_path)}: {e}")
+                continue
+            outputs[source_path] = [path for _, path, _, _, _ in results]
+            for name, path, size, quality, within_budget in results:
+                note = f" q{quality}" if quality else ""
+                warning = "  ⚠️ over budget" if not within_budget else ""
+                print(f"   ✓ {name}: {path} ({size / 1024:.0f} KB{note}){warning}")
+        return outputs
+
+    def finish(self):
+        """
+        Wait for all tracked work, print a summary and shut the pool down.
+
+        Returns:
+            {source path: [derived output paths]}
+        """
+        outputs = self.wait(self.futures)
+        self.executor.shutdown()
+        self.futures = []
+        return outputs
+
+
+# Set by the CLI's --derive option; generation code submits to it when present
+DEFAULT_POSTPROCESSOR = None
+# False under --serve, where each request derives its own outputs with derive_now()
+_auto_submit = True
+
+
+def configure(spec, workers=None, serve=False):
+    """
+    Enable post-processing for the given variant spec (None disables it).
+
+    With serve, one pool is kept for the life of the service even without a spec (its
+    workers only start on first use), and generation code does not submit to it: every
+    request derives and waits for its own outputs through derive_now().
+    """
+    global DEFAULT_POSTPROCESSOR, _auto_submit
+    variants = parse_variants(spec) if spec else None
+    DEFAULT_POSTPROCESSOR = PostProcessor(variants, workers=workers) if variants or serve else None
+    _auto_submit = not serve
+    return DEFAULT_POSTPROCESSOR
+
+
+def submit(source_path):
+    """
+    Queue source_path for post-processing if a post-processor is configured.
+    """
+    if DEFAULT_POSTPROCESSOR is not None and _auto_submit:
+        DEFAULT_POSTPROCESSOR.submit(source_path)
+
+
+def derive_now(source_paths, spec=None):
+    """
+    Derive variants of already saved images on the shared pool and wait for them (used per
+    request by the service). spec defaults to the one the pool was configured with.
+
+    Returns:
+        {source path: [derived output paths]}
+    """
+    variants = parse_variants(spec) if spec else DEFAULT_POSTPROCESSOR and DEFAULT_POSTPROCESSOR.variants
+    if not source_paths or not variants:
+        return {}
+    return DEFAULT_POSTPROCESSOR.wait([DEFAULT_POSTPROCESSOR.submit(path, variants, track=False)
+                                       for path in source_paths])
+
+
+def finish():
+    if DEFAULT_POSTPROCESSOR is not None:
+        return DEFAULT_POSTPROCESSOR.finish()
+    return {}
@@ -0,0 +1,193 @@
+"""
+Cross-process rate limiter and quota scheduler
+A token bucket (requests per minute) plus an in-flight cap per model, with state in a
+local SQLite database so every script and process on the machine shares one quota.
+Callers wait for a slot instead of tripping 429s together
+"""
+
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from image_io import CACHE_DIR
+
+# Shared by all scripts
+DEFAULT_DB_PATH = os.path.join(CACHE_DIR, 'rate_limits.sqlite')
+
+# Leases older than this are assumed to belong to a crashed process
+LEASE_TTL_SECONDS = 900
+
+# The bucket holds this many seconds' worth of requests, bounding bursts after idle periods
+BURST_SECONDS = 10
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS limits (
+    model TEXT PRIMARY KEY,
+    rpm REAL,
+    max_in_flight INTEGER
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    model TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    acquired REAL NOT NULL
+);
+"""
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class RateLimiter:
+    """
+    Token-bucket scheduler backed by SQLite.
+
+    Limits are stored per model in the database, so setting them once (e.g. from one
+    process's --rpm) applies to every other process using the same database. Models
+    without stored limits are not throttled.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or DEFAULT_DB_PATH
+        self._initialized = False
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        if not self._initialized:
+            conn.executescript(_SCHEMA)
+            self._initialized = True
+        return conn
+
+    def set_limits(self, model, rpm=None, max_in_flight=None):
+        """
+        Store limits for a model; None leaves that limit unchanged.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT rpm, max_in_flight FROM limits WHERE model = ?", (model,)).fetchone()
+            current_rpm, current_in_flight = row if row else (None, None)
+            conn.execute(
+                "INSERT OR REPLACE INTO limits (model, rpm, max_in_flight) VALUES (?, ?, ?)",
+                (model, rpm if rpm is not None else current_rpm,
+                 max_in_flight if max_in_flight is not None else current_in_flight),
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _try_acquire(self, conn, model):
+        """
+        One scheduling step inside a write transaction.
+
+        Returns:
+            (lease_id or None, seconds to wait before retrying); lease_id is 0 when the
+            model is unlimited
+        """
+        row = conn.execute("SELECT rpm, max_in_flight FROM limits WHERE model = ?", (model,)).fetchone()
+        if row is None or (row[0] is None and row[1] is None):
+            return 0, 0.0
+        rpm, max_in_flight = row
+        now = time.time()
+
+        # Reclaim leases from crashed or stuck processes
+        for lease_id, pid, acquired in conn.execute(
+                "SELECT id, pid, acquired FROM leases WHERE model = ?", (model,)).fetchall():
+            if now - acquired > LEASE_TTL_SECONDS or not _pid_alive(pid):
+                conn.execute("DELETE FROM leases WHERE id = ?", (lease_id,))
+
+        if max_in_flight:
+            in_flight = conn.execute("SELECT COUNT(*) FROM leases WHERE model = ?", (model,)).fetchone()[0]
+            if in_flight >= max_in_flight:
+                return None, 0.25
+
+        if rpm:
+            capacity = max(1.0, rpm / 60 * BURST_SECONDS)
+            bucket = conn.execute("SELECT tokens, updated FROM buckets WHERE model = ?", (model,)).fetchone()
+            tokens, updated = bucket if bucket else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated) * rpm / 60)
+            if tokens < 1:
+                conn.execute("INSERT OR REPLACE INTO buckets (model, tokens, updated) VALUES (?, ?, ?)",
+                             (model, tokens, now))
+                return None, (1 - tokens) * 60 / rpm
+            conn.execute("INSERT OR REPLACE INTO buckets (model, tokens, updated) VALUES (?, ?, ?)",
+                         (model, tokens - 1, now))
+
+        cursor = conn.execute("INSERT INTO leases (model, pid, acquired) VALUES (?, ?, ?)",
+                              (model, os.getpid(), now))
+        return cursor.lastrowid, 0.0
+
+    def acquire(self, model, timeout=None, cancel=None):
+        """
+        Block until the model's quota allows another request.
+
+        Args:
+            timeout: Seconds to wait before raising TimeoutError (None waits indefinitely)
+            cancel: Optional threading.Event; once set, the wait stops with TimeoutError
+                    without taking a token
+
+        Returns:
+            A lease id to pass to release() (0 when the model is unlimited)
+        """
+        start = time.monotonic()
+        announced = False
+        while True:
+            if cancel is not None and cancel.is_set():
+                raise TimeoutError(f"stopped waiting for {model} quota: the request was abandoned")
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                lease_id, wait = self._try_acquire(conn, model)
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+            if lease_id is not None:
+                return lease_id
+            if timeout is not None and time.monotonic() - start + wait > timeout:
+                raise TimeoutError(f"no {model} quota available within {timeout:.0f}s")
+            if not announced:
+                print(f"   🚦 Waiting for {model} quota...")
+                announced = True
+            if cancel is not None:
+                cancel.wait(min(wait, 5.0))
+            else:
+                time.sleep(min(wait, 5.0))
+
+    def release(self, lease_id):
+        if not lease_id:
+            return
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM leases WHERE id = ?", (lease_id,))
+        finally:
+            conn.close()
+
+    @contextmanager
+    def slot(self, model, timeout=None, cancel=None):
+        """
+        Hold one request slot for model for the duration of the with-block.
+        """
+        lease_id = self.acquire(model, timeout=timeout, cancel=cancel)
+        try:
+            yield
+        finally:
+            self.release(lease_id)
@@ -0,0 +1,204 @@
+"""
+Preprocessing cache for reference images
+Keeps EXIF-corrected, downscaled, re-encoded copies of reference photos so every
+request uploads a few hundred KB instead of the full-resolution originals
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+
+from image_io import CACHE_DIR, atomic_write
+
+# Shared by thumbnail-generator.py and image-to-image.py
+DEFAULT_CACHE_DIR = os.path.join(CACHE_DIR, 'references')
+
+# Gemini tiles input images at 768px, so anything past 2x that is wasted upload
+DEFAULT_MAX_SIDE = 1536
+DEFAULT_QUALITY = 90
+
+_INDEX_FILE = 'index.json'
+
+_memory_cache = {}
+_lock = threading.Lock()
+
+
+def file_sha256(path):
+    """
+    Return the SHA-256 hex digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_index(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, _INDEX_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_index(cache_dir, index):
+    atomic_write(os.path.join(cache_dir, _INDEX_FILE), json.dumps(index, indent=2).encode('utf-8'))
+
+
+def _content_hash(path, cache_dir, data=None, stat=None):
+    """
+    Return the content hash of a source file, reusing the indexed hash while the
+    file's mtime and size are unchanged. When the source changes, the cached
+    variants derived from its old contents are removed. Pass data (the file's
+    contents, read at stat time) to hash it without reading the file again.
+    """
+    abs_path = os.path.abspath(path)
+    stat = stat or os.stat(abs_path)
+    index = _load_index(cache_dir)
+    entry = index.get(abs_path)
+
+    if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+        return entry['sha256']
+
+    sha256 = hashlib.sha256(data).hexdigest() if data is not None else file_sha256(abs_path)
+    if entry and entry['sha256'] != sha256:
+        for name in entry.get('variants', []):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+    index[abs_path] = {
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'sha256': sha256,
+        'variants': entry.get('variants', []) if entry and entry['sha256'] == sha256 else [],
+    }
+    _save_index(cache_dir, index)
+    return sha256
+
+
+def _record_variant(path, cache_dir, name):
+    index = _load_index(cache_dir)
+    entry = index.get(os.path.abspath(path))
+    if entry is not None and name not in entry['variants']:
+        entry['variants'].append(name)
+        _save_index(cache_dir, index)
+
+
+def content_hash(path, cache_dir=None, data=None):
+    """
+    Return the SHA-256 of a file's contents, served from the index while it is unchanged.
+    """
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    with _lock:
+        os.makedirs(cache_dir, exist_ok=True)
+        return _content_hash(path, cache_dir, data)
+
+
+def probe_image(path, cache_dir=None):
+    """
+    Check that a file is a readable image by parsing only its header (format, size and
+    mode, no pixel decode). Results are kept in the index and reused while the file's
+    mtime and size are unchanged.
+
+    Returns:
+        (info, data): info is a dict with 'format', 'width', 'height' and 'mode'; data is
+        the file's contents when it had to be read (hand it to load_reference so the file
+        is not read again), or None on an index hit
+
+    Raises:
+        OSError if the file is missing or is not a recognised image
+    """
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    abs_path = os.path.abspath(path)
+    stat = os.stat(abs_path)
+    with _lock:
+        entry = _load_index(cache_dir).get(abs_path)
+    if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size and 'probe' in entry:
+        return entry['probe'], None
+
+    from PIL import Image
+
+    with open(abs_path, 'rb') as f:
+        data = f.read()
+    # Image.open only parses the header; pixels are decoded lazily and never here
+    with Image.open(io.BytesIO(data)) as img:
+        width, height = img.size
+        info = {'format': img.format, 'width': width, 'height': height, 'mode': img.mode}
+    if not width or not height:
+        raise OSError(f"image has no pixels ({width}x{height})")
+
+    with _lock:
+        os.makedirs(cache_dir, exist_ok=True)
+        _content_hash(abs_path, cache_dir, data, stat)
+        index = _load_index(cache_dir)
+        index[abs_path]['probe'] = info
+        _save_index(cache_dir, index)
+    return info, data
+
+
+def _preprocess(source, max_side, quality):
+    """
+    Apply EXIF orientation, downscale so the longest side is at most max_side and
+    re-encode. Images with transparency (logos) stay PNG, everything else is JPEG.
+    source is a path or a file object.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+        buffer = io.BytesIO()
+        if has_alpha:
+            img.save(buffer, format='PNG', optimize=True)
+            return 'image/png', buffer.getvalue()
+
+        img.convert('RGB').save(buffer, format='JPEG', quality=quality, optimize=True)
+        return 'image/jpeg', buffer.getvalue()
+
+
+def load_reference(path, max_side=DEFAULT_MAX_SIDE, quality=DEFAULT_QUALITY, cache_dir=None, data=None):
+    """
+    Load a preprocessed copy of an image, ready to send to the model.
+
+    Entries are keyed by the SHA-256 of the file contents plus the target settings,
+    so they are reused across runs and scripts and go stale automatically when the
+    source photo changes. data is the file's contents if the caller already read
+    them (see probe_image).
+
+    Returns:
+        dict with 'mime_type' and 'data' (encoded bytes), accepted as an inline blob
+        by GenerativeModel.generate_content
+    """
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    sha256 = content_hash(path, cache_dir, data)
+
+    key = f"{sha256}_{max_side}_q{quality}"
+    with _lock:
+        if key in _memory_cache:
+            return _memory_cache[key]
+
+    for ext, mime_type in (('.jpg', 'image/jpeg'), ('.png', 'image/png')):
+        cached_path = os.path.join(cache_dir, key + ext)
+        if os.path.exists(cached_path):
+            with open(cached_path, 'rb') as f:
+                blob = {'mime_type': mime_type, 'data': f.read()}
+            break
+    else:
+        source = io.BytesIO(data) if data is not None else path
+        mime_type, data = _preprocess(source, max_side, quality)
+        name = key + ('.png' if mime_type == 'image/png' else '.jpg')
+        atomic_write(os.path.join(cache_dir, name), data)
+        with _lock:
+            _record_variant(path, cache_dir, name)
+        blob = {'mime_type': mime_type, 'data': data}
+
+    with _lock:
+        _memory_cache[key] = blob
+    return blob
@@ -0,0 +1,177 @@
+"""
+Prompt-aware reference selection
+Picks a small, pose-diverse subset of the reference folder for each prompt instead of the
+first few files: references whose name matches the prompt's expression or pose come first
+("sad" -> 9_front_sad.JPG), the rest are chosen to differ from what is already picked.
+Each reference gets a cheap 8x8 greyscale descriptor, cached by content hash
+"""
+
+import glob
+import json
+import os
+import re
+import threading
+
+from image_io import CACHE_DIR, atomic_write
+from reference_cache import content_hash
+
+DEFAULT_DESCRIPTOR_PATH = os.path.join(CACHE_DIR, 'reference_descriptors.json')
+
+# References sent per request; the model needs a front view or two plus the best matches
+DEFAULT_COUNT = 3
+
+_IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png', '*.webp')
+
+# tag -> words that signal it, in a prompt or in a reference file name
+EXPRESSION_WORDS = {
+    'sad': ('sad', 'upset', 'crying', 'cry', 'disappointed', 'worried', 'defeated', 'regret', 'tired'),
+    'smile': ('smile', 'smiling', 'happy', 'laugh', 'laughing', 'joy', 'cheerful', 'friendly', 'grin'),
+    'sly': ('sly', 'smirk', 'smirking', 'mischievous', 'sneaky', 'suspicious', 'skeptical', 'secret'),
+    'expressive': ('expressive', 'shocked', 'shock', 'surprised', 'amazed', 'astonished', 'screaming',
+                   'scream', 'excited', 'wow', 'omg', 'angry', 'mouth open'),
+    'neutral': ('neutral', 'serious', 'calm', 'focused', 'confident', 'professional'),
+}
+POSE_WORDS = {
+    'left': ('left',),
+    'right': ('right',),
+    'look': ('look', 'looking', 'glancing', 'glance', 'side', 'profile', 'away'),
+}
+
+_GRID = 8
+_descriptors = {}
+_lock = threading.Lock()
+
+_count = DEFAULT_COUNT
+
+
+def configure(count=None):
+    """
+    Set how many references are picked from a folder (from the CLI's --reference-count).
+    """
+    global _count
+    if count is not None:
+        if count < 1:
+            raise ValueError("the reference count must be at least 1")
+        _count = count
+
+
+def list_images(folder):
+    files = set()
+    for pattern in _IMAGE_PATTERNS:
+        files.update(glob.glob(os.path.join(folder, pattern)))
+        files.update(glob.glob(os.path.join(folder, pattern.upper())))
+    return sorted(files)
+
+
+def _tags(text, vocabulary):
+    text = ' '.join(re.findall(r'[a-z]+', text.lower()))
+    return {tag for tag, words in vocabulary.items()
+            if any(re.search(rf"\b{re.escape(word)}\b", text) for word in words)}
+
+
+def prompt_tags(prompt):
+    return _tags(prompt or '', EXPRESSION_WORDS), _tags(prompt or '', POSE_WORDS)
+
+
+def reference_tags(path):
+    """
+    (expression tags, pose tags) from a file name such as "6_right_angle_look.JPG".
+    Names without left/right count as front-facing.
+    """
+    name = os.path.splitext(os.path.basename(path))[0].replace('_', ' ')
+    poses = _tags(name, POSE_WORDS)
+    if not poses & {'left', 'right'}:
+        poses.add('front')
+    return _tags(name, EXPRESSION_WORDS), poses
+
+
+def _load_descriptors(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _compute(path):
+    """
+    8x8 greyscale grid with its mean removed, so lighting changes matter less than layout.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as img:
+        img.draft('L', (_GRID * 8, _GRID * 8))
+        small = ImageOps.exif_transpose(img).convert('L').resize((_GRID, _GRID), Image.BILINEAR)
+    pixels = list(small.getdata())
+    mean = sum(pixels) / len(pixels)
+    return [round((p - mean) / 255, 4) for p in pixels]
+
+
+def descriptors(paths, descriptor_path=None):
+    """
+    Return {path: descriptor}, computing and caching only references not seen before.
+    """
+    descriptor_path = descriptor_path or DEFAULT_DESCRIPTOR_PATH
+    keys = {path: content_hash(path) for path in paths}
+    with _lock:
+        missing = [path for path, key in keys.items() if key not in _descriptors]
+        if missing:
+            _descriptors.update(_load_descriptors(descriptor_path))
+            missing = [path for path in missing if keys[path] not in _descriptors]
+        if missing:
+            for path in missing:
+                _descriptors[keys[path]] = _compute(path)
+            stored = _load_descriptors(descriptor_path)
+            stored.update({keys[path]: _descriptors[keys[path]] for path in missing})
+            atomic_write(descriptor_path, json.dumps(stored).encode('utf-8'))
+        return {path: _descriptors[key] for path, key in keys.items()}
+
+
+def _distance(a, b):
+    return sum(abs(x - y) for x, y in zip(a, b)) / len(a)
+
+
+def select(paths, prompt=None, count=None):
+    """
+    Pick count references (default: the configured count) for a prompt.
+
+    The first pick is the best match for the prompt's expression and pose tags, falling back
+    to a front-facing photo. A front-facing photo is always included for identity. Each
+    further pick balances prompt relevance against difference in pose and appearance from
+    the references already chosen.
+
+    Returns:
+        The chosen paths, best first
+    """
+    count = count or _count
+    paths = sorted(paths)
+    if len(paths) <= count:
+        return paths
+
+    expressions, poses = prompt_tags(prompt)
+    grids = descriptors(paths)
+    tags = {path: reference_tags(path) for path in paths}
+
+    def relevance(path):
+        ref_expressions, ref_poses = tags[path]
+        return 2 * len(ref_expressions & expressions) + len(ref_poses & poses)
+
+    def is_front(path):
+        return 'front' in tags[path][1]
+
+    # Ties go to front-facing photos, then to the plainest one (fewest tags), then by name
+    chosen = [max(paths, key=lambda p: (relevance(p), is_front(p), -len(tags[p][0]), -paths.index(p)))]
+    if not is_front(chosen[0]):
+        fronts = [p for p in paths if is_front(p)]
+        if fronts:
+            chosen.append(max(fronts, key=lambda p: (relevance(p), -len(tags[p][0]), -paths.index(p))))
+
+    while len(chosen) < count:
+        def score(path):
+            pose_novelty = 0 if tags[path][1] & set().union(*(tags[c][1] for c in chosen)) else 1
+            appearance = min(_distance(grids[path], grids[c]) for c in chosen)
+            return 2 * relevance(path) + pose_novelty + 4 * appearance
+
+        remaining = [p for p in paths if p not in chosen]
+        chosen.append(max(remaining, key=lambda p: (score(p), -paths.index(p))))
+    return chosen[:count]
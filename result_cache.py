@@ -0,0 +1,175 @@
+"""
+Result cache for generated images
+Identical requests (same prompt, reference contents, model and settings) are answered
+from disk instead of paying for a new generation. Entries are evicted least-recently-used
+first once the cache exceeds its size budget, and dropped outright past a maximum age
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from image_io import CACHE_DIR, atomic_write
+from reference_cache import content_hash
+
+# Shared by all three scripts
+DEFAULT_CACHE_DIR = os.path.join(CACHE_DIR, 'results')
+DEFAULT_MAX_BYTES = int(float(os.getenv('THUMBNAIL_RESULT_CACHE_MAX_MB', '2048')) * 1024 * 1024)
+DEFAULT_MAX_AGE_DAYS = float(os.getenv('THUMBNAIL_RESULT_CACHE_MAX_AGE_DAYS', '30'))
+
+# Between rescans the size is tracked as entries are stored; the directory is rescanned
+# (expiring old entries and counting other processes' writes) when the budget is exceeded
+# or this long after the last scan
+EVICT_INTERVAL_SECONDS = 3600
+# An over-budget cache is trimmed to this fraction of the budget, so the next puts fit without a rescan
+EVICT_TO_FRACTION = 0.9
+
+# 'use': read and write, 'refresh': ignore hits but store new results (--force), 'off': bypass (--no-cache)
+CACHE_MODES = ('use', 'refresh', 'off')
+
+_MIME_EXTENSIONS = {'image/png': '.png', 'image/jpeg': '.jpg', 'image/webp': '.webp'}
+
+
+def request_key(prompt, image_paths=(), model=None, aspect_ratio=None, resolution=None, **extra):
+    """
+    Canonical hash of a generation request.
+
+    Args:
+        prompt: Final prompt text sent to the model
+        image_paths: Input images in request order; hashed by content, not by path
+        model, aspect_ratio, resolution: Generation settings
+        extra: Any other fields that change the output (candidate count, variant, ...)
+    """
+    canonical = {
+        'prompt': prompt,
+        'images': [content_hash(path) for path in image_paths],
+        'model': model,
+        'aspect_ratio': aspect_ratio,
+        'resolution': resolution,
+        'extra': extra,
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _entry_size(entry_dir):
+    return sum(e.stat().st_size for e in os.scandir(entry_dir))
+
+
+class ResultCache:
+    """
+    Directory-per-entry image cache; an entry's mtime is its last use.
+    """
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES, max_age_days=DEFAULT_MAX_AGE_DAYS, mode='use'):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"cache mode must be one of {CACHE_MODES}")
+        self.root = root or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.mode = mode
+        self.lock = threading.Lock()
+        # Bytes in the cache as of the last scan plus what this process stored since (None: not scanned yet)
+        self.total_bytes = None
+        self.last_scan = 0.0
+
+    def get(self, key, mode=None):
+        """
+        Return the cached [(mime_type, bytes)] for key, or None on a miss.
+        mode overrides the cache's own mode for this call.
+        """
+        if (mode or self.mode) != 'use':
+            return None
+        entry_dir = os.path.join(self.root, key)
+        try:
+            with open(os.path.join(entry_dir, 'meta.json')) as f:
+                meta = json.load(f)
+            if time.time() - meta['created'] > self.max_age:
+                return None
+            images = []
+            for name, mime_type in meta['images']:
+                with open(os.path.join(entry_dir, name), 'rb') as f:
+                    images.append((mime_type, f.read()))
+        except (OSError, ValueError, KeyError):
+            return None
+        os.utime(entry_dir)
+        return images
+
+    def put(self, key, images, mode=None):
+        """
+        Store the images returned for key, then enforce the size and age limits.
+        """
+        if (mode or self.mode) == 'off' or not images:
+            return
+        # The entry is assembled in a private directory and renamed into place as a whole
+        tmp_dir = os.path.join(self.root, f".{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            names = []
+            for index, (mime_type, data) in enumerate(images):
+                name = f"{index}{_MIME_EXTENSIONS.get(mime_type, '.bin')}"
+                atomic_write(os.path.join(tmp_dir, name), data)
+                names.append([name, mime_type])
+            meta = json.dumps({'created': time.time(), 'images': names}).encode('utf-8')
+            atomic_write(os.path.join(tmp_dir, 'meta.json'), meta)
+
+            entry_dir = os.path.join(self.root, key)
+            with self.lock:
+                replaced = _entry_size(entry_dir) if os.path.isdir(entry_dir) else 0
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                os.replace(tmp_dir, entry_dir)
+                if self.total_bytes is not None:
+                    self.total_bytes += sum(len(data) for _, data in images) + len(meta) - replaced
+                due = (self.total_bytes is None or self.total_bytes > self.max_bytes
+                       or time.monotonic() - self.last_scan > EVICT_INTERVAL_SECONDS)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        if due:
+            self.evict()
+
+    def evict(self):
+        """
+        Drop entries older than max_age, then, if the cache exceeds max_bytes,
+        least-recently-used entries until it is back under EVICT_TO_FRACTION of it.
+        """
+        with self.lock:
+            entries = []
+            now = time.time()
+            for name in os.listdir(self.root):
+                path = os.path.join(self.root, name)
+                if name.startswith('.') or not os.path.isdir(path):
+                    continue
+                try:
+                    last_used = os.path.getmtime(path)
+                    size = _entry_size(path)
+                except OSError:
+                    continue
+                if now - last_used > self.max_age:
+                    shutil.rmtree(path, ignore_errors=True)
+                    continue
+                entries.append((last_used, size, path))
+
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * EVICT_TO_FRACTION if total > self.max_bytes else self.max_bytes
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+            self.total_bytes = total
+            self.last_scan = time.monotonic()
+
+
+# Shared instance; the CLIs switch its mode with --force / --no-cache
+DEFAULT_CACHE = ResultCache()
+
+
+def configure(mode):
+    """
+    Set the shared cache's mode ('use', 'refresh' or 'off').
+    """
+    if mode not in CACHE_MODES:
+        raise ValueError(f"cache mode must be one of {CACHE_MODES}")
+    DEFAULT_CACHE.mode = mode
@@ -0,0 +1,201 @@
+"""
+Prompt matrix sweeps
+Expands a template (a prompt with {placeholders} plus the values of each axis) into the
+cross product of thumbnail jobs, drops identical expansions, orders the rest so jobs that
+share a reference/style/logo payload run back to back, and lays the results out on a
+labelled contact sheet
+"""
+
+import hashlib
+import io
+import itertools
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from image_io import atomic_write
+
+# Axes whose values are images sent with the request rather than prompt text
+PAYLOAD_AXES = ('references', 'style', 'logos')
+
+# Template keys copied into every job unless an axis overrides them
+JOB_DEFAULTS = ('references', 'style', 'logos', 'aspect_ratio', 'resolution')
+
+CELL_WIDTH = 320
+_LINE_HEIGHT = 14
+
+
+def _label(value):
+    """
+    Short label for an axis value given as a plain list entry.
+    """
+    if value is None:
+        return 'none'
+    if isinstance(value, list):
+        return '+'.join(_label(v) for v in value) or 'none'
+    value = str(value)
+    if os.path.exists(value):
+        return os.path.splitext(os.path.basename(value))[0]
+    return value
+
+
+def _slug(label):
+    return re.sub(r'[^A-Za-z0-9]+', '-', label).strip('-').lower() or 'x'
+
+
+def axis_values(values):
+    """
+    Normalise an axis to [(label, value)]: a dict maps labels to values, a list uses each
+    value (or a path's file name) as its own label.
+    """
+    if isinstance(values, dict):
+        return [(str(label), value) for label, value in values.items()]
+    if isinstance(values, list):
+        return [(_label(value), value) for value in values]
+    raise ValueError(f"axis values must be a list or an object, not {type(values).__name__}")
+
+
+def load_template(path):
+    with open(path, encoding='utf-8') as f:
+        template = json.load(f)
+    if not isinstance(template, dict) or not template.get('prompt'):
+        raise ValueError(f"{path}: the template must be an object with a 'prompt'")
+    if not isinstance(template.get('axes'), dict) or not template['axes']:
+        raise ValueError(f"{path}: the template needs at least one entry in 'axes'")
+    return template
+
+
+def payload_key(job):
+    """
+    The images a job sends, as a hashable key (jobs with equal keys reuse the same uploads).
+    """
+    logos = job.get('logos')
+    logos = [logos] if isinstance(logos, str) else logos
+    references = job.get('references')
+    return (json.dumps(references), job.get('style') or '', json.dumps(logos or []))
+
+
+def expand(template, output_dir, defaults=None):
+    """
+    Expand the template's axes into jobs. defaults (e.g. the CLI's aspect_ratio and
+    resolution) fill JOB_DEFAULTS that neither the template nor an axis sets, before the
+    job id is computed, so changing them gives new jobs instead of resuming old ones.
+
+    Returns:
+        (jobs, cells): jobs are unique requests in run order, each with an "id", the
+        job_runner fields and its "labels"; cells list every combination in matrix order
+        as (labels, job id), so duplicates point at the same job
+    """
+    axes = [(name, axis_values(values)) for name, values in template['axes'].items()]
+    output_pattern = template.get('output')
+    jobs, cells, outputs = {}, [], set()
+    for combination in itertools.product(*(values for _, values in axes)):
+        labels = {name: label for (name, _), (label, _) in zip(axes, combination)}
+        job = {key: value for key, value in (defaults or {}).items() if key in JOB_DEFAULTS and value is not None}
+        job.update({key: template[key] for key in JOB_DEFAULTS if template.get(key) is not None})
+        prompt_values = dict(template.get('vars') or {})
+        for (name, _), (label, value) in zip(axes, combination):
+            if name in PAYLOAD_AXES:
+                job[name] = value
+                prompt_values[name] = label
+            else:
+                prompt_values[name] = value if isinstance(value, str) else label
+        try:
+            job['prompt'] = template['prompt'].format_map(prompt_values)
+        except KeyError as e:
+            raise ValueError(f"prompt placeholder {e} is not an axis or a 'vars' entry") from None
+
+        canonical = json.dumps({k: job.get(k) for k in ('prompt',) + JOB_DEFAULTS}, sort_keys=True)
+        jid = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+        if jid not in jobs:
+            slugs = {name: _slug(label) for name, label in labels.items()}
+            if output_pattern:
+                try:
+                    output = output_pattern.format_map(slugs)
+                except KeyError as e:
+                    raise ValueError(f"output placeholder {e} is not an axis") from None
+            else:
+                output = os.path.join(output_dir, '_'.join(slugs.values()) + '.png')
+            # A pattern that leaves out an axis would otherwise let distinct jobs overwrite each other
+            if output in outputs:
+                base_name, ext = os.path.splitext(output)
+                output = f"{base_name}_{jid[:6]}{ext}"
+            outputs.add(output)
+            job['output'] = output
+            jobs[jid] = dict(job, id=jid, labels=labels)
+        cells.append((labels, jid))
+
+    # Stable sort: matrix order is kept within each payload group
+    ordered = sorted(jobs.values(), key=payload_key)
+    return ordered, cells
+
+
+def warm(paths, load_image, workers=4):
+    """
+    Load every distinct payload image once, concurrently, before the jobs start, so
+    concurrent jobs find it in the reference/upload caches instead of all preparing it.
+    """
+    paths = sorted(set(paths))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        list(executor.map(load_image, paths))
+    return len(paths)
+
+
+def _font():
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.load_default(size=12)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def contact_sheet(cells, output_path, columns, title=None, cell_width=CELL_WIDTH, aspect_ratio=16 / 9):
+    """
+    Lay out images with their captions in a grid.
+
+    Args:
+        cells: [(image path or None for a failed job, [caption lines])] in grid order
+        columns: Images per row
+        title: Optional line above the grid
+
+    Returns:
+        output_path
+    """
+    from PIL import Image, ImageDraw
+
+    font = _font()
+    columns = max(1, min(columns, len(cells)))
+    rows = (len(cells) + columns - 1) // columns
+    gap = 8
+    image_height = round(cell_width / aspect_ratio)
+    caption_height = max(len(lines) for _, lines in cells) * _LINE_HEIGHT + gap
+    cell_height = image_height + caption_height
+    top = _LINE_HEIGHT + 2 * gap if title else gap
+
+    sheet = Image.new('RGB', (columns * (cell_width + gap) + gap, top + rows * (cell_height + gap)), 'white')
+    draw = ImageDraw.Draw(sheet)
+    if title:
+        draw.text((gap, gap), title, fill='black', font=font)
+
+    for index, (path, lines) in enumerate(cells):
+        x = gap + (index % columns) * (cell_width + gap)
+        y = top + (index // columns) * (cell_height + gap)
+        if path and os.path.exists(path):
+            with Image.open(path) as img:
+                img.draft('RGB', (cell_width, image_height))
+                thumb = img.convert('RGB')
+            thumb.thumbnail((cell_width, image_height), Image.LANCZOS)
+            sheet.paste(thumb, (x + (cell_width - thumb.width) // 2, y + (image_height - thumb.height) // 2))
+        else:
+            draw.rectangle((x, y, x + cell_width - 1, y + image_height - 1), fill=(225, 225, 225))
+            draw.text((x + gap, y + gap), 'failed', fill=(160, 0, 0), font=font)
+        for line_number, line in enumerate(lines):
+            draw.text((x, y + image_height + 4 + line_number * _LINE_HEIGHT), line, fill='black', font=font)
+
+    image_format = 'PNG' if output_path.lower().endswith('.png') else 'JPEG'
+    buffer = io.BytesIO()
+    sheet.save(buffer, format=image_format, **({'quality': 88} if image_format == 'JPEG' else {}))
+    atomic_write(output_path, buffer.getvalue())
+    return output_path
@@ -0,0 +1,32 @@
+"""
+Shared fixtures. The modules under test live at the repository root, next to the scripts
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_gemini_server
+
+
+@pytest.fixture(autouse=True)
+def _isolated_cwd(tmp_path, monkeypatch):
+    # The caches default to ./.cache; keep every test's files out of the checkout
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    """
+    Run fake_gemini_server.py on a free port, point the REST helpers at it and yield its state.
+    """
+    server, state = fake_gemini_server.serve(port=0, batch_delay=0)
+    host, port = server.server_address[:2]
+    monkeypatch.setenv('GEMINI_API_ENDPOINT', f"http://{host}:{port}")
+    monkeypatch.setenv('GEMINI_API_KEY', 'fake')
+    yield state
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+import batch_api
+import output_archive
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    monkeypatch.setattr(output_archive, 'DEFAULT_ARCHIVE', output_archive.OutputArchive(str(tmp_path / 'archive')))
+    monkeypatch.setattr(output_archive, '_enabled', True)
+    yield output_archive.DEFAULT_ARCHIVE
+    output_archive.DEFAULT_ARCHIVE.close()
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    path = tmp_path / 'jobs.jsonl'
+    path.write_text('\n'.join(json.dumps(job) for job in [
+        {'prompt': 'a', 'output': str(tmp_path / 'a.png'), 'resolution': '1K'},
+        {'prompt': 'b', 'aspect_ratio': '9:16', 'resolution': '1K'},
+        {'prompt': 'a', 'output': str(tmp_path / 'a.png'), 'resolution': '1K'},
+    ]) + '\n')
+    return str(path)
+
+
+def build_parts(job):
+    return [f"final {job['prompt']}"]
+
+
+@pytest.mark.parametrize('inline_limit', [batch_api.INLINE_LIMIT_BYTES, 0])
+def test_submitted_jobs_are_collected_to_their_outputs(fake_gemini, archive, jobs, tmp_path, monkeypatch,
+                                                       inline_limit):
+    monkeypatch.setattr(batch_api, 'INLINE_LIMIT_BYTES', inline_limit)
+    state_path = batch_api.submit_jobs(jobs, build_parts, 'fake-model')
+    with open(state_path) as f:
+        state = json.load(f)
+    assert len(state['outputs']) == 2
+
+    assert batch_api.collect_jobs(state_path, poll_interval=0) == (2, 0)
+    for output in state['outputs'].values():
+        with open(output, 'rb') as f:
+            assert f.read(8) == b'\x89PNG\r\n\x1a\n'
+    assert str(tmp_path / 'a.png') in state['outputs'].values()
+
+
+def test_collected_images_are_archived_with_their_job_settings(fake_gemini, archive, jobs):
+    state_path = batch_api.submit_jobs(jobs, build_parts, 'fake-model')
+    batch_api.collect_jobs(state_path, poll_interval=0)
+    rows = {row['prompt']: row for row in archive.query()}
+    assert sorted(rows) == ['a', 'b']
+    assert rows['b']['final_prompt'] == 'final b'
+    assert (rows['b']['aspect_ratio'], rows['b']['resolution'], rows['b']['model']) == ('9:16', '1K', 'fake-model')
+    assert rows['a']['variant'].startswith('batch:')
+
+
+def test_no_archive_skips_the_archive(fake_gemini, archive, jobs, monkeypatch):
+    monkeypatch.setattr(output_archive, '_enabled', False)
+    batch_api.collect_jobs(batch_api.submit_jobs(jobs, build_parts, 'fake-model'), poll_interval=0)
+    assert archive.query() == []
@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+import job_runner
+
+
+def write_jobs(path, *lines):
+    path.write_text('\n'.join(line if isinstance(line, str) else json.dumps(line) for line in lines) + '\n')
+    return str(path)
+
+
+class FakeGenerate:
+    """
+    Stands in for thumbnail generation: writes the output file and records each call.
+    """
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.prompts = []
+
+    def __call__(self, prompt, output_path, **kwargs):
+        self.prompts.append(prompt)
+        if prompt in self.fail:
+            raise RuntimeError(f"cannot render {prompt}")
+        with open(output_path, 'w') as f:
+            f.write(prompt)
+        return output_path
+
+
+def test_job_id_prefers_explicit_id_and_ignores_unknown_fields():
+    assert job_runner.job_id({'id': 7, 'prompt': 'a'}) == '7'
+    assert job_runner.job_id({'prompt': 'a', 'note': 'x'}) == job_runner.job_id({'prompt': 'a'})
+    assert job_runner.job_id({'prompt': 'a'}) != job_runner.job_id({'prompt': 'a', 'resolution': '2K'})
+
+
+def test_iter_jobs_skips_blanks_and_comments_and_rejects_bad_lines(tmp_path):
+    jobs = write_jobs(tmp_path / 'jobs.jsonl', {'prompt': 'a'}, '', '# note', '{not json', {'style': 's'})
+    with pytest.raises(ValueError, match='jobs.jsonl:4'):
+        list(job_runner.iter_jobs(jobs))
+
+    errors = []
+    assert list(job_runner.iter_jobs(jobs, on_error=lambda n, e: errors.append(n))) == [(1, {'prompt': 'a'})]
+    assert errors == [4, 5]
+
+
+def test_run_jobs_maps_fields_and_records_results(tmp_path):
+    jobs = write_jobs(tmp_path / 'jobs.jsonl',
+                      {'prompt': 'a', 'references': ['r.jpg'], 'style': 's.png', 'output': 'a.png'},
+                      {'prompt': 'b'}, {'prompt': 'a', 'references': ['r.jpg'], 'style': 's.png', 'output': 'a.png'})
+    calls = []
+
+    def generate(**kwargs):
+        calls.append(kwargs)
+        return None if kwargs['prompt'] == 'b' else kwargs['output_path']
+
+    assert job_runner.run_jobs(jobs, generate) == (1, 1, 1)  # the repeated line is skipped
+    assert calls[0] == {'prompt': 'a', 'reference_images': ['r.jpg'], 'style_reference': 's.png',
+                        'logo_references': None, 'output_path': 'a.png'}
+    assert calls[1]['output_path'] == f"thumbnail_{job_runner.job_id({'prompt': 'b'})}.png"
+
+    records = job_runner.load_manifest(str(tmp_path / 'jobs.manifest.jsonl'))
+    statuses = sorted((r['line'], r['status'], r['error']) for r in records.values())
+    assert statuses == [(1, 'done', None), (2, 'failed', 'no image returned')]
+
+
+def test_resume_skips_done_jobs_and_retries_the_rest(tmp_path):
+    jobs = write_jobs(tmp_path / 'jobs.jsonl', {'prompt': 'a'}, {'prompt': 'b'}, '{broken', {'prompt': 'c'})
+    first = FakeGenerate(fail={'b'})
+    assert job_runner.run_jobs(jobs, first, concurrency=2) == (2, 2, 0)
+
+    second = FakeGenerate()
+    assert job_runner.run_jobs(jobs, second, concurrency=2) == (1, 1, 2)
+    assert second.prompts == ['b']
+
+
+def test_resume_reruns_done_jobs_whose_output_is_gone(tmp_path):
+    jobs = write_jobs(tmp_path / 'jobs.jsonl', {'prompt': 'a', 'output': 'a.png'})
+    job_runner.run_jobs(jobs, FakeGenerate())
+    (tmp_path / 'a.png').unlink()
+
+    again = FakeGenerate()
+    assert job_runner.run_jobs(jobs, again) == (1, 0, 0)
+    assert again.prompts == ['a']
+
+
+def test_truncated_manifest_line_is_ignored(tmp_path):
+    manifest = tmp_path / 'm.jsonl'
+    manifest.write_text(json.dumps({'id': 'x', 'status': 'done', 'output': 'x.png'}) + '\n{"id": "y", "sta')
+    assert list(job_runner.load_manifest(str(manifest))) == ['x']
@@ -0,0 +1,55 @@
+import pytest
+
+import logo_overlay
+from logo_overlay import Placement, parse_placement
+
+
+@pytest.fixture(autouse=True)
+def _default_placement(monkeypatch):
+    # configure() changes the module defaults; restore them after each test
+    for key, value in dict(logo_overlay.DEFAULT_PLACEMENT).items():
+        monkeypatch.setitem(logo_overlay.DEFAULT_PLACEMENT, key, value)
+
+
+def test_parse_placement_fields_and_defaults():
+    assert parse_placement('logos/mcp.png') == Placement('logos/mcp.png', 'bottom-right', 0.16, 0.04)
+    assert parse_placement('mcp@top-left,0.2') == Placement('mcp', 'top-left', 0.2, 0.04)
+    assert parse_placement('mcp@,,0.1') == Placement('mcp', 'bottom-right', 0.16, 0.1)
+    assert parse_placement('a@b/logo.png') == Placement('a@b/logo.png', 'bottom-right', 0.16, 0.04)
+
+
+@pytest.mark.parametrize('spec, message', [
+    ('mcp@middle', 'unknown anchor'),
+    ('mcp@top,big', 'must be numbers'),
+    ('mcp@top,0', 'in \\(0, 1\\]'),
+    ('mcp@top,1.5', 'in \\(0, 1\\]'),
+    ('mcp@top,0.2,-0.1', 'cannot be negative'),
+])
+def test_parse_placement_rejects_bad_rules(spec, message):
+    with pytest.raises(ValueError, match=message):
+        parse_placement(spec)
+
+
+def test_configure_validates_before_changing_defaults():
+    with pytest.raises(ValueError):
+        logo_overlay.configure(anchor='top', size=2)
+    assert logo_overlay.DEFAULT_PLACEMENT['anchor'] == 'bottom-right'
+
+    logo_overlay.configure(anchor='top', size=0.3)
+    assert parse_placement('mcp') == Placement('mcp', 'top', 0.3, 0.04)
+
+
+def test_placements_resolve_bare_names_and_report_missing_logos(tmp_path):
+    (tmp_path / 'logos').mkdir()
+    (tmp_path / 'logos' / 'mcp.png').write_bytes(b'png')
+    assert logo_overlay.placements('mcp@top') == [Placement('./logos/mcp.png', 'top', 0.16, 0.04)]
+    assert logo_overlay.placements(None) == []
+
+    with pytest.raises(ValueError, match='not found: nope, gone.png'):
+        logo_overlay.placements(['mcp', 'nope', 'gone.png'])
+
+
+def test_layout_hint_names_each_area_once():
+    spots = [Placement('a', 'top-left', 0.1, 0), Placement('b', 'bottom', 0.1, 0), Placement('c', 'top-left', 0.1, 0)]
+    assert logo_overlay.layout_hint(spots).startswith('Leave the top left and bottom areas free')
+    assert logo_overlay.layout_hint([]) == ''
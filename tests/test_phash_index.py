@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+Image = pytest.importorskip('PIL.Image')
+
+import phash_index
+
+
+def mandelbrot(path, size=(256, 256), rotate=False, **save):
+    image = Image.effect_mandelbrot((256, 256), (-2.0, -1.5, 1.0, 1.5), 100)
+    if rotate:
+        image = image.transpose(Image.ROTATE_90)
+    image.resize(size).convert('RGB').save(path, **save)
+    return str(path)
+
+
+def test_hamming_counts_differing_bits():
+    hashes = np.array([0, 0b1011, 2 ** 64 - 1], dtype=np.uint64)
+    assert phash_index.hamming(0b1011, hashes).tolist() == [3, 0, 61]
+
+
+def test_resized_recompressed_copy_is_a_near_duplicate(tmp_path):
+    original = mandelbrot(tmp_path / 'a.png')
+    copy = mandelbrot(tmp_path / 'a.jpg', size=(200, 200), quality=80)
+    other = mandelbrot(tmp_path / 'b.png', rotate=True)
+    original_hash, copy_hash, other_hash = phash_index.phash_many([original, copy, other])
+    assert phash_index.phash(original) == int(original_hash)
+    assert phash_index.hamming(original_hash, [copy_hash])[0] <= phash_index.DEFAULT_THRESHOLD
+    assert phash_index.hamming(original_hash, [other_hash])[0] > phash_index.DEFAULT_THRESHOLD
+
+
+def test_index_rehashes_only_changed_files(tmp_path, monkeypatch):
+    archive = tmp_path / 'archive'
+    archive.mkdir()
+    first = mandelbrot(archive / 'a.png')
+    mandelbrot(archive / 'b.png', rotate=True)
+    index_path = str(tmp_path / 'index.npz')
+    index = phash_index.PHashIndex(str(archive), index_path).refresh()
+    assert [os.path.basename(p) for p in index.paths] == ['a.png', 'b.png']
+
+    hashed = []
+    real = phash_index.phash_many
+    monkeypatch.setattr(phash_index, 'phash_many', lambda paths: hashed.extend(paths) or real(paths))
+    again = phash_index.PHashIndex(str(archive), index_path).refresh()
+    assert hashed == []
+    assert again.hashes.tolist() == index.hashes.tolist()
+
+    mandelbrot(archive / 'c.png', size=(128, 128))
+    phash_index.PHashIndex(str(archive), index_path).refresh()
+    assert [os.path.basename(p) for p in hashed] == ['c.png']
+
+    path, distance = again.nearest(phash_index.phash(first))
+    assert (os.path.basename(path), distance) == ('a.png', 0)
+    assert phash_index.PHashIndex(str(tmp_path / 'empty'), str(tmp_path / 'e.npz')).refresh().nearest(0) == (None, None)
+
+
+def test_duplicate_tracker_flags_repeats_and_stops(tmp_path):
+    tracker = phash_index.DuplicateTracker(max_duplicates=1)
+    first = mandelbrot(tmp_path / 'a.png')
+    assert tracker.add(first) == (None, None)
+    assert tracker.add(mandelbrot(tmp_path / 'b.png', rotate=True)) == (None, None)
+    assert not tracker.should_stop()
+
+    match, distance = tracker.add(mandelbrot(tmp_path / 'c.jpg', size=(200, 200), quality=80))
+    assert match == first and distance <= tracker.threshold
+    assert tracker.should_stop()
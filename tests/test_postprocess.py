@@ -0,0 +1,61 @@
+import pytest
+
+import postprocess
+
+
+def test_parse_variants_presets_and_custom_definitions():
+    assert postprocess.parse_variants('youtube, grid,') == [
+        ('youtube', 1280, 720, 'JPEG', 2 * 1024 * 1024),
+        ('grid', 320, 180, 'JPEG', 50 * 1024),
+    ]
+    assert postprocess.parse_variants('banner=2560x1440:jpg:4000,square=512X512:png,plain=640x360') == [
+        ('banner', 2560, 1440, 'JPEG', 4000 * 1024),
+        ('square', 512, 512, 'PNG', None),
+        ('plain', 640, 360, 'JPEG', None),
+    ]
+
+
+@pytest.mark.parametrize('spec', ['poster', 'x=100x100:gif', 'x=100:jpeg'])
+def test_parse_variants_rejects_unknown_presets_and_formats(spec):
+    with pytest.raises(ValueError):
+        postprocess.parse_variants(spec)
+
+
+@pytest.fixture
+def restore_default(monkeypatch):
+    monkeypatch.setattr(postprocess, 'DEFAULT_POSTPROCESSOR', None)
+    monkeypatch.setattr(postprocess, '_auto_submit', True)
+    yield
+    postprocess.finish()
+
+
+def test_configure_without_spec_disables_post_processing(restore_default):
+    assert postprocess.configure(None) is None
+    postprocess.submit('out.png')
+    assert postprocess.finish() == {}
+
+
+def test_service_pool_does_not_collect_per_image_submissions(restore_default):
+    pool = postprocess.configure(None, serve=True)
+    assert pool is postprocess.DEFAULT_POSTPROCESSOR and pool.variants is None
+    postprocess.submit('out.png')
+    assert pool.futures == []
+    assert postprocess.derive_now(['out.png']) == {}
+    postprocess.finish()
+
+    postprocess.configure('grid', serve=True)
+    postprocess.submit('out.png')
+    assert postprocess.DEFAULT_POSTPROCESSOR.futures == []
+
+
+def test_derive_variants_writes_each_variant_within_budget(tmp_path):
+    Image = pytest.importorskip('PIL.Image')
+    source = tmp_path / 'thumb.png'
+    Image.new('RGB', (1600, 900), 'navy').save(source)
+    results = postprocess.derive_variants(str(source), postprocess.parse_variants('grid,square=256x256:png'))
+    assert [(name, path) for name, path, _, _, _ in results] == [
+        ('grid', str(tmp_path / 'thumb_grid.jpg')), ('square', str(tmp_path / 'thumb_square.png')),
+    ]
+    assert all(within for _, _, _, _, within in results)
+    with Image.open(tmp_path / 'thumb_square.png') as square:
+        assert square.size == (256, 256)
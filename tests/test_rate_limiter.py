@@ -0,0 +1,101 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'limits.sqlite')
+
+
+def add_lease(db_path, model, pid, acquired):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("INSERT INTO leases (model, pid, acquired) VALUES (?, ?, ?)", (model, pid, acquired))
+    conn.close()
+
+
+def test_models_without_limits_are_not_throttled(db_path):
+    limiter = RateLimiter(db_path)
+    assert [limiter.acquire('m') for _ in range(50)] == [0] * 50
+
+
+def test_in_flight_cap_is_shared_and_freed_on_release(db_path):
+    RateLimiter(db_path).set_limits('m', max_in_flight=2)
+    first, second = RateLimiter(db_path), RateLimiter(db_path)
+    leases = [first.acquire('m'), second.acquire('m')]
+    assert all(leases)
+    with pytest.raises(TimeoutError):
+        first.acquire('m', timeout=0.3)
+
+    second.release(leases[1])
+    with first.slot('m', timeout=0.3):
+        pass
+    first.release(leases[0])
+
+
+def test_token_bucket_allows_a_burst_then_waits(db_path):
+    limiter = RateLimiter(db_path)
+    limiter.set_limits('m', rpm=60)
+    burst = int(60 / 60 * rate_limiter.BURST_SECONDS)
+    for _ in range(burst):
+        limiter.release(limiter.acquire('m', timeout=0))
+    with pytest.raises(TimeoutError):
+        limiter.acquire('m', timeout=0.5)
+
+
+def test_set_limits_keeps_the_other_limit(db_path):
+    limiter = RateLimiter(db_path)
+    limiter.set_limits('m', rpm=6)
+    limiter.set_limits('m', max_in_flight=1)
+    limiter.release(limiter.acquire('m'))
+    # Nothing is in flight, so only the rpm kept from the first call can refuse this (one token per 10s)
+    with pytest.raises(TimeoutError, match='within'):
+        limiter.acquire('m', timeout=1)
+
+
+def test_cancel_stops_the_wait_without_taking_a_token(db_path):
+    limiter = RateLimiter(db_path)
+    limiter.set_limits('m', rpm=6)
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(TimeoutError, match='abandoned'):
+        limiter.acquire('m', cancel=cancel)
+    assert limiter.acquire('m', timeout=0)
+
+
+def test_cancel_interrupts_a_waiting_acquire(db_path):
+    limiter = RateLimiter(db_path)
+    limiter.set_limits('m', max_in_flight=1)
+    lease = limiter.acquire('m')
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        limiter.acquire('m', cancel=cancel)
+    assert time.monotonic() - start < 2
+    limiter.release(lease)
+
+
+def test_leases_of_dead_or_stuck_processes_are_reclaimed(db_path):
+    limiter = RateLimiter(db_path)
+    limiter.set_limits('m', max_in_flight=1)
+    dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+    dead.wait()
+    add_lease(db_path, 'm', dead.pid, time.time())
+    limiter.release(limiter.acquire('m', timeout=0))
+
+    add_lease(db_path, 'm', os.getpid(), time.time() - rate_limiter.LEASE_TTL_SECONDS - 1)
+    limiter.release(limiter.acquire('m', timeout=0))
+
+    add_lease(db_path, 'm', os.getpid(), time.time())
+    with pytest.raises(TimeoutError):
+        limiter.acquire('m', timeout=0)
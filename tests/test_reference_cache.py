@@ -0,0 +1,31 @@
+import hashlib
+import os
+
+import reference_cache
+
+
+def test_content_hash_is_served_from_the_index_while_unchanged(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    source = tmp_path / 'ref.png'
+    source.write_bytes(b'first')
+    assert reference_cache.content_hash(str(source), cache_dir) == hashlib.sha256(b'first').hexdigest()
+
+    reads = []
+    monkeypatch.setattr(reference_cache, 'file_sha256', lambda path: reads.append(path))
+    assert reference_cache.content_hash(str(source), cache_dir) == hashlib.sha256(b'first').hexdigest()
+    assert reads == []
+
+
+def test_changed_source_is_rehashed_and_its_variants_dropped(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    source = tmp_path / 'ref.png'
+    source.write_bytes(b'first')
+    reference_cache.content_hash(str(source), cache_dir)
+    variant = os.path.join(cache_dir, 'variant.jpg')
+    with open(variant, 'wb') as f:
+        f.write(b'derived')
+    reference_cache._record_variant(str(source), cache_dir, 'variant.jpg')
+
+    source.write_bytes(b'second, longer')
+    assert reference_cache.content_hash(str(source), cache_dir) == hashlib.sha256(b'second, longer').hexdigest()
+    assert not os.path.exists(variant)
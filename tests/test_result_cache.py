@@ -0,0 +1,99 @@
+import os
+import time
+
+import pytest
+
+import result_cache
+from result_cache import ResultCache, request_key
+
+PNG = [('image/png', b'\x89PNG' + b'x' * 96)]
+
+
+def _sizes(root, *keys):
+    return sum(result_cache._entry_size(str(root / key)) for key in keys)
+
+
+def test_request_key_hashes_image_contents_not_paths(tmp_path):
+    a = tmp_path / 'a.png'
+    b = tmp_path / 'b.png'
+    a.write_bytes(b'same bytes')
+    b.write_bytes(b'same bytes')
+    assert request_key('p', [str(a)], model='m') == request_key('p', [str(b)], model='m')
+
+    b.write_bytes(b'other bytes')
+    assert request_key('p', [str(a)], model='m') != request_key('p', [str(b)], model='m')
+
+
+def test_request_key_covers_settings_and_extras():
+    base = request_key('p', model='m', aspect_ratio='16:9', resolution='1K')
+    assert base == request_key('p', model='m', aspect_ratio='16:9', resolution='1K')
+    assert base != request_key('q', model='m', aspect_ratio='16:9', resolution='1K')
+    assert base != request_key('p', model='m', aspect_ratio='9:16', resolution='1K')
+    assert base != request_key('p', model='m', aspect_ratio='16:9', resolution='2K')
+    assert base != request_key('p', model='m', aspect_ratio='16:9', resolution='1K', candidates=2)
+
+
+def test_put_then_get_round_trips(tmp_path):
+    cache = ResultCache(root=str(tmp_path))
+    images = [('image/png', b'one'), ('image/jpeg', b'two')]
+    cache.put('k', images)
+    assert cache.get('k') == images
+    assert cache.get('missing') is None
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('.')]
+
+
+def test_modes(tmp_path):
+    cache = ResultCache(root=str(tmp_path), mode='refresh')
+    cache.put('k', PNG)
+    assert cache.get('k') is None
+    assert cache.get('k', mode='use') == PNG
+
+    cache.put('k2', PNG, mode='off')
+    assert cache.get('k2', mode='use') is None
+
+    with pytest.raises(ValueError):
+        ResultCache(root=str(tmp_path), mode='sometimes')
+
+
+def test_entries_past_max_age_are_misses_and_evicted(tmp_path):
+    cache = ResultCache(root=str(tmp_path), max_age_days=1)
+    cache.put('k', PNG)
+    old = time.time() - 2 * 86400
+    os.utime(tmp_path / 'k', (old, old))
+    cache.evict()
+    assert not (tmp_path / 'k').exists()
+
+
+def test_over_budget_evicts_least_recently_used_down_to_fraction(tmp_path):
+    cache = ResultCache(root=str(tmp_path), max_bytes=10 ** 6)
+    for index, key in enumerate(['a', 'b', 'c', 'd']):
+        cache.put(key, PNG)
+        stamp = time.time() - 100 + index
+        os.utime(tmp_path / key, (stamp, stamp))
+    entry = max(result_cache._entry_size(str(tmp_path / key)) for key in 'abcd')
+
+    # Reading 'a' makes it the most recently used, and 'b', 'c' and 'd' are evicted
+    assert cache.get('a') == PNG
+    cache.max_bytes = 3 * entry
+    cache.put('e', PNG)
+
+    remaining = sorted(name for name in os.listdir(tmp_path))
+    assert remaining == ['a', 'e']
+    assert cache.total_bytes == _sizes(tmp_path, 'a', 'e') <= cache.max_bytes * result_cache.EVICT_TO_FRACTION
+
+
+def test_total_bytes_tracks_puts_without_rescanning(tmp_path, monkeypatch):
+    cache = ResultCache(root=str(tmp_path))
+    cache.put('a', PNG)
+    assert cache.total_bytes == _sizes(tmp_path, 'a')
+
+    scans = []
+    monkeypatch.setattr(cache, 'evict', lambda: scans.append(1))
+    cache.put('b', PNG)
+    cache.put('b', PNG)
+    assert scans == []
+    assert cache.total_bytes == _sizes(tmp_path, 'a', 'b')
+
+    cache.last_scan -= result_cache.EVICT_INTERVAL_SECONDS + 1
+    cache.put('c', PNG)
+    assert scans == [1]
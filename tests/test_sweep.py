@@ -0,0 +1,113 @@
+import json
+import os
+
+import pytest
+
+import sweep
+
+
+def template(**overrides):
+    base = {'prompt': '{subject} in {mood} light', 'axes': {'subject': ['cat', 'dog'], 'mood': ['warm', 'cold']}}
+    base.update(overrides)
+    return base
+
+
+def test_expand_is_the_cross_product_in_matrix_order(tmp_path):
+    jobs, cells = sweep.expand(template(), str(tmp_path))
+    assert [labels for labels, _ in cells] == [
+        {'subject': 'cat', 'mood': 'warm'}, {'subject': 'cat', 'mood': 'cold'},
+        {'subject': 'dog', 'mood': 'warm'}, {'subject': 'dog', 'mood': 'cold'},
+    ]
+    assert [job['prompt'] for job in jobs] == ['cat in warm light', 'cat in cold light',
+                                               'dog in warm light', 'dog in cold light']
+    assert [job['id'] for job in jobs] == [jid for _, jid in cells]
+    assert jobs[0]['output'] == os.path.join(str(tmp_path), 'cat_warm.png')
+
+
+def test_identical_expansions_share_one_job(tmp_path):
+    jobs, cells = sweep.expand(template(axes={
+        'subject': ['cat', 'dog'],
+        'mood': {'soft': 'warm', 'gentle': 'warm'},
+    }), str(tmp_path))
+    assert len(cells) == 4
+    assert len(jobs) == 2
+    assert cells[0][1] == cells[1][1] != cells[2][1] == cells[3][1]
+
+
+def test_ids_are_stable_and_follow_the_settings(tmp_path):
+    ids = lambda jobs: [job['id'] for job in jobs]
+    plain, _ = sweep.expand(template(), str(tmp_path))
+    again, _ = sweep.expand(template(), str(tmp_path / 'elsewhere'))
+    assert ids(plain) == ids(again)
+
+    at_2k, _ = sweep.expand(template(), str(tmp_path), defaults={'resolution': '2K'})
+    assert not set(ids(at_2k)) & set(ids(plain))
+    assert {job['resolution'] for job in at_2k} == {'2K'}
+
+    # The template's own settings win over the defaults
+    pinned, _ = sweep.expand(template(resolution='1K'), str(tmp_path), defaults={'resolution': '2K'})
+    same, _ = sweep.expand(template(resolution='1K'), str(tmp_path))
+    assert ids(pinned) == ids(same)
+    assert {job['resolution'] for job in pinned} == {'1K'}
+
+
+def test_output_pattern_collisions_get_an_id_suffix(tmp_path):
+    jobs, _ = sweep.expand(template(output=str(tmp_path / '{subject}.png')), str(tmp_path))
+    outputs = [job['output'] for job in jobs]
+    assert len(set(outputs)) == 4
+    assert outputs[0] == str(tmp_path / 'cat.png')
+    assert outputs[1] == str(tmp_path / f"cat_{jobs[1]['id'][:6]}.png")
+
+
+def test_jobs_sharing_a_payload_run_back_to_back(tmp_path):
+    jobs, cells = sweep.expand({
+        'prompt': '{subject}, {references}',
+        'axes': {'subject': ['cat', 'dog'], 'references': {'front': ['f.jpg'], 'side': ['s.jpg']}},
+    }, str(tmp_path))
+    assert [labels['references'] for labels, _ in cells] == ['front', 'side', 'front', 'side']
+    assert [(job['labels']['subject'], job['references']) for job in jobs] == [
+        ('cat', ['f.jpg']), ('dog', ['f.jpg']), ('cat', ['s.jpg']), ('dog', ['s.jpg']),
+    ]
+    assert jobs[0]['prompt'] == 'cat, front'
+
+
+def test_vars_fill_placeholders_that_are_not_axes(tmp_path):
+    jobs, _ = sweep.expand(template(prompt='{subject} by {artist}', vars={'artist': 'me'}), str(tmp_path))
+    assert jobs[0]['prompt'] == 'cat by me'
+
+
+@pytest.mark.parametrize('overrides, message', [
+    ({'prompt': '{subject} {unknown}'}, 'prompt placeholder'),
+    ({'output': '{unknown}.png'}, 'output placeholder'),
+])
+def test_unknown_placeholders_are_rejected(tmp_path, overrides, message):
+    with pytest.raises(ValueError, match=message):
+        sweep.expand(template(**overrides), str(tmp_path))
+
+
+def test_load_template_validates_shape(tmp_path):
+    path = tmp_path / 'sweep.json'
+    path.write_text(json.dumps({'prompt': 'x', 'axes': {}}))
+    with pytest.raises(ValueError, match='axes'):
+        sweep.load_template(str(path))
+    path.write_text(json.dumps({'axes': {'a': [1]}}))
+    with pytest.raises(ValueError, match='prompt'):
+        sweep.load_template(str(path))
+    with pytest.raises(ValueError, match='list or an object'):
+        sweep.axis_values('cat')
+
+
+def test_warm_loads_each_path_once():
+    loaded = []
+    assert sweep.warm(['a', 'b', 'a'], loaded.append, workers=2) == 2
+    assert sorted(loaded) == ['a', 'b']
+
+
+def test_contact_sheet_lays_out_the_grid(tmp_path):
+    Image = pytest.importorskip('PIL.Image')
+    cell = tmp_path / 'cell.png'
+    Image.new('RGB', (160, 90), 'red').save(cell)
+    output = sweep.contact_sheet([(str(cell), ['a']), (None, ['b']), (str(cell), ['c'])],
+                                 str(tmp_path / 'sheet.png'), columns=2, cell_width=160)
+    with Image.open(output) as sheet:
+        assert sheet.width == 2 * (160 + 8) + 8
@@ -0,0 +1,87 @@
+import pytest
+
+import upload_cache
+from gemini_rest import GeminiAPIError, request_json, to_rest_request
+
+BLOB = {'mime_type': 'image/png', 'data': b'\x89PNG reference'}
+
+
+def test_identical_bytes_are_uploaded_once(fake_gemini, tmp_path):
+    index = str(tmp_path / 'uploads.json')
+    first = upload_cache.upload_blob(BLOB, index_path=index)
+    second = upload_cache.upload_blob(dict(BLOB), index_path=index)
+    assert first == second
+    assert fake_gemini.get_file('files/' + first['file_data']['file_uri'].rsplit('/', 1)[-1])
+    assert fake_gemini.stats['uploads'] == 1
+
+    upload_cache.upload_blob({'mime_type': 'image/png', 'data': b'other'}, index_path=index)
+    assert fake_gemini.stats['uploads'] == 2
+
+
+def test_handles_are_not_shared_across_api_keys(fake_gemini, tmp_path, monkeypatch):
+    index = str(tmp_path / 'uploads.json')
+    upload_cache.upload_blob(BLOB, index_path=index)
+    monkeypatch.setenv('GEMINI_API_KEY', 'another-project')
+    upload_cache.upload_blob(BLOB, index_path=index)
+    assert fake_gemini.stats['uploads'] == 2
+
+
+def test_handles_close_to_expiry_are_replaced(fake_gemini, tmp_path):
+    fake_gemini.file_ttl = upload_cache.EXPIRY_MARGIN_SECONDS / 2
+    index = str(tmp_path / 'uploads.json')
+    upload_cache.upload_blob(BLOB, index_path=index)
+    upload_cache.upload_blob(BLOB, index_path=index)
+    assert fake_gemini.stats['uploads'] == 2
+
+
+def test_file_uris_reads_parts_and_rest_requests():
+    parts = ['prompt', {'file_data': {'mime_type': 'image/png', 'file_uri': 'u1'}},
+             {'inline_data': {'mime_type': 'image/png', 'data': b''}}]
+    assert upload_cache.file_uris(parts) == ['u1']
+    request = {'contents': [{'parts': [{'text': 'p'}, {'fileData': {'fileUri': 'u2'}}]}]}
+    assert upload_cache.file_uris(request) == ['u2']
+
+
+@pytest.mark.parametrize('error, missing', [
+    (GeminiAPIError(403, 'You do not have permission to access the File files/x'), True),
+    (GeminiAPIError(404, 'File files/x not found'), True),
+    (GeminiAPIError(403, 'API key not valid'), False),
+    (GeminiAPIError(503, 'The model is overloaded'), False),
+    (ValueError('file'), False),
+])
+def test_is_missing_file_error(error, missing):
+    assert upload_cache.is_missing_file_error(error) is missing
+
+
+def test_deleted_upload_is_evicted_and_sent_again(fake_gemini, tmp_path):
+    index = str(tmp_path / 'uploads.json')
+
+    def build():
+        return to_rest_request(['a prompt', upload_cache.upload_blob(BLOB, index_path=index)])
+
+    def send(request):
+        return request_json('POST', 'models/fake:generateContent', request)
+
+    request = build()
+    fake_gemini.files.clear()
+    with pytest.raises(GeminiAPIError):
+        send(request)
+
+    response = upload_cache.send_with_fresh_uploads(send, request, build, index_path=index)
+    assert response['candidates']
+    assert fake_gemini.stats['uploads'] == 2
+    assert upload_cache.file_uris(build()) != upload_cache.file_uris(request)
+
+
+def test_other_errors_are_not_retried(tmp_path):
+    calls = []
+
+    def send(request):
+        calls.append(request)
+        raise GeminiAPIError(503, 'The model is overloaded')
+
+    request = [{'file_data': {'mime_type': 'image/png', 'file_uri': 'u1'}}]
+    with pytest.raises(GeminiAPIError):
+        upload_cache.send_with_fresh_uploads(send, request, lambda: request,
+                                             index_path=str(tmp_path / 'uploads.json'))
+    assert len(calls) == 1
@@ -1,9 +1,14 @@
 
 import google.generativeai as genai
-from PIL import Image
 import argparse
 import os
 from dotenv import load_dotenv
+from gemini_rest import configure_sdk
+from gemini_client import configure_rate_limits, generate_images, response_images
+from image_io import save_image_bytes
+from result_cache import DEFAULT_CACHE as RESULT_CACHE, configure as configure_result_cache, request_key
+from metrics import RequestMetrics, configure as configure_metrics, current_run_id, emit as emit_metrics, payload_bytes
+import output_archive
 
 def main():
     """
@@ -14,7 +19,18 @@ def main():
     parser.add_argument("prompt", type=str, help="The text prompt to generate the image from.")
     parser.add_argument("-o", "--output", type=str, default="generated_image.png", help="The output filename for the generated image. Defaults to 'generated_image.png'.")
     parser.add_argument("-m", "--model", type=str, default="gemini-3-pro-image-preview", help="The model to use for image generation. Defaults to 'gemini-3-pro-image-preview'.")
+    parser.add_argument("--rpm", type=float, default=None, help="Requests per minute allowed for this model across all processes (saved for later runs).")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="Maximum concurrent requests for this model across all processes (saved for later runs).")
+    parser.add_argument("--force", action="store_true", help="Regenerate even if an identical request is in the result cache (and refresh it).")
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor write the result cache.")
+    parser.add_argument("--no-archive", action="store_true", help="Do not store the output in the content-addressed archive.")
+    parser.add_argument("--metrics", default=os.getenv("THUMBNAIL_METRICS"), help="Record per-stage timings, payload bytes and retries: JSON lines, or a Prometheus text file if the path ends in .prom (default: $THUMBNAIL_METRICS).")
+    parser.add_argument("--run-id", default=None, help="Run id attached to the metrics record (default: $THUMBNAIL_RUN_ID or random).")
     args = parser.parse_args()
+    configure_rate_limits(args.model, rpm=args.rpm, max_in_flight=args.max_in_flight)
+    configure_result_cache('off' if args.no_cache else 'refresh' if args.force else 'use')
+    configure_metrics(args.metrics, run_id=args.run_id)
+    output_archive.configure(enabled=not args.no_archive)
 
     # --- IMPORTANT: Configure your API key ---
     # You can set your API key as an environment variable 'GEMINI_API_KEY'
@@ -26,31 +42,50 @@ def main():
         print("Please set the GEMINI_API_KEY environment variable or replace 'YOUR_API_KEY' in the script.")
         return
 
+    request_metrics = RequestMetrics('text-to-image', job=args.output)
     try:
-        genai.configure(api_key=api_key)
+        configure_sdk(api_key)
 
         print(f"Generating image with prompt: '{args.prompt}' using model '{args.model}'...")
 
         # Create the model
         model = genai.GenerativeModel(args.model)
 
-        # Generate content
-        response = model.generate_content(args.prompt)
+        # Identical requests are served from the result cache without calling the API
+        with request_metrics.stage('build'):
+            cache_key = request_key(args.prompt, model=args.model)
+            images = RESULT_CACHE.get(cache_key)
+        response = None
+        if images:
+            print("Identical request found in result cache (use --force to regenerate).")
+            request_metrics.cache_hit = True
+        else:
+            # Generate content (transient errors are retried with backoff)
+            request_metrics.add('request_bytes', payload_bytes(args.prompt))
+            stats = {}
+            try:
+                with request_metrics.stage('network'):
+                    response = generate_images(model, args.prompt, stats=stats)
+            finally:
+                request_metrics.add_stats(stats)
+            with request_metrics.stage('decode'):
+                images = response_images(response)
+            RESULT_CACHE.put(cache_key, images)
+            request_metrics.add('response_bytes', sum(len(data) for _, data in images))
 
         # The response may contain text and/or an image. We need to find the image.
-        image = None
-        for part in response.parts:
-            if hasattr(part, 'inline_data') and part.inline_data:
-                # Extract image data and convert to PIL Image
-                import io
-                import base64
-                image_data = part.inline_data.data
-                image = Image.open(io.BytesIO(image_data))
-                break
-
-        if image:
+        if images:
             print(f"Image generated successfully. Saving to '{args.output}'...")
-            image.save(args.output)
+            # Write the returned bytes directly (transcoded only if the extension differs)
+            mime_type, image_data = images[0]
+            with request_metrics.stage('save'):
+                save_image_bytes(image_data, args.output, mime_type)
+            request_metrics.add('images', 1)
+            request_metrics.ok = True
+            output_archive.record(image_data, mime_type, args.output, script='text-to-image', run_id=current_run_id(),
+                                  prompt=args.prompt, final_prompt=args.prompt, model=args.model,
+                                  cache_hit=request_metrics.cache_hit, seconds=request_metrics.elapsed(),
+                                  stages=dict(request_metrics.stages))
             print("Done.")
         else:
             print("Error: The model did not return an image.")
@@ -60,6 +95,8 @@ def main():
 
     except Exception as e:
         print(f"An error occurred: {e}")
+    finally:
+        emit_metrics(request_metrics)
 
 if __name__ == "__main__":
     main()
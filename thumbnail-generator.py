@@ -4,12 +4,31 @@ Uses a consistent set of reference images to maintain your digital avatar across
 """
 
 import os
-import google.generativeai as genai
-from PIL import Image
+import json
+import threading
 from dotenv import load_dotenv
 import argparse
-import glob
-import io
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from reference_cache import load_reference
+from job_runner import load_manifest, run_jobs
+from batch_api import collect_jobs, submit_jobs
+from gemini_rest import configure_sdk
+from gemini_client import (MAX_CANDIDATES, configure_executor, configure_rate_limits, generate_images,
+                           is_candidate_count_rejection, record_multiple_candidates, supports_multiple_candidates,
+                           response_images)
+from upload_cache import load_uploaded_reference, send_with_fresh_uploads
+from image_io import save_image_bytes
+from result_cache import DEFAULT_CACHE as RESULT_CACHE, configure as configure_result_cache, request_key
+from thumbnail_service import DEFAULT_HOST, DEFAULT_PORT, call_service, serve
+import postprocess
+import logo_overlay
+from metrics import RequestMetrics, configure as configure_metrics, current_run_id, emit as emit_metrics, payload_bytes
+import output_archive
+from edit_session import EditSession, session_path
+import sweep
+import reference_selector
 
 # Load environment variables
 load_dotenv()
@@ -17,37 +36,124 @@ load_dotenv()
 # Default reference folder for your consistent avatar
 DEFAULT_REFERENCE_FOLDER = "./reference photos"
 
-def get_reference_images(reference_path=None):
+# Image model used for thumbnail generation
+DEFAULT_MODEL = "gemini-3-pro-image-preview"
+
+# Configured once per process and reused by every request (batch, jobs, service mode)
+_models = {}
+_models_lock = threading.Lock()
+
+# Near-duplicate distance in bits (of 64); kept here so phash_index/NumPy load only when used
+DEFAULT_DEDUP_THRESHOLD = 10
+DEFAULT_ARCHIVE_FOLDER = "./past thumbnails"
+
+# Options that only affect this process, so a --server request cannot honour them
+SERVICE_UNSUPPORTED = (('logo_anchor', '--logo-anchor'), ('logo_size', '--logo-size'),
+                       ('logo_margin', '--logo-margin'), ('no_archive', '--no-archive'),
+                       ('deadline', '--deadline'), ('hedge_percentile', '--hedge-percentile'),
+                       ('run_id', '--run-id'), ('derive_workers', '--derive-workers'))
+
+
+def get_model(model_name=DEFAULT_MODEL):
+    """
+    Return a cached GenerativeModel, configuring the SDK on first use.
+    google.generativeai is imported here so thin-client invocations never pay for it.
+    """
+    with _models_lock:
+        if model_name not in _models:
+            import google.generativeai as genai
+
+            if not _models:
+                configure_sdk(os.getenv('GEMINI_API_KEY'))
+            _models[model_name] = genai.GenerativeModel(model_name)
+        return _models[model_name]
+
+def get_reference_images(reference_path=None, prompt=None, count=None):
     """
     Load reference images from a folder or list of files.
     If no path provided, uses the default reference folder for consistency.
+    From a folder, a few pose-diverse photos best suited to the prompt are picked
+    (count, default: --reference-count).
     """
     if reference_path is None:
         reference_path = DEFAULT_REFERENCE_FOLDER
 
-    # If it's a folder, get all images from it
+    # If it's a folder, pick from all images in it
     if os.path.isdir(reference_path):
-        image_extensions = ['*.jpg', '*.jpeg', '*.png', '*.webp']
-        image_files = []
-        for ext in image_extensions:
-            image_files.extend(glob.glob(os.path.join(reference_path, ext)))
-            image_files.extend(glob.glob(os.path.join(reference_path, ext.upper())))
-
+        image_files = reference_selector.list_images(reference_path)
         if not image_files:
             raise ValueError(f"No images found in {reference_path}")
-
-        # Limit to 5 images for character consistency
-        image_files = sorted(image_files)[:5]
-        return image_files
+        return reference_selector.select(image_files, prompt, count)
     else:
         # If it's a single file or list, return as-is
         return [reference_path] if isinstance(reference_path, str) else reference_path
 
 
+def build_prompt(prompt, style_reference=None, draft_reference=None, logo_placements=None):
+    """
+    Return the prompt text actually sent to the model.
+    With logo_placements (logos composited locally afterwards), the model is asked to keep
+    their areas clear.
+    """
+    enhanced_prompt = prompt
+    if style_reference and os.path.exists(style_reference):
+        enhanced_prompt = f"Create a thumbnail inspired by the style reference image. {prompt}"
+    if draft_reference:
+        enhanced_prompt = (f"Re-render the draft thumbnail (the first image) at full quality. Keep its "
+                           f"composition, pose, expression, text and colours; only add detail and sharpness. "
+                           f"Original brief: {enhanced_prompt}")
+    if logo_placements:
+        enhanced_prompt = f"{enhanced_prompt} {logo_overlay.layout_hint(logo_placements)}"
+    return enhanced_prompt
+
+
+def content_image_paths(reference_images=None, style_reference=None, logo_references=None, draft_reference=None,
+                        prompt=None):
+    """
+    Return the existing image paths of a request in the order they are sent: the draft being
+    finalized (so the model treats it as the target), the style reference, logos, then the
+    character references (picked for prompt when given as a folder).
+    """
+    if reference_images is None or isinstance(reference_images, str):
+        reference_images = get_reference_images(reference_images, prompt=prompt)
+
+    paths = []
+    if draft_reference:
+        paths.append(draft_reference)
+    if style_reference and os.path.exists(style_reference):
+        paths.append(style_reference)
+    if logo_references:
+        logo_list = logo_references if isinstance(logo_references, list) else [logo_references]
+        paths.extend(logo_path for logo_path in logo_list if os.path.exists(logo_path))
+    paths.extend(img_path for img_path in reference_images if os.path.exists(img_path))
+    return paths
+
+
+def build_content_parts(prompt, reference_images=None, style_reference=None, logo_references=None,
+                        upload_references=False, draft_reference=None, logo_placements=None):
+    """
+    Assemble the request contents: the (style-aware) prompt followed by the style reference,
+    logos and character references as cached, downscaled image blobs.
+    With upload_references, images are uploaded once via the Files API and sent as file handles.
+    With draft_reference, the chosen low-resolution draft leads the images and the model is
+    asked to re-render it faithfully.
+    logo_placements are composited locally after generation and only shape the prompt.
+    """
+    load_image = load_uploaded_reference if upload_references else load_reference
+    content_parts = [build_prompt(prompt, style_reference, draft_reference, logo_placements)]
+    for img_path in content_image_paths(reference_images, style_reference, logo_references, draft_reference,
+                                        prompt=prompt):
+        content_parts.append(load_image(img_path))
+    return content_parts
+
+
 def generate_thumbnail(prompt, reference_images=None, style_reference=None, logo_references=None, output_path="thumbnail.png",
-                      aspect_ratio="16:9", resolution="4K"):
+                      aspect_ratio="16:9", resolution="4K", upload_references=False, draft_reference=None,
+                      variant=None, composite_logos=False, cache_mode=None):
     """
     Generate a YouTube thumbnail with consistent character using reference images.
+    Returns the saved path of the first image, or None. Any further images in the
+    response are saved as <output>_2, <output>_3, ...
 
     Args:
         prompt: Description of the thumbnail scene (e.g., "shocked expression with hands on face")
@@ -58,28 +164,65 @@ def generate_thumbnail(prompt, reference_images=None, style_reference=None, logo
         output_path: Where to save the generated thumbnail
         aspect_ratio: YouTube thumbnails are 16:9
         resolution: 4K for high quality thumbnails
+        upload_references: Upload images once via the Files API and reuse the cached handles
+        draft_reference: Optional path to a low-resolution draft to re-render at this resolution
+        variant: Distinguishes otherwise identical requests (e.g. batch variations) in the result cache
+        composite_logos: Place the logos locally after generation instead of sending them to the model;
+                         logo specs may carry placement rules ("path@anchor,size,margin")
+        cache_mode: Result cache mode for this request ('use', 'refresh' or 'off'; default: the shared setting)
+    """
+    saved = generate_thumbnails(prompt, reference_images, style_reference, logo_references, [output_path],
+                                aspect_ratio=aspect_ratio, resolution=resolution,
+                                upload_references=upload_references, draft_reference=draft_reference,
+                                variant=variant, composite_logos=composite_logos, cache_mode=cache_mode)
+    return saved[0] if saved else None
+
+
+def generate_thumbnails(prompt, reference_images=None, style_reference=None, logo_references=None, output_paths=None,
+                        aspect_ratio="16:9", resolution="4K", upload_references=False, draft_reference=None,
+                        candidate_count=1, variant=None, composite_logos=False, cache_mode=None):
     """
+    Generate one request's worth of thumbnails and save every returned image.
+
+    Args:
+        output_paths: Paths for the returned images in order; images beyond these are saved
+                      next to the first path as <output>_2, <output>_3, ...
+        candidate_count: Candidates to request in this single call (one per output path)
+        Other arguments as for generate_thumbnail
+
+    Returns:
+        List of saved paths (empty on failure)
+    """
+    output_paths = output_paths or ["thumbnail.png"]
 
     # Configure API
     api_key = os.getenv('GEMINI_API_KEY')
     if not api_key:
         print("❌ Error: GEMINI_API_KEY not found in .env file")
-        return None
-
-    genai.configure(api_key=api_key)
+        return []
 
     # Load reference images
     if reference_images is None:
         print(f"Using default reference folder: {DEFAULT_REFERENCE_FOLDER}")
-        reference_images = get_reference_images()
+        reference_images = get_reference_images(prompt=prompt)
     elif isinstance(reference_images, str):
-        reference_images = get_reference_images(reference_images)
+        reference_images = get_reference_images(reference_images, prompt=prompt)
+
+    # Composited logos are kept out of the request entirely
+    logo_placements = None
+    logo_specs = logo_references
+    if composite_logos:
+        try:
+            logo_placements = logo_overlay.placements(logo_references)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return []
+        logo_references = None
 
     # Build the prompt with instruction
-    enhanced_prompt = prompt
+    enhanced_prompt = build_prompt(prompt, style_reference, draft_reference, logo_placements)
     if style_reference and os.path.exists(style_reference):
         print(f"\n📸 Style Reference: {style_reference}")
-        enhanced_prompt = f"Create a thumbnail inspired by the style reference image. {prompt}"
 
     if logo_references:
         logo_list = logo_references if isinstance(logo_references, list) else [logo_references]
@@ -87,6 +230,10 @@ def generate_thumbnail(prompt, reference_images=None, style_reference=None, logo
         for logo_path in logo_list:
             if os.path.exists(logo_path):
                 print(f"   ✓ {os.path.basename(logo_path)}")
+    if logo_placements:
+        print(f"\n🎨 Logos placed locally after generation: {len(logo_placements)}")
+        for placement in logo_placements:
+            print(f"   ✓ {os.path.basename(placement.path)} ({placement.anchor}, {placement.size:.0%} of height)")
 
     print(f"\n👤 Loading {len(reference_images)} character reference images for consistency...")
     for img_path in reference_images:
@@ -95,47 +242,139 @@ def generate_thumbnail(prompt, reference_images=None, style_reference=None, logo
     print(f"\n🎨 Generating thumbnail...")
     print(f"   Prompt: '{enhanced_prompt}'")
     print(f"   Resolution: {resolution} | Aspect Ratio: {aspect_ratio}")
+    if candidate_count > 1:
+        print(f"   Candidates: {candidate_count} in one request")
 
-    # Build content with text and images
-    content_parts = [enhanced_prompt]
+    request_metrics = RequestMetrics('thumbnail-generator', job=output_paths[0])
+    try:
+        # Identical requests are served from the result cache without calling the API
+        with request_metrics.stage('build'):
+            cache_key = request_key(
+                enhanced_prompt,
+                content_image_paths(reference_images, style_reference, logo_references, draft_reference),
+                model=DEFAULT_MODEL, aspect_ratio=aspect_ratio, resolution=resolution,
+                candidate_count=candidate_count, variant=variant)
+            images = RESULT_CACHE.get(cache_key, mode=cache_mode)
 
-    # Add style reference if provided
-    if style_reference and os.path.exists(style_reference):
-        content_parts.append(Image.open(style_reference))
+        if images:
+            print("   ♻️  Identical request found in result cache (use --force to regenerate)")
+            request_metrics.cache_hit = True
+        else:
+            def build():
+                return build_content_parts(prompt, reference_images, style_reference, logo_references,
+                                           upload_references=upload_references, draft_reference=draft_reference,
+                                           logo_placements=logo_placements)
 
-    # Add logo references if provided
-    if logo_references:
-        logo_list = logo_references if isinstance(logo_references, list) else [logo_references]
-        for logo_path in logo_list:
-            if os.path.exists(logo_path):
-                content_parts.append(Image.open(logo_path))
+            with request_metrics.stage('references'):
+                content_parts = build()
+            request_metrics.add('request_bytes', payload_bytes(content_parts))
 
-    # Add character reference images
-    for img_path in reference_images:
-        if os.path.exists(img_path):
-            content_parts.append(Image.open(img_path))
+            # Reuse the process-wide model and generate
+            stats = {}
+            try:
+                with request_metrics.stage('network'):
+                    response = send_with_fresh_uploads(
+                        lambda parts: generate_images(get_model(), parts, aspect_ratio=aspect_ratio,
+                                                      resolution=resolution, candidate_count=candidate_count,
+                                                      stats=stats),
+                        content_parts, build)
+            finally:
+                request_metrics.add_stats(stats)
+            with request_metrics.stage('decode'):
+                images = response_images(response)
+            RESULT_CACHE.put(cache_key, images, mode=cache_mode)
+            request_metrics.add('response_bytes', sum(len(data) for _, data in images))
 
-    # Create model and generate
-    model = genai.GenerativeModel("gemini-3-pro-image-preview")
+        # Save every final image in the response, not just the first
+        if not images:
+            print("❌ No image generated in response")
+            return []
 
-    try:
-        response = model.generate_content(content_parts)
-
-        # Extract image from response
-        for part in response.parts:
-            if hasattr(part, 'inline_data') and part.inline_data:
-                image_data = part.inline_data.data
-                image = Image.open(io.BytesIO(image_data))
-                image.save(output_path)
-                print(f"\n✅ Thumbnail saved: {output_path}")
-                return output_path
-
-        print("❌ No image generated in response")
-        return None
+        base_name, ext = os.path.splitext(output_paths[0])
+        saved = []
+        for index, (mime_type, image_data) in enumerate(images):
+            path = output_paths[index] if index < len(output_paths) else f"{base_name}_{index + 1}{ext}"
+            # Returned bytes go straight to disk unless the extension asks for another format
+            with request_metrics.stage('save'):
+                if logo_placements:
+                    image_data = logo_overlay.composite(image_data, logo_placements)
+                save_image_bytes(image_data, path, mime_type)
+            print(f"\n✅ Thumbnail saved: {path}")
+            saved.append(path)
+            # Queued for the content-addressed archive; written on a background thread
+            output_archive.record(
+                image_data, mime_type, path, script='thumbnail-generator', run_id=current_run_id(),
+                prompt=prompt, final_prompt=enhanced_prompt, references=reference_images, style=style_reference,
+                logos=logo_specs, composite_logos=composite_logos,
+                draft=draft_reference, model=DEFAULT_MODEL, aspect_ratio=aspect_ratio, resolution=resolution,
+                variant=variant if len(images) == 1 else f"{variant or ''}#{index + 1}",
+                cache_hit=request_metrics.cache_hit, seconds=request_metrics.elapsed(),
+                stages=dict(request_metrics.stages))
+            # Variants are derived in worker processes while other requests are still in flight
+            postprocess.submit(path)
+        request_metrics.add('images', len(saved))
+        request_metrics.ok = True
+        return saved
 
     except Exception as e:
         print(f"❌ Error generating image: {e}")
-        return None
+        if candidate_count > 1 and is_candidate_count_rejection(e):
+            print(f"   {DEFAULT_MODEL} does not accept several candidates per request; "
+                  f"later batches will request them one at a time")
+            record_multiple_candidates(DEFAULT_MODEL, False)
+        return []
+    finally:
+        emit_metrics(request_metrics)
+
+
+def show_history(query, since_days=None, limit=20):
+    """
+    List archived outputs matching every word of query (prompt, logos, style or path), newest first.
+    """
+    rows = output_archive.DEFAULT_ARCHIVE.query(query.split(), since_days=since_days, limit=limit)
+    if not rows:
+        print("No archived thumbnails match.")
+        return rows
+    print(f"🗂️  {len(rows)} archived thumbnail(s):\n")
+    for row in rows:
+        print(output_archive.describe(row))
+    print("\nRegenerate one with: --like ID [\"new prompt\"]")
+    return rows
+
+
+def apply_archived_settings(args, ref):
+    """
+    "Regenerate like this one": copy the prompt (unless a new one was given), references,
+    style, logos (and whether they were composited), aspect ratio and resolution of an
+    archived output onto args. Inputs that have since moved or been deleted are reported.
+    Returns False if ref is not in the archive.
+    """
+    row = output_archive.DEFAULT_ARCHIVE.get(ref)
+    if row is None:
+        print(f"❌ No archived output matches '{ref}' (see --history)")
+        return False
+    print(f"♻️  Regenerating like #{row['id']} ({row['sha256'][:10]}): {row['prompt']}")
+    args.prompt = args.prompt or row['prompt']
+    args.references = json.loads(row['reference_paths']) or args.references
+    args.style = row['style']
+    args.logos = json.loads(row['logos']) or None
+    args.aspect_ratio = row['aspect_ratio'] or args.aspect_ratio
+    args.resolution = row['resolution'] or args.resolution
+    if row['composite_logos'] is not None:
+        args.composite_logos = bool(row['composite_logos'])
+
+    references = [args.references] if isinstance(args.references, str) else args.references or []
+    missing = [path for path in references + [args.style] if path and not os.path.exists(path)]
+    for spec in args.logos or []:
+        try:
+            logo_path = logo_overlay.parse_placement(spec).path
+        except ValueError:
+            logo_path = spec
+        if not logo_overlay.resolve_logo(logo_path):
+            missing.append(logo_path)
+    for path in missing:
+        print(f"   ⚠️  Archived input no longer exists: {path}")
+    return True
 
 
 def setup_reference_folder():
@@ -165,7 +404,7 @@ def setup_reference_folder():
         print("=" * 70)
     else:
         # Check if folder has images
-        existing_images = get_reference_images(DEFAULT_REFERENCE_FOLDER)
+        existing_images = reference_selector.list_images(DEFAULT_REFERENCE_FOLDER)
         if existing_images:
             print(f"✅ Reference folder already set up with {len(existing_images)} images:")
             for img in existing_images:
@@ -175,6 +414,520 @@ def setup_reference_folder():
             print("   Add 3-5 reference photos of yourself to this folder.")
 
 
+def generate_batch(args):
+    """
+    Generate --batch variations, asking for several candidates per request where the model
+    supports it and falling back to concurrent single requests (at most --concurrency in
+    flight) for anything still missing. Outputs are always named <output>_v1, <output>_v2, ...
+    regardless of completion order, and a failed variation does not abort the others.
+    With --dedup / --max-duplicates, near-identical variations are flagged as they arrive
+    (and the batch stops early once too many show up); --rank orders the outputs by how far
+    they are from the past thumbnails archive.
+
+    Returns:
+        List with the saved path (or None if it failed) of each variation, in _vN order
+    """
+    base_name = os.path.splitext(args.output)[0]
+    ext = os.path.splitext(args.output)[1] or '.png'
+    output_paths = {i: f"{base_name}_v{i}{ext}" for i in range(1, args.batch + 1)}
+    workers = max(1, min(args.concurrency, args.batch))
+    options = dict(
+        prompt=args.prompt,
+        reference_images=args.references,
+        style_reference=args.style,
+        logo_references=args.logos,
+        aspect_ratio=args.aspect_ratio,
+        resolution=args.resolution,
+        upload_references=args.upload_references,
+        composite_logos=args.composite_logos,
+        # Only service requests carry their own --force / --no-cache
+        cache_mode=getattr(args, 'cache_mode', None)
+    )
+    results = {}
+    start = time.monotonic()
+
+    tracker = None
+    if args.dedup or args.max_duplicates:
+        from phash_index import DuplicateTracker
+
+        tracker = DuplicateTracker(threshold=args.dedup_threshold, max_duplicates=args.max_duplicates)
+
+    def check_duplicate(path):
+        if tracker is None or not path:
+            return
+        try:
+            match, distance = tracker.add(path)
+        except Exception as e:
+            print(f"   ⚠️  Could not hash {os.path.basename(path)}: {e}")
+            return
+        if match:
+            print(f"   ♊ {os.path.basename(path)} is a near-duplicate of {os.path.basename(match)} "
+                  f"({distance} bits apart)")
+
+    def stopped():
+        return tracker is not None and tracker.should_stop()
+
+    skipped = set()
+
+    def run_all(label, tasks, run):
+        done_count = 0
+        with ThreadPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            futures = {executor.submit(run, task): task for task in tasks}
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"❌ {label} {task} failed: {e}")
+                done_count += 1
+                print(f"   {label} {task} finished ({done_count}/{len(tasks)} done, "
+                      f"{time.monotonic() - start:.1f}s elapsed)")
+
+    # Several candidates per call: the prompt and references are uploaded once per chunk
+    if args.batch > 1 and supports_multiple_candidates(DEFAULT_MODEL):
+        indices = sorted(output_paths)
+        chunks = [tuple(indices[i:i + MAX_CANDIDATES]) for i in range(0, len(indices), MAX_CANDIDATES)]
+        print(f"\n🎬 Requesting {args.batch} variations as {len(chunks)} multi-candidate request(s)...")
+
+        def run_chunk(chunk):
+            if stopped():
+                return
+            saved = generate_thumbnails(output_paths=[output_paths[i] for i in chunk],
+                                        candidate_count=len(chunk), variant=f"v{chunk[0]}-v{chunk[-1]}",
+                                        **options)
+            for index, path in zip(chunk, saved):
+                results[index] = path
+                check_duplicate(path)
+
+        run_all("Request for variations", chunks, run_chunk)
+
+    # One variation per call for whatever is still missing
+    missing = [i for i in sorted(output_paths) if not results.get(i)]
+    if missing and stopped():
+        print(f"\n🛑 Stopping early: {len(tracker.duplicates)} near-duplicate variation(s) reached --max-duplicates")
+        skipped.update(missing)
+        missing = []
+    if missing:
+        if len(missing) < args.batch:
+            print(f"\n↩️  Model returned fewer candidates than requested; "
+                  f"generating {len(missing)} variation(s) individually")
+        print(f"\n🎬 Generating {len(missing)} variations ({min(workers, len(missing))} at a time)...")
+
+        def run_variation(index):
+            if stopped():
+                print(f"   ⏭️  Variation {index}/{args.batch} skipped (--max-duplicates reached)")
+                skipped.add(index)
+                return
+            print(f"   ▶ Variation {index}/{args.batch} started")
+            results[index] = generate_thumbnail(output_path=output_paths[index], variant=f"v{index}", **options)
+            check_duplicate(results[index])
+
+        run_all("Variation", missing, run_variation)
+
+    saved = [results[i] for i in sorted(output_paths) if results.get(i)]
+    failed = [i for i in sorted(output_paths) if not results.get(i) and i not in skipped]
+    print(f"\n{'='*60}")
+    print(f"🎬 Batch complete: {len(saved)}/{args.batch} saved in {time.monotonic() - start:.1f}s")
+    for path in saved:
+        print(f"   • {path}")
+    if failed:
+        print(f"   Failed variations: {', '.join(f'v{i}' for i in failed)}")
+    if skipped:
+        print(f"   Skipped after --max-duplicates: {', '.join(f'v{i}' for i in sorted(skipped))}")
+    if tracker is not None and tracker.duplicates:
+        print(f"   Near-duplicates: {', '.join(os.path.basename(path) for path, _, _ in tracker.duplicates)}")
+    if args.rank and saved:
+        rank_against_archive(saved, args.rank)
+    return [results.get(i) for i in sorted(output_paths)]
+
+
+def rank_against_archive(paths, archive):
+    """
+    Print outputs ordered by perceptual distance from their closest past thumbnail,
+    most novel first.
+    """
+    from phash_index import PHashIndex
+
+    if not os.path.isdir(archive):
+        print(f"⚠️  Archive folder not found: {archive}")
+        return []
+    index = PHashIndex(archive).refresh()
+    ranked = index.rank(paths)
+    print(f"\n🧭 Distance from {len(index.paths)} past thumbnail(s) (64 = unrelated, 0 = identical):")
+    for path, distance, nearest in ranked:
+        closest = f" (closest: {os.path.basename(nearest)})" if nearest else ""
+        print(f"   {'-' if distance is None else distance:>3}  {os.path.basename(path)}{closest}")
+    return ranked
+
+
+def drafts_manifest_path(output):
+    return f"{os.path.splitext(output)[0]}_drafts.json"
+
+
+def generate_drafts(args):
+    """
+    Preview tier: generate --drafts cheap 1K variations and record everything needed to
+    re-render one of them later with --finalize.
+    """
+    args.batch = args.drafts
+    args.resolution = '1K'
+    drafts = generate_batch(args)
+
+    references = args.references
+    if references is None or isinstance(references, str):
+        references = get_reference_images(references, prompt=args.prompt)
+    manifest_path = args.drafts_manifest or drafts_manifest_path(args.output)
+    with open(manifest_path, 'w') as f:
+        json.dump({
+            'prompt': args.prompt,
+            'references': [os.path.abspath(p) for p in references],
+            'style': os.path.abspath(args.style) if args.style else None,
+            'logos': [os.path.abspath(p) for p in args.logos] if args.logos else None,
+            'aspect_ratio': args.aspect_ratio,
+            'drafts': {str(i): os.path.abspath(p) for i, p in enumerate(drafts, 1) if p},
+        }, f, indent=2)
+
+    print(f"\n📝 Drafts recorded in {manifest_path}")
+    print("   Pick one and render it at full resolution with: --finalize N")
+    return drafts
+
+
+def finalize_draft(args):
+    """
+    Final tier: re-render the chosen draft at --resolution with the same prompt and references.
+    """
+    manifest_path = args.drafts_manifest or drafts_manifest_path(args.output)
+    if not os.path.exists(manifest_path):
+        print(f"❌ Drafts manifest not found: {manifest_path} (run with --drafts first)")
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    draft = manifest['drafts'].get(str(args.finalize))
+    if not draft or not os.path.exists(draft):
+        print(f"❌ Draft {args.finalize} not available. Choices: {', '.join(sorted(manifest['drafts'], key=int))}")
+        return None
+
+    base_name, ext = os.path.splitext(args.output)
+    print(f"\n🎯 Finalizing draft {args.finalize} at {args.resolution}: {os.path.basename(draft)}")
+    return generate_thumbnail(
+        prompt=manifest['prompt'],
+        reference_images=manifest['references'],
+        style_reference=manifest['style'],
+        logo_references=manifest['logos'],
+        output_path=f"{base_name}_final{ext or '.png'}",
+        aspect_ratio=manifest['aspect_ratio'],
+        resolution=args.resolution,
+        upload_references=args.upload_references,
+        draft_reference=draft,
+        composite_logos=args.composite_logos
+    )
+
+
+def session_turn(session, text=None):
+    """
+    Run one session turn (the opening generation when text is None, else an edit), save the
+    image and record it like any other output.
+
+    Returns:
+        The saved path, or None
+    """
+    settings = session.state['settings']
+    number = session.edits + 1 if text is not None else 0
+    base_name, ext = os.path.splitext(settings['output'])
+    path = settings['output'] if text is None else f"{base_name}_edit{number}{ext or '.png'}"
+    if text is None:
+        print("\n🎨 Generating thumbnail...")
+        print(f"   Prompt: '{session.state['opening']['text']}'")
+    else:
+        print(f"\n✏️  Edit {number}: '{text}'")
+
+    request_metrics = RequestMetrics('thumbnail-generator', job=path)
+    try:
+        stats = {}
+        try:
+            with request_metrics.stage('network'):
+                images, request_bytes = session.send(text, stats=stats)
+        finally:
+            request_metrics.add_stats(stats)
+        request_metrics.add('request_bytes', request_bytes)
+        if not images:
+            print("❌ No image generated in response")
+            return None
+
+        mime_type, image_data = images[0]
+        request_metrics.add('response_bytes', len(image_data))
+        with request_metrics.stage('save'):
+            if settings.get('composite_logos'):
+                logo_placements = logo_overlay.placements(settings.get('logos'))
+                if logo_placements:
+                    image_data = logo_overlay.composite(image_data, logo_placements)
+            save_image_bytes(image_data, path, mime_type)
+        session.add_output(path, text)
+        print(f"✅ Thumbnail saved: {path} ({request_bytes / 1024:.0f} KB sent)")
+
+        output_archive.record(
+            image_data, mime_type, path, script='thumbnail-generator', run_id=current_run_id(),
+            prompt=settings['prompt'] if text is None else text,
+            final_prompt=session.state['opening']['text'] if text is None else text,
+            references=settings.get('references'), style=settings.get('style'), logos=settings.get('logos'),
+            composite_logos=settings.get('composite_logos'), model=session.state['model'], aspect_ratio=session.state['aspect_ratio'],
+            resolution=session.state['resolution'],
+            variant=f"session:{os.path.splitext(os.path.basename(session.path))[0]}#{number}",
+            seconds=request_metrics.elapsed(), stages=dict(request_metrics.stages))
+        postprocess.submit(path)
+        request_metrics.add('images', 1)
+        request_metrics.ok = True
+        return path
+
+    except Exception as e:
+        print(f"❌ Error generating image: {e}")
+        return None
+    finally:
+        emit_metrics(request_metrics)
+
+
+def run_edit_session(args):
+    """
+    Multi-turn editing: start the session from the prompt (or resume it from disk), then apply
+    every --edit, or read edits interactively until an empty line.
+    """
+    if not os.getenv('GEMINI_API_KEY'):
+        print("❌ Error: GEMINI_API_KEY not found in .env file")
+        return None
+
+    path = session_path(args.session)
+    if os.path.exists(path):
+        session = EditSession.load(path)
+        latest = session.last_output()
+        print(f"\n💬 Resuming session {path}: {session.edits} edit(s) so far")
+        if latest:
+            print(f"   Latest image: {latest['path']}")
+        if args.prompt:
+            print("   ⚠️  Ignoring the prompt: this session already has one (refine it with --edit)")
+    else:
+        if not args.prompt:
+            print(f"❌ Session not found: {path} (give a prompt to start it)")
+            return None
+        logo_references = None if args.composite_logos else args.logos
+        try:
+            logo_placements = logo_overlay.placements(args.logos) if args.composite_logos else None
+            reference_images = get_reference_images(args.references, prompt=args.prompt)
+            image_paths = content_image_paths(reference_images, args.style, logo_references)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return None
+
+        print(f"\n💬 Starting session {path}")
+        print(f"   {len(image_paths)} reference image(s) uploaded once and sent as file handles")
+        session = EditSession.create(
+            path, build_prompt(args.prompt, args.style, logo_placements=logo_placements), image_paths,
+            DEFAULT_MODEL, aspect_ratio=args.aspect_ratio, resolution=args.resolution,
+            prompt=args.prompt, references=reference_images, style=args.style, logos=args.logos,
+            composite_logos=args.composite_logos, output=args.output)
+        if not session_turn(session):
+            return None
+
+    if args.edit:
+        for text in args.edit:
+            if not session_turn(session, text):
+                break
+    else:
+        print('\n💬 Type an edit and press Enter ("undo" reverts the last edit, an empty line quits)')
+        while True:
+            try:
+                text = input("✏️  > ").strip()
+            except EOFError:
+                print()
+                break
+            if not text:
+                break
+            if text.lower() == 'undo':
+                current = session.undo()
+                print(f"   ↩️  Back to {current['path']}" if current else "   Nothing to undo")
+                continue
+            session_turn(session, text)
+
+    latest = session.last_output()
+    print(f"\n💾 Session saved: {path}" + (f" (latest image: {latest['path']})" if latest else ''))
+    return latest['path'] if latest else None
+
+
+def run_sweep(args):
+    """
+    Prompt matrix sweep: expand the template into unique jobs ordered by shared payload,
+    preload each payload image once, run the jobs through the resumable job runner and
+    finish with a labelled contact sheet.
+    """
+    try:
+        template = sweep.load_template(args.sweep)
+        stem = os.path.splitext(args.sweep)[0]
+        jobs, cells = sweep.expand(template, output_dir=stem,
+                                   defaults={'aspect_ratio': args.aspect_ratio, 'resolution': args.resolution})
+    except (OSError, ValueError) as e:
+        print(f"❌ Invalid sweep template: {e}")
+        return None
+
+    groups = {sweep.payload_key(job) for job in jobs}
+    print(f"\n🧮 Sweep {args.sweep}: {len(cells)} combinations → {len(jobs)} unique job(s) "
+          f"in {len(groups)} payload group(s)")
+
+    jobs_path = f"{stem}.jobs.jsonl"
+    with open(jobs_path, 'w', encoding='utf-8') as f:
+        for job in jobs:
+            f.write(json.dumps(job) + '\n')
+
+    # Every distinct reference/style/logo image is prepared (and uploaded) once up front
+    load_image = load_uploaded_reference if args.upload_references else load_reference
+    try:
+        paths = []
+        for job in jobs:
+            paths.extend(content_image_paths(job.get('references'), job.get('style'),
+                                             None if args.composite_logos else job.get('logos'),
+                                             prompt=job['prompt']))
+        print(f"   ✓ {sweep.warm(paths, load_image, workers=args.concurrency)} payload image(s) ready")
+    except Exception as e:
+        print(f"❌ Could not load sweep images: {e}")
+        return None
+
+    manifest_path = args.manifest or f"{stem}.jobs.manifest.jsonl"
+    run_jobs(jobs_path, partial(generate_thumbnail, upload_references=args.upload_references,
+                                composite_logos=args.composite_logos),
+             manifest_path=manifest_path, concurrency=args.concurrency)
+
+    records = load_manifest(manifest_path)
+    outputs = {jid: record['output'] for jid, record in records.items() if record.get('status') == 'done'}
+    axes = list(template['axes'])
+    sheet_cells = [(outputs.get(jid), [' / '.join(labels[axis] for axis in axes)]) for labels, jid in cells]
+    sheet_path = args.sheet or f"{stem}_sheet.jpg"
+    # Cells take the jobs' aspect ratio; a sweep across ratios letterboxes into the CLI's
+    ratios = {job['aspect_ratio'] for job in jobs}
+    width, height = (int(side) for side in (ratios.pop() if len(ratios) == 1 else args.aspect_ratio).split(':'))
+    sweep.contact_sheet(sheet_cells, sheet_path, columns=len(template['axes'][axes[-1]]),
+                        title=f"{template['prompt']}   [{' x '.join(axes)}]", aspect_ratio=width / height)
+    print(f"\n🗂️  Contact sheet: {sheet_path} ({len(outputs)}/{len(jobs)} job(s) done)")
+    return sheet_path
+
+
+def handle_service_request(payload):
+    """
+    Service route for /thumbnail: accepts the same options as the CLI
+    (prompt, references, style, logos, output, aspect_ratio, resolution, batch, ...).
+    """
+    if not payload.get('prompt'):
+        raise ValueError("'prompt' is required")
+    references = payload.get('references')
+    # A per-request --reference-count is applied by picking the subset here
+    if payload.get('reference_count') and (references is None or isinstance(references, str)):
+        references = get_reference_images(references, prompt=payload['prompt'], count=int(payload['reference_count']))
+    args = argparse.Namespace(
+        prompt=payload['prompt'],
+        references=references,
+        style=payload.get('style'),
+        logos=payload.get('logos'),
+        output=payload.get('output', 'thumbnail.png'),
+        aspect_ratio=payload.get('aspect_ratio', '16:9'),
+        resolution=payload.get('resolution', '4K'),
+        batch=int(payload.get('batch', 1)),
+        concurrency=int(payload.get('concurrency', 4)),
+        upload_references=bool(payload.get('upload_references', False)),
+        composite_logos=bool(payload.get('composite_logos', False)),
+        dedup=bool(payload.get('dedup', False)),
+        dedup_threshold=int(payload.get('dedup_threshold', DEFAULT_DEDUP_THRESHOLD)),
+        max_duplicates=payload.get('max_duplicates'),
+        rank=payload.get('rank'),
+        cache_mode='off' if payload.get('no_cache') else 'refresh' if payload.get('force') else None,
+    )
+    if args.batch == 1:
+        output = generate_thumbnail(
+            prompt=args.prompt,
+            reference_images=args.references,
+            style_reference=args.style,
+            logo_references=args.logos,
+            output_path=args.output,
+            aspect_ratio=args.aspect_ratio,
+            resolution=args.resolution,
+            upload_references=args.upload_references,
+            composite_logos=args.composite_logos,
+            cache_mode=args.cache_mode
+        )
+        outputs = [output] if output else []
+    else:
+        outputs = [path for path in generate_batch(args) if path]
+
+    # The service's own --derive applies unless the request names its variants
+    derived = postprocess.derive_now(outputs, payload.get('derive'))
+    return {'outputs': outputs, 'derived': [path for paths in derived.values() for path in paths]}
+
+
+def run_service(host, port):
+    """
+    Warm-process mode: configure the client and decode the default references once,
+    then serve generation requests until interrupted.
+    """
+    if not os.getenv('GEMINI_API_KEY'):
+        print("❌ Error: GEMINI_API_KEY not found in .env file")
+        return
+
+    print("🔥 Warming up...")
+    get_model()
+    if os.path.isdir(DEFAULT_REFERENCE_FOLDER):
+        # Any of them may be picked for a prompt, so all are decoded and described up front
+        reference_paths = reference_selector.list_images(DEFAULT_REFERENCE_FOLDER)
+        for img_path in reference_paths:
+            load_reference(img_path)
+        reference_selector.descriptors(reference_paths)
+        print(f"   ✓ {len(reference_paths)} reference images preloaded")
+
+    serve({'/thumbnail': handle_service_request}, host=host, port=port)
+
+
+def forward_to_service(args):
+    """
+    Thin-client mode: send the parsed CLI arguments to a running --serve process.
+    Paths are made absolute because the service may run from another directory.
+    """
+    def absolute(path):
+        if isinstance(path, list):
+            return [os.path.abspath(p) for p in path]
+        return os.path.abspath(path) if path else path
+
+    payload = {
+        'prompt': args.prompt,
+        'references': absolute(args.references),
+        'style': absolute(args.style),
+        'logos': [absolute(p) for p in args.logos] if args.logos else None,
+        'output': absolute(args.output),
+        'aspect_ratio': args.aspect_ratio,
+        'resolution': args.resolution,
+        'batch': args.batch,
+        'concurrency': args.concurrency,
+        'upload_references': args.upload_references,
+        'composite_logos': args.composite_logos,
+        'dedup': args.dedup,
+        'dedup_threshold': args.dedup_threshold,
+        'max_duplicates': args.max_duplicates,
+        'rank': absolute(args.rank),
+        'force': args.force,
+        'no_cache': args.no_cache,
+        'reference_count': args.reference_count,
+        'derive': args.derive,
+    }
+    print(f"📡 Sending request to {args.server}...")
+    try:
+        result = call_service(args.server, '/thumbnail', payload)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return []
+    for path in result['outputs']:
+        print(f"✅ Thumbnail saved: {path}")
+    for path in result.get('derived', []):
+        print(f"   ✓ {path}")
+    if not result['outputs']:
+        print("❌ No image generated")
+    return result['outputs']
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Generate consistent YouTube thumbnails using your reference images",
@@ -196,6 +949,38 @@ Examples:
   # Generate multiple variations for A/B testing
   python thumbnail-generator.py "pointing at viewer surprised face" --batch 3
 
+  # Ten variations, five requests in flight at a time
+  python thumbnail-generator.py "pointing at viewer surprised face" --batch 10 --concurrency 5
+
+  # Run a JSONL job file in one process (re-run the same command to resume)
+  python thumbnail-generator.py --jobs jobs.jsonl --concurrency 4
+
+  # A/B matrix: expressions × backgrounds × styles × logo sets from one template, plus a contact sheet
+  python thumbnail-generator.py --sweep ab_test.json --concurrency 6
+
+  # Overnight campaign through the Batch API
+  python thumbnail-generator.py --submit-batch jobs.jsonl
+  python thumbnail-generator.py --collect-batch jobs.batch.json
+
+  # Ten cheap 1K drafts, then render draft 7 at 4K
+  python thumbnail-generator.py "shocked face, red background" --drafts 10
+  python thumbnail-generator.py --finalize 7
+
+  # Refine one thumbnail over several turns, sending only the edit text each time
+  python thumbnail-generator.py "shocked face, red background" --session launch
+  python thumbnail-generator.py --session launch --edit "make the background redder" --edit "move the text left"
+
+  # Logos composited locally (pixel-exact, not sent to the model)
+  python thumbnail-generator.py "shocked face" -l logos/n8nlogo.png -l "mcp@top-left" --composite-logos
+
+  # Find last month's shocked-face thumbnails with the n8n logo, then regenerate one
+  python thumbnail-generator.py --history "shocked n8n" --since 30
+  python thumbnail-generator.py --like 42 --batch 3
+
+  # Warm service (once), then thin-client calls that skip start-up costs
+  python thumbnail-generator.py --serve --port 8770
+  python thumbnail-generator.py "shocked face" --server http://127.0.0.1:8770
+
 TIPS FOR MAXIMUM CONSISTENCY:
   • Always use the default reference folder (don't use -r flag)
   • Use the SAME reference photos for all your thumbnails
@@ -221,19 +1006,198 @@ TIPS FOR MAXIMUM CONSISTENCY:
                        help='Resolution (default: 4K for maximum quality)')
     parser.add_argument('--batch', type=int, default=1,
                        help='Generate multiple variations (default: 1)')
+    parser.add_argument('--concurrency', type=int, default=4,
+                       help='Maximum number of --batch variations generated at once (default: 4)')
+    parser.add_argument('--reference-count', type=int, default=None, metavar='N',
+                       help=f'Reference photos picked per prompt from the reference folder '
+                            f'(default: {reference_selector.DEFAULT_COUNT})')
+    parser.add_argument('--upload-references', action='store_true',
+                       help='Upload reference/style/logo images once via the Files API and reuse the handles')
+    parser.add_argument('--dedup', action='store_true',
+                       help='Flag near-duplicate --batch variations as they arrive (perceptual hash, needs numpy)')
+    parser.add_argument('--dedup-threshold', type=int, default=DEFAULT_DEDUP_THRESHOLD, metavar='BITS',
+                       help=f'Hash bits (of 64) within which two variations count as duplicates (default: {DEFAULT_DEDUP_THRESHOLD})')
+    parser.add_argument('--max-duplicates', type=int, default=None, metavar='N',
+                       help='Stop the batch early once N near-duplicates have been generated (implies --dedup)')
+    parser.add_argument('--rank', nargs='?', const=DEFAULT_ARCHIVE_FOLDER, default=None, metavar='ARCHIVE',
+                       help=f'Rank --batch outputs by distance from past thumbnails (default folder: {DEFAULT_ARCHIVE_FOLDER})')
+    parser.add_argument('--composite-logos', action='store_true',
+                       help='Place -l logos locally after generation instead of sending them to the model '
+                            '(per-logo rules: -l "logos/mcp.png@top-left,0.2,0.03")')
+    parser.add_argument('--logo-anchor', default=None, choices=list(logo_overlay.ANCHORS),
+                       help=f"Default corner/edge for composited logos (default: {logo_overlay.DEFAULT_PLACEMENT['anchor']})")
+    parser.add_argument('--logo-size', type=float, default=None,
+                       help=f"Composited logo size as a fraction of image height (default: {logo_overlay.DEFAULT_PLACEMENT['size']})")
+    parser.add_argument('--logo-margin', type=float, default=None,
+                       help=f"Margin from the edge as a fraction of image height (default: {logo_overlay.DEFAULT_PLACEMENT['margin']})")
+    parser.add_argument('--jobs', default=None,
+                       help='Run every job in a JSONL file (one {"prompt": ..., "output": ...} per line)')
+    parser.add_argument('--manifest', default=None,
+                       help='Manifest used to resume --jobs runs (default: <jobs>.manifest.jsonl)')
+    parser.add_argument('--sweep', metavar='TEMPLATE', default=None,
+                       help='Generate every combination of a JSON prompt template\'s axes and a labelled contact sheet')
+    parser.add_argument('--sheet', default=None,
+                       help='Contact sheet path for --sweep (default: <template>_sheet.jpg)')
+    parser.add_argument('--submit-batch', metavar='JOBS', default=None,
+                       help='Submit every job in a JSONL file as one offline Batch API job')
+    parser.add_argument('--collect-batch', metavar='STATE', default=None,
+                       help='Wait for a submitted batch (its .batch.json state file) and save the results')
+    parser.add_argument('--poll-interval', type=float, default=30,
+                       help='Seconds between batch status checks (default: 30)')
+    parser.add_argument('--retries', type=int, default=3,
+                       help='Retries for rate-limit/transient errors, with exponential backoff (default: 3)')
+    parser.add_argument('--deadline', type=float, default=None,
+                       help='Give up on a request (including retries) after this many seconds')
+    parser.add_argument('--hedge-percentile', type=float, default=None, metavar='P',
+                       help='Fire a duplicate request when one runs slower than the P-th percentile '
+                            'latency seen so far, keeping whichever finishes first (e.g. 95)')
+    parser.add_argument('--rpm', type=float, default=None,
+                       help='Requests per minute allowed for this model across all processes (saved for later runs)')
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                       help='Maximum concurrent requests for this model across all processes (saved for later runs)')
+    parser.add_argument('--force', action='store_true',
+                       help='Regenerate even if an identical request is in the result cache (and refresh it)')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Neither read nor write the result cache')
+    parser.add_argument('--session', default=None, metavar='NAME',
+                       help='Start or resume a multi-turn edit session (stored in .cache/sessions/NAME.json, '
+                            'or a .json path); without --edit, edits are read interactively')
+    parser.add_argument('--edit', action='append', default=None, metavar='TEXT',
+                       help='Refine the session\'s latest image with this instruction (can be used multiple times; '
+                            'the session defaults to the --output name)')
+    parser.add_argument('--drafts', type=int, default=None, metavar='N',
+                       help='Generate N quick 1K drafts and record them for --finalize')
+    parser.add_argument('--finalize', type=int, default=None, metavar='INDEX',
+                       help='Re-render draft INDEX from the last --drafts run at --resolution')
+    parser.add_argument('--drafts-manifest', default=None,
+                       help='Drafts manifest to write/read (default: <output>_drafts.json)')
+    parser.add_argument('--serve', action='store_true',
+                       help='Run as a warm local service that keeps the client and references loaded')
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                       help=f'Service bind address (default: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                       help=f'Service port (default: {DEFAULT_PORT})')
+    parser.add_argument('--server', default=os.getenv('THUMBNAIL_SERVER'),
+                       help='Send the request to a running --serve process at this URL '
+                            '(default: $THUMBNAIL_SERVER)')
+    parser.add_argument('--derive', nargs='?', const=','.join(postprocess.DEFAULT_VARIANTS), default=None,
+                       metavar='VARIANTS',
+                       help='Also write upload-ready variants of every output, e.g. "youtube,shorts,webp,grid" or '
+                            '"name=WxH:FORMAT[:MAX_KB]" (default set: %(const)s)')
+    parser.add_argument('--derive-workers', type=int, default=None,
+                       help='Processes used for --derive (default: one per CPU)')
+    parser.add_argument('--metrics', default=os.getenv('THUMBNAIL_METRICS'), metavar='PATH',
+                       help='Record per-stage timings, payload bytes and retries for every request: '
+                            'JSON lines, or a Prometheus text file if PATH ends in .prom (default: $THUMBNAIL_METRICS)')
+    parser.add_argument('--run-id', default=None,
+                       help='Run id attached to every metrics record (default: $THUMBNAIL_RUN_ID or random)')
+    parser.add_argument('--history', nargs='?', const='', default=None, metavar='QUERY',
+                       help='Search archived outputs: every word must match the prompt, logos, style or path')
+    parser.add_argument('--since', type=float, default=None, metavar='DAYS',
+                       help='Only list --history entries from the last DAYS days')
+    parser.add_argument('--limit', type=int, default=20,
+                       help='Maximum --history entries (default: 20)')
+    parser.add_argument('--like', default=None, metavar='ID',
+                       help='Regenerate with the settings of an archived output (id or hash prefix from --history); '
+                            'a prompt given on the command line replaces the archived one')
+    parser.add_argument('--no-archive', action='store_true',
+                       help=f'Do not store outputs in the content-addressed archive ({output_archive.DEFAULT_ARCHIVE_DIR})')
     parser.add_argument('--setup', action='store_true',
                        help='Set up the reference folder for first-time use')
 
     args = parser.parse_args()
+    configure_executor(max_attempts=args.retries + 1, deadline=args.deadline,
+                       hedge_percentile=args.hedge_percentile)
+    configure_rate_limits(DEFAULT_MODEL, rpm=args.rpm, max_in_flight=args.max_in_flight)
+    configure_result_cache('off' if args.no_cache else 'refresh' if args.force else 'use')
+    configure_metrics(args.metrics, run_id=args.run_id)
+    try:
+        logo_overlay.configure(args.logo_anchor, args.logo_size, args.logo_margin)
+        # Composited logos are checked up front rather than failing every request
+        if args.composite_logos and not args.server:
+            logo_overlay.placements(args.logos)
+    except ValueError as e:
+        parser.error(str(e))
+    output_archive.configure(enabled=not args.no_archive)
+    try:
+        reference_selector.configure(count=args.reference_count)
+    except ValueError as e:
+        parser.error(f"--reference-count: {e}")
+
+    # Archive queries need no API access
+    if args.history is not None:
+        show_history(args.history, since_days=args.since, limit=args.limit)
+        return
+    if args.like and not apply_archived_settings(args, args.like):
+        return
 
     # Setup mode
     if args.setup:
         setup_reference_folder()
         return
 
-    # Require prompt if not in setup mode
+    # Post-processing overlaps with generation; the pool is drained before the process exits.
+    # With --serve the pool lives as long as the service and every request waits for its own
+    # variants (the service's --derive unless the request names some)
+    if args.derive or args.serve:
+        try:
+            postprocess.configure(args.derive, workers=args.derive_workers, serve=args.serve)
+        except ValueError as e:
+            parser.error(f"--derive: {e}")
+
+    # Service mode
+    if args.serve:
+        run_service(args.host, args.port)
+        return
+
+    # Bulk mode: every job runs in this process, reusing the loaded client and references
+    if args.jobs:
+        run_jobs(args.jobs, partial(generate_thumbnail, upload_references=args.upload_references,
+                                    composite_logos=args.composite_logos),
+                 manifest_path=args.manifest, concurrency=args.concurrency)
+        return
+
+    # A/B matrix: the cross product of a template's axes as one resumable job run
+    if args.sweep:
+        run_sweep(args)
+        return
+
+    # Offline batch mode: higher throughput per dollar, results within 24h
+    if args.submit_batch:
+        submit_jobs(args.submit_batch, lambda job: build_content_parts(
+            job['prompt'], job.get('references'), job.get('style'), job.get('logos'),
+            upload_references=args.upload_references), DEFAULT_MODEL)
+        return
+    if args.collect_batch:
+        collect_jobs(args.collect_batch, poll_interval=args.poll_interval)
+        return
+
+    # Final tier of the preview pipeline: prompt and references come from the drafts manifest
+    if args.finalize is not None:
+        finalize_draft(args)
+        return
+
+    # Multi-turn editing: earlier turns stay in the session, each refinement adds only its text
+    if args.session or args.edit:
+        args.session = args.session or os.path.splitext(os.path.basename(args.output))[0]
+        run_edit_session(args)
+        return
+
+    # Require prompt if not in setup, jobs, batch or finalize mode
     if not args.prompt:
-        parser.error("the following arguments are required: prompt (or use --setup)")
+        parser.error("the following arguments are required: prompt (or use --setup / --jobs / --submit-batch)")
+
+    # Thin-client mode: the warm service does the work. Drafts stay local because
+    # --finalize reads their manifest from this machine
+    if args.server and args.drafts:
+        print(f"⚠️  --drafts runs in this process; not forwarding to {args.server}")
+    elif args.server:
+        unsupported = [flag for dest, flag in SERVICE_UNSUPPORTED if getattr(args, dest)]
+        if unsupported:
+            parser.error(f"{', '.join(unsupported)} cannot be applied by the service at {args.server} "
+                         f"(--server / $THUMBNAIL_SERVER); run without it")
+        forward_to_service(args)
+        return
 
     # Check if reference folder exists
     if args.references is None and not os.path.exists(DEFAULT_REFERENCE_FOLDER):
@@ -243,7 +1207,9 @@ TIPS FOR MAXIMUM CONSISTENCY:
         return
 
     # Generate thumbnails
-    if args.batch == 1:
+    if args.drafts:
+        generate_drafts(args)
+    elif args.batch == 1:
         generate_thumbnail(
             prompt=args.prompt,
             reference_images=args.references,
@@ -251,28 +1217,16 @@ TIPS FOR MAXIMUM CONSISTENCY:
             logo_references=args.logos,
             output_path=args.output,
             aspect_ratio=args.aspect_ratio,
-            resolution=args.resolution
+            resolution=args.resolution,
+            upload_references=args.upload_references,
+            composite_logos=args.composite_logos
         )
     else:
-        # Generate multiple variations
-        base_name = os.path.splitext(args.output)[0]
-        ext = os.path.splitext(args.output)[1] or '.png'
-
-        for i in range(args.batch):
-            output_path = f"{base_name}_v{i+1}{ext}"
-            print(f"\n{'='*60}")
-            print(f"🎬 Generating variation {i+1}/{args.batch}")
-            print(f"{'='*60}")
-            generate_thumbnail(
-                prompt=args.prompt,
-                reference_images=args.references,
-                style_reference=args.style,
-                logo_references=args.logos,
-                output_path=output_path,
-                aspect_ratio=args.aspect_ratio,
-                resolution=args.resolution
-            )
+        generate_batch(args)
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        postprocess.finish()
@@ -0,0 +1,93 @@
+"""
+Warm-process service helpers
+A long-running local HTTP server keeps the configured client and decoded references in
+memory, and the CLIs forward requests to it instead of paying start-up cost every call
+"""
+
+import json
+import traceback
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8770
+
+
+def serve(routes, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    Serve JSON POST routes until interrupted.
+
+    Args:
+        routes: {path: handler} where handler(payload_dict) returns a JSON-serialisable dict
+        host: Bind address (keep on localhost; there is no authentication)
+        port: TCP port
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                return self._send(200, {'status': 'ok', 'routes': sorted(routes)})
+            self._send(404, {'error': f"unknown path {self.path}"})
+
+        def do_POST(self):
+            handler = routes.get(self.path)
+            if handler is None:
+                return self._send(404, {'error': f"unknown path {self.path}"})
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+                payload = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError as e:
+                return self._send(400, {'error': f"invalid JSON: {e}"})
+            try:
+                self._send(200, handler(payload))
+            except Exception as e:
+                traceback.print_exc()
+                self._send(500, {'error': str(e)})
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    print(f"🚀 Serving {', '.join(sorted(routes))} on http://{host}:{port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Shutting down")
+    finally:
+        server.server_close()
+
+
+def call_service(url, route, payload, timeout=600):
+    """
+    POST a payload to a running service and return its JSON reply.
+    Raises RuntimeError if the service is unreachable or reports an error.
+    """
+    req = urllib.request.Request(
+        f"{url.rstrip('/')}{route}",
+        data=json.dumps(payload).encode('utf-8'),
+        method='POST',
+        headers={'Content-Type': 'application/json'},
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read())['error']
+        except (ValueError, KeyError):
+            message = e.reason
+        raise RuntimeError(f"service error: {message}") from None
+    except urllib.error.URLError as e:
+        raise RuntimeError(f"cannot reach service at {url}: {e.reason}") from None
+
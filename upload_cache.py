@@ -0,0 +1,149 @@
+"""
+Files API handle cache
+Uploads each preprocessed reference image once and reuses the returned file handle until
+it expires, so requests reference the file URI instead of re-sending the image bytes.
+Handles are cached per endpoint and API key, and a handle the API no longer knows is
+dropped and uploaded again
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+from gemini_rest import GeminiAPIError, api_base, upload_file
+from image_io import CACHE_DIR, atomic_write
+from reference_cache import load_reference
+
+# Shared by thumbnail-generator.py and image-to-image.py
+DEFAULT_UPLOAD_INDEX = os.path.join(CACHE_DIR, 'uploads.json')
+
+# Re-upload handles that expire within this margin so they cannot lapse mid-request
+EXPIRY_MARGIN_SECONDS = 3600
+
+_lock = threading.Lock()
+
+
+def _parse_time(value):
+    """
+    Parse an RFC 3339 timestamp such as "2025-01-01T12:00:00.123456Z" to epoch seconds.
+    """
+    value = value.rstrip('Z')
+    if '.' in value:
+        head, fraction = value.split('.', 1)
+        value = f"{head}.{fraction[:6]}"
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
+
+
+def _load_index(index_path):
+    try:
+        with open(index_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_index(index_path, index):
+    atomic_write(index_path, json.dumps(index, indent=2).encode('utf-8'))
+
+
+def _cache_key(data):
+    # Handles are only valid against the endpoint, and the project (API key), that issued them
+    api_key = hashlib.sha256(os.getenv('GEMINI_API_KEY', '').encode('utf-8')).hexdigest()[:16]
+    return f"{api_base()}|{api_key}|{hashlib.sha256(data).hexdigest()}"
+
+
+def upload_blob(blob, display_name=None, index_path=None):
+    """
+    Return a {'file_data': {'mime_type', 'file_uri'}} part for an image blob, uploading
+    it through the Files API only if no unexpired handle exists for identical bytes.
+    """
+    index_path = index_path or DEFAULT_UPLOAD_INDEX
+    key = _cache_key(blob['data'])
+    now = datetime.now(timezone.utc).timestamp()
+
+    with _lock:
+        entry = _load_index(index_path).get(key)
+    if entry and entry['expires_at'] - EXPIRY_MARGIN_SECONDS > now:
+        return {'file_data': {'mime_type': entry['mime_type'], 'file_uri': entry['uri']}}
+
+    resource = upload_file(blob['data'], blob['mime_type'], display_name=display_name)
+    entry = {
+        'name': resource['name'],
+        'uri': resource['uri'],
+        'mime_type': resource.get('mimeType', blob['mime_type']),
+        'expires_at': _parse_time(resource['expirationTime']),
+        'display_name': display_name,
+    }
+
+    with _lock:
+        index = _load_index(index_path)
+        index[key] = entry
+        # Drop expired handles while we are here
+        index = {k: v for k, v in index.items() if v['expires_at'] > now}
+        _save_index(index_path, index)
+
+    return {'file_data': {'mime_type': entry['mime_type'], 'file_uri': entry['uri']}}
+
+
+def file_uris(request):
+    """
+    URIs of the upload handles in a list of content parts or a REST GenerateContentRequest.
+    """
+    parts = request
+    if isinstance(request, dict):
+        parts = [part for content in request.get('contents', []) for part in content.get('parts', [])]
+    uris = []
+    for part in parts:
+        handle = isinstance(part, dict) and (part.get('file_data') or part.get('fileData'))
+        if handle:
+            uris.append(handle.get('file_uri') or handle.get('fileUri'))
+    return uris
+
+
+def is_missing_file_error(error):
+    """
+    True when the API refuses a request because a file it names was deleted or belongs to
+    another project (403 PERMISSION_DENIED or 404 NOT_FOUND about the file).
+    """
+    status = error.status if isinstance(error, GeminiAPIError) else getattr(error, 'code', None)
+    return status in (403, 404) and 'file' in str(error).lower()
+
+
+def evict(uris, index_path=None):
+    """
+    Forget the cached handles for uris so their images are uploaded again on next use.
+    """
+    index_path = index_path or DEFAULT_UPLOAD_INDEX
+    uris = set(uris)
+    with _lock:
+        index = _load_index(index_path)
+        kept = {k: v for k, v in index.items() if v['uri'] not in uris}
+        if len(kept) != len(index):
+            _save_index(index_path, kept)
+
+
+def send_with_fresh_uploads(send, request, rebuild, index_path=None):
+    """
+    Return send(request). If the API answers that an uploaded file in the request is gone
+    (deleted before it expired, or issued to another key), the request's handles are evicted
+    and send(rebuild()) is tried once, uploading the images again.
+    """
+    try:
+        return send(request)
+    except Exception as e:
+        uris = file_uris(request)
+        if not uris or not is_missing_file_error(e):
+            raise
+        print(f"   ♻️  Uploaded file no longer available ({e}); uploading again")
+        evict(uris, index_path)
+        return send(rebuild())
+
+
+def load_uploaded_reference(path, index_path=None, data=None):
+    """
+    Preprocess an image through the reference cache and return its Files API handle part.
+    """
+    return upload_blob(load_reference(path, data=data), display_name=os.path.basename(path),
+                       index_path=index_path)